@@ -7,92 +7,18 @@ $(document).ready(function() {
     // 初始化弹出框
     $('[data-bs-toggle="popover"]').popover();
     
-    // 帖子点赞功能
-    $('.like-btn').click(function() {
-        var postId = $(this).data('post-id');
-        var button = $(this);
-        var likeCount = button.find('.like-count');
-        
-        // 显示加载状态
-        var originalHtml = button.html();
-        button.html('<div class="loading"></div>');
-        button.prop('disabled', true);
-        
-        $.ajax({
-            url: '/post/' + postId + '/like/',
-            type: 'POST',
-            data: {
-                'csrfmiddlewaretoken': getCSRFToken()
-            },
-            success: function(data) {
-                likeCount.text(data.like_count);
-                if (data.liked) {
-                    button.removeClass('btn-outline-danger').addClass('btn-danger');
-                } else {
-                    button.removeClass('btn-danger').addClass('btn-outline-danger');
-                }
-                
-                // 添加动画效果
-                button.addClass('animate__animated animate__pulse');
-                setTimeout(function() {
-                    button.removeClass('animate__animated animate__pulse');
-                }, 1000);
-            },
-            error: function(xhr, status, error) {
-                console.error('点赞失败:', error);
-                showAlert('点赞失败，请重试', 'danger');
-            },
-            complete: function() {
-                button.html(originalHtml);
-                button.prop('disabled', false);
-            }
-        });
+    // 帖子点赞功能（事件委托，实时插入的内容同样生效）
+    $(document).on('click', '.like-btn', function() {
+        toggleLike($(this), '/post/' + $(this).data('post-id') + '/like/');
     });
     
     // 评论点赞功能
-    $('.like-comment-btn').click(function() {
-        var commentId = $(this).data('comment-id');
-        var button = $(this);
-        var likeCount = button.find('.like-count');
-        
-        // 显示加载状态
-        var originalHtml = button.html();
-        button.html('<div class="loading"></div>');
-        button.prop('disabled', true);
-        
-        $.ajax({
-            url: '/comment/' + commentId + '/like/',
-            type: 'POST',
-            data: {
-                'csrfmiddlewaretoken': getCSRFToken()
-            },
-            success: function(data) {
-                likeCount.text(data.like_count);
-                if (data.liked) {
-                    button.removeClass('btn-outline-danger').addClass('btn-danger');
-                } else {
-                    button.removeClass('btn-danger').addClass('btn-outline-danger');
-                }
-                
-                // 添加动画效果
-                button.addClass('animate__animated animate__pulse');
-                setTimeout(function() {
-                    button.removeClass('animate__animated animate__pulse');
-                }, 1000);
-            },
-            error: function(xhr, status, error) {
-                console.error('点赞失败:', error);
-                showAlert('点赞失败，请重试', 'danger');
-            },
-            complete: function() {
-                button.html(originalHtml);
-                button.prop('disabled', false);
-            }
-        });
+    $(document).on('click', '.like-comment-btn', function() {
+        toggleLike($(this), '/comment/' + $(this).data('comment-id') + '/like/');
     });
     
     // 回复评论功能
-    $('.reply-btn').click(function() {
+    $(document).on('click', '.reply-btn', function() {
         var commentId = $(this).data('comment-id');
         var commentElement = $('#comment-' + commentId);
         var replyForm = commentElement.find('.reply-form');
@@ -115,26 +41,61 @@ $(document).ready(function() {
             `;
             
             commentElement.append(formHtml);
-            
-            // 绑定取消回复事件
-            $('.cancel-reply').click(function() {
-                $(this).closest('.reply-form').remove();
-            });
-            
-            // 绑定回复表单提交事件
-            $('.reply-comment-form').submit(function(e) {
-                e.preventDefault();
-                var form = $(this);
-                var content = form.find('textarea[name="content"]').val();
-                var parentId = form.find('input[name="parent_id"]').val();
-                
-                if (content.trim()) {
-                    submitReply(form, content, parentId);
-                }
-            });
         }
     });
     
+    // 取消回复
+    $(document).on('click', '.cancel-reply', function() {
+        $(this).closest('.reply-form').remove();
+    });
+    
+    // 提交回复
+    $(document).on('submit', '.reply-comment-form', function(e) {
+        e.preventDefault();
+        var form = $(this);
+        var content = form.find('textarea[name="content"]').val();
+        var parentId = form.find('input[name="parent_id"]').val();
+        
+        if (content.trim()) {
+            submitReply(form, content, parentId);
+        }
+    });
+    
+    // 发表评论：提交后直接插入页面，不再整页刷新
+    $('#comment-form').submit(function(e) {
+        e.preventDefault();
+        var form = $(this);
+        var textarea = form.find('textarea[name="content"]');
+        if (!textarea.val().trim()) {
+            return;
+        }
+        var button = form.find('button[type="submit"]').prop('disabled', true);
+        
+        $.ajax({
+            url: form.attr('action'),
+            type: 'POST',
+            data: form.serialize(),
+            success: function(data) {
+                textarea.val('');
+                updateLiveCounts({'comment_count': data.comment_count});
+                if (!insertComment(data.comment)) {
+                    // 不在最后一页时新楼层不在当前页显示
+                    showAlert('评论成功', 'success');
+                }
+            },
+            error: function(xhr, status, error) {
+                console.error('评论失败:', error);
+                showAlert(errorMessage(xhr, '评论失败，请重试'), 'danger');
+            },
+            complete: function() {
+                button.prop('disabled', false);
+            }
+        });
+    });
+    
+    // 帖子详情页订阅实时更新
+    initLiveUpdates();
+    
     // 搜索功能
     $('#search-form').submit(function(e) {
         e.preventDefault();
@@ -204,6 +165,46 @@ function showAlert(message, type) {
     }, 5000);
 }
 
+// 服务端返回的错误信息（如限流时的"操作太频繁"），没有时用默认提示
+function errorMessage(xhr, fallback) {
+    return (xhr.responseJSON && xhr.responseJSON.error) || fallback;
+}
+
+// 切换点赞状态，按钮上的计数以服务端返回为准
+function toggleLike(button, url) {
+    var likeCount = button.find('.like-count');
+    button.prop('disabled', true);
+    
+    $.ajax({
+        url: url,
+        type: 'POST',
+        data: {
+            'csrfmiddlewaretoken': getCSRFToken()
+        },
+        success: function(data) {
+            likeCount.text(data.like_count);
+            if (data.liked) {
+                button.removeClass('btn-outline-danger').addClass('btn-danger');
+            } else {
+                button.removeClass('btn-danger').addClass('btn-outline-danger');
+            }
+            
+            // 添加动画效果
+            button.addClass('animate__animated animate__pulse');
+            setTimeout(function() {
+                button.removeClass('animate__animated animate__pulse');
+            }, 1000);
+        },
+        error: function(xhr, status, error) {
+            console.error('点赞失败:', error);
+            showAlert(errorMessage(xhr, '点赞失败，请重试'), 'danger');
+        },
+        complete: function() {
+            button.prop('disabled', false);
+        }
+    });
+}
+
 // 提交回复
 function submitReply(form, content, parentId) {
     var postId = window.location.pathname.split('/')[2]; // 从URL获取帖子ID
@@ -219,16 +220,144 @@ function submitReply(form, content, parentId) {
         success: function(data) {
             form.closest('.reply-form').remove();
             showAlert('回复成功', 'success');
-            // 刷新页面或动态添加评论
-            location.reload();
+            // 直接插入新回复，其他读者通过实时更新收到
+            insertComment(data.comment);
+            updateLiveCounts({'comment_count': data.comment_count});
         },
         error: function(xhr, status, error) {
             console.error('回复失败:', error);
-            showAlert('回复失败，请重试', 'danger');
+            showAlert(errorMessage(xhr, '回复失败，请重试'), 'danger');
         }
     });
 }
 
+// 按评论数据构造一条评论，结构与 comment_item.html 一致
+function buildCommentItem(comment) {
+    var item = $('<div class="comment-item mb-3 pb-3 border-bottom"></div>').attr('id', 'comment-' + comment.id);
+    var header = $('<div class="d-flex justify-content-between align-items-start mb-2"></div>');
+    var meta = $('<div></div>');
+    meta.append($('<strong></strong>').append($('<a></a>').attr('href', comment.author_url).text(comment.author)));
+    meta.append($('<small class="text-muted ms-2"></small>').text(comment.created_at));
+    header.append(meta);
+    
+    // 自己的评论显示删除按钮
+    if (comment.author === $('#live-post').attr('data-username')) {
+        var form = $('<form method="post" class="d-inline"></form>').attr('action', '/comment/' + comment.id + '/delete/');
+        form.append($('<input type="hidden" name="csrfmiddlewaretoken">').val(getCSRFToken()));
+        form.append($('<button type="submit" class="btn btn-sm btn-outline-danger">删除</button>').click(function() {
+            return confirm('确定删除这条评论吗？');
+        }));
+        header.append(form);
+    }
+    item.append(header);
+    
+    item.append($('<p class="mb-2" style="white-space: pre-line;"></p>').text(comment.content));
+    
+    var actions = $('<div class="comment-actions"></div>');
+    actions.append(
+        $('<button class="btn btn-sm btn-outline-danger like-comment-btn"></button>')
+            .attr('data-comment-id', comment.id)
+            .append('<i class="fas fa-heart"></i> ', $('<span class="like-count"></span>').text(comment.like_count))
+    );
+    actions.append($('<button class="btn btn-sm btn-outline-secondary ms-2 reply-btn">回复</button>').attr('data-comment-id', comment.id));
+    item.append(actions);
+    return item;
+}
+
+// 把新评论插入页面，已存在或不属于当前页时返回 false
+function insertComment(comment) {
+    if (!comment || $('#comment-' + comment.id).length) {
+        return false;
+    }
+    
+    // 楼中楼回复追加到所属楼层（楼层不在当前页时忽略）
+    if (comment.root_id) {
+        var replies = $('#replies-' + comment.root_id);
+        replies.append(buildCommentItem(comment));
+        return replies.length > 0;
+    }
+    
+    // 新楼层只追加到最后一页
+    if ($('#live-post').attr('data-append-comments') !== '1') {
+        return false;
+    }
+    $('#no-comments').remove();
+    $('#comment-list').append(
+        buildCommentItem(comment),
+        $('<div class="comment-replies ms-4"></div>').attr('id', 'replies-' + comment.id)
+    );
+    return true;
+}
+
+// 更新页面上带 data-live-count 的计数
+function updateLiveCounts(counts) {
+    $.each(counts, function(name, value) {
+        $('[data-live-count="' + name + '"]').text(value);
+    });
+}
+
+// 订阅帖子的实时事件：优先使用 EventSource（SSE），不支持时定时轮询
+function initLiveUpdates() {
+    var livePost = $('#live-post');
+    if (!livePost.length) {
+        return;
+    }
+    var url = livePost.data('events-url');
+    var cursor = Number(livePost.attr('data-cursor')) || 0;
+    
+    var handlers = {
+        'comment': insertComment,
+        'comment_removed': function(data) {
+            $('#comment-' + data.id + ', #replies-' + data.id).remove();
+            $('.load-replies-btn[data-comment-id="' + data.id + '"]').remove();
+        },
+        'counts': updateLiveCounts,
+        'comment_counts': function(data) {
+            $('#comment-' + data.id).find('.like-count').first().text(data.like_count);
+        },
+        'post_removed': function() {
+            showAlert('该帖子已被删除', 'warning');
+        },
+        'reset': function() {
+            // 断线期间错过的事件已无法补发
+            showAlert('有新的内容，<a href="">刷新页面</a>查看', 'info');
+        }
+    };
+    
+    function dispatch(type, data, id) {
+        if (id) {
+            cursor = Math.max(cursor, id);
+        }
+        handlers[type](data);
+    }
+    
+    if (window.EventSource) {
+        // 断线后浏览器自动重连，并通过 Last-Event-ID 请求补发错过的事件
+        var source = new EventSource(url + '?after=' + cursor);
+        $.each(handlers, function(type) {
+            source.addEventListener(type, function(e) {
+                dispatch(type, JSON.parse(e.data), Number(e.lastEventId));
+            });
+        });
+        return;
+    }
+    
+    (function poll() {
+        $.getJSON(url, {'format': 'json', 'after': cursor}, function(data) {
+            $.each(data.events, function(i, event) {
+                dispatch(event.event, event.data, event.id);
+            });
+            cursor = data.last_id;
+            setTimeout(poll, data.retry * 1000);
+        }).fail(function(xhr) {
+            // 帖子已删除时停止轮询
+            if (xhr.status !== 404) {
+                setTimeout(poll, 30000);
+            }
+        });
+    })();
+}
+
 // 图片预览功能
 function previewImage(input, previewId) {
     if (input.files && input.files[0]) {
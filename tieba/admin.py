@@ -1,40 +1,218 @@
-from django.contrib import admin
-from .models import Category, Post, Comment, UserProfile, Like
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.http import urlencode
+from .models import (
+    ArchivedComment, ArchivedPost, Category, Post, Comment, UserProfile, Like, Favorite, Job, Tag,
+)
+from .pagination import EstimatedCountPaginator
+from . import archive, jobs, moderation
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """大表的后台列表：估算总数，不再额外统计全表行数
+
+    外键在编辑页用输入 id 的方式选择，避免把整张用户表、帖子表渲染成下拉框；
+    列表页需要的关联对象由各子类的 list_select_related 一次取回。
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'description', 'created_at']
+    list_display = ['name', 'description', 'follower_count', 'created_at']
     search_fields = ['name']
     list_filter = ['created_at']
+    readonly_fields = ['follower_count']
+
+
+class ArchiveSearchMixin:
+    """检索帖子/评论时提示归档表中的匹配数，并链接到归档列表"""
+    archive_model = None
+
+    def changelist_view(self, request, extra_context=None):
+        query = request.GET.get('q', '').strip()
+        if query and request.method == 'GET':
+            archive_admin = self.admin_site._registry[self.archive_model]
+            count = archive.search_count(self.archive_model, query, archive_admin.search_fields)
+            if count:
+                opts = self.archive_model._meta
+                url = reverse(f'admin:{opts.app_label}_{opts.model_name}_changelist') + '?' + urlencode({'q': query})
+                self.message_user(request, format_html(
+                    '归档中还有 {} 条匹配"{}"的{}，<a href="{}">查看归档</a>',
+                    f'{count}+' if count >= 1000 else count, query, opts.verbose_name, url,
+                ), level=messages.INFO)
+        return super().changelist_view(request, extra_context)
+
+
+class PostActionForm(ActionForm):
+    category = forms.ModelChoiceField(Category.objects.all(), required=False, label='目标分类')
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(ArchiveSearchMixin, ScalableAdmin):
+    archive_model = ArchivedPost
     list_display = ['title', 'author', 'category', 'created_at', 'view_count', 'like_count', 'is_pinned', 'is_active']
+    list_select_related = ['author', 'category']
     search_fields = ['title', 'content']
     list_filter = ['category', 'created_at', 'is_pinned', 'is_active']
-    date_hierarchy = 'created_at'
     readonly_fields = ['view_count', 'like_count']
+    raw_id_fields = ['author']
+    action_form = PostActionForm
+    actions = ['soft_delete', 'restore', 'pin', 'unpin', 'move_to_category']
+
+    @admin.action(description='删除所选帖子（软删除）')
+    def soft_delete(self, request, queryset):
+        count = moderation.set_posts_active(queryset, False)
+        self.message_user(request, f'已删除 {count} 个帖子')
+
+    @admin.action(description='恢复所选帖子')
+    def restore(self, request, queryset):
+        count = moderation.set_posts_active(queryset, True)
+        self.message_user(request, f'已恢复 {count} 个帖子')
+
+    @admin.action(description='置顶所选帖子')
+    def pin(self, request, queryset):
+        count = moderation.set_posts_pinned(queryset, True)
+        self.message_user(request, f'已置顶 {count} 个帖子')
+
+    @admin.action(description='取消置顶所选帖子')
+    def unpin(self, request, queryset):
+        count = moderation.set_posts_pinned(queryset, False)
+        self.message_user(request, f'已取消置顶 {count} 个帖子')
+
+    @admin.action(description='移动所选帖子到目标分类')
+    def move_to_category(self, request, queryset):
+        # 操作表单的 action 选项由后台动态填充，这里只校验分类字段
+        try:
+            category = self.action_form.base_fields['category'].clean(request.POST.get('category'))
+        except forms.ValidationError:
+            category = None
+        if category is None:
+            self.message_user(request, '请先选择目标分类', level=messages.WARNING)
+            return
+        count = moderation.move_posts(queryset, category)
+        self.message_user(request, f'已将 {count} 个帖子移动到"{category.name}"')
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(ArchiveSearchMixin, ScalableAdmin):
+    archive_model = ArchivedComment
     list_display = ['author', 'post', 'content', 'created_at', 'like_count', 'is_active']
+    list_select_related = ['author', 'post']
     search_fields = ['content']
     list_filter = ['created_at', 'is_active']
-    date_hierarchy = 'created_at'
+    raw_id_fields = ['author', 'post', 'parent', 'root']
+    actions = ['soft_delete', 'restore']
+
+    @admin.action(description='删除所选评论（软删除）')
+    def soft_delete(self, request, queryset):
+        count = moderation.set_comments_active(queryset, False)
+        self.message_user(request, f'已删除 {count} 条评论')
+
+    @admin.action(description='恢复所选评论')
+    def restore(self, request, queryset):
+        count = moderation.set_comments_active(queryset, True)
+        self.message_user(request, f'已恢复 {count} 条评论')
+
+
+class ArchiveAdmin(ScalableAdmin):
+    """归档表只读，只能恢复"""
+    list_select_related = ['author']
+    raw_id_fields = ['author']
+    actions = ['restore']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedPost)
+class ArchivedPostAdmin(ArchiveAdmin):
+    list_display = ['id', 'title', 'author', 'deleted_at', 'archived_at']
+    search_fields = ['title', 'content', 'author__username']
+    list_filter = ['archived_at']
+
+    @admin.action(description='恢复所选帖子（连同评论、点赞、收藏）')
+    def restore(self, request, queryset):
+        count = archive.restore_posts(list(queryset.values_list('id', flat=True)))
+        self.message_user(request, f'已恢复 {count} 个帖子')
+
+
+@admin.register(ArchivedComment)
+class ArchivedCommentAdmin(ArchiveAdmin):
+    list_display = ['id', 'author', 'post_id', 'content', 'deleted_at', 'archived_at']
+    search_fields = ['content', 'author__username']
+    list_filter = ['archived_at']
+
+    @admin.action(description='恢复所选评论')
+    def restore(self, request, queryset):
+        requested = list(queryset.values_list('id', flat=True))
+        count = archive.restore_comments(requested)
+        self.message_user(request, f'已恢复 {count} 条评论')
+        if count < len(requested):
+            self.message_user(request, '所在帖子已归档的评论需要随帖子一起恢复', level=messages.WARNING)
 
 
 @admin.register(UserProfile)
-class UserProfileAdmin(admin.ModelAdmin):
-    list_display = ['user', 'location', 'join_date', 'post_count', 'comment_count']
+class UserProfileAdmin(ScalableAdmin):
+    list_display = ['user', 'location', 'join_date', 'post_count', 'comment_count', 'follower_count']
+    list_select_related = ['user']
     search_fields = ['user__username', 'location']
     list_filter = ['join_date']
+    raw_id_fields = ['user']
 
 
 @admin.register(Like)
-class LikeAdmin(admin.ModelAdmin):
+class LikeAdmin(ScalableAdmin):
     list_display = ['user', 'post', 'comment', 'created_at']
+    list_select_related = ['user', 'post', 'comment__author']
     list_filter = ['created_at']
-    date_hierarchy = 'created_at'
\ No newline at end of file
+    raw_id_fields = ['user', 'post', 'comment']
+
+
+@admin.register(Favorite)
+class FavoriteAdmin(ScalableAdmin):
+    list_display = ['user', 'post', 'created_at']
+    list_select_related = ['user', 'post']
+    list_filter = ['created_at']
+    raw_id_fields = ['user', 'post']
+
+
+@admin.register(Tag)
+class TagAdmin(ScalableAdmin):
+    list_display = ['name', 'post_count', 'created_at']
+    search_fields = ['name']
+    readonly_fields = ['post_count']
+    ordering = ['-post_count']
+
+
+@admin.register(Job)
+class JobAdmin(ScalableAdmin):
+    list_display = ['id', 'name', 'status', 'priority', 'run_at', 'attempts', 'max_attempts', 'locked_by', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['dedupe_key']
+    readonly_fields = ['attempts', 'locked_by', 'locked_until', 'created_at', 'started_at', 'finished_at', 'last_error']
+    actions = ['retry']
+
+    def changelist_view(self, request, extra_context=None):
+        # 列表页顶部显示各任务的积压数和耗时
+        for row in jobs.stats() if request.method == 'GET' else ():
+            self.message_user(
+                request,
+                f"{row['name']}：待执行 {row['ready']}，未到期 {row['scheduled']}，执行中 {row['running']}，"
+                f"失败 {row['failed']}，最久等待 {row['oldest_wait']:.0f} 秒；最近一小时完成 {row['done']}，"
+                f"平均等待 {row['avg_wait']:.2f} 秒，平均执行 {row['avg_run']:.3f} 秒",
+                level=messages.INFO,
+            )
+        return super().changelist_view(request, extra_context)
+
+    @admin.action(description='重新执行所选的失败任务')
+    def retry(self, request, queryset):
+        count = jobs.retry(queryset)
+        self.message_user(request, f'已将 {count} 个任务重新排队')
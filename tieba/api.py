@@ -0,0 +1,346 @@
+"""只读 JSON API
+
+供移动端和边缘缓存使用，不必再抓取整页 HTML：
+
+- ``api/posts/``：帖子列表，支持 sort、category、author 筛选和游标分页
+- ``api/posts/<id>/``：帖子详情
+- ``api/posts/<id>/comments/``：楼层及每层的前几条回复
+- ``api/comments/<id>/replies/``：继续加载某楼层的回复
+- ``api/categories/``：分类及帖子数
+- ``api/users/<username>/``：用户资料和统计
+
+所有接口都可以用 ``fields=id,title,...`` 只取需要的字段，列表只查询这些
+字段用到的列。
+
+每个接口先执行一条很轻的校验查询算出 ETag（及 Last-Modified），请求带有
+匹配的 If-None-Match / If-Modified-Since 时直接返回 304，不再查询详情、
+也不序列化：
+
+- 帖子列表：当前页各帖子的 id、``updated_at`` 和计数，只走排序索引取窄列，
+  未命中时再按 id 取详情；
+- 帖子详情：帖子行的 ``updated_at`` 和计数；
+- 评论：帖子的评论数加上评论的高水位标记（评论增删、评论点赞提交后更新，
+  见 ``cache.touch_mark``）；
+- 分类：侧栏缓存使用的 posts/categories 版本号；
+- 用户：资料行上的统计和资料字段。
+
+点赞、浏览等计数变化不会更新 ``updated_at``，只体现在 ETag 里，客户端应
+优先使用 If-None-Match。
+"""
+import hashlib
+from functools import wraps
+
+from django.contrib.auth.models import User
+from django.db.models.functions import Substr
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from .cache import cached, get_mark, get_versions
+from .models import Comment, Post, UserProfile
+from .pagination import CursorPaginator
+from .queries import EXCERPT_LENGTH, categories_with_counts
+from . import avatars, threads
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+ORDERINGS = {
+    'latest': ('-created_at', '-id'),
+    'hot': ('-hot_score', '-id'),
+    'recommend': ('-recommend_score', '-id'),
+}
+
+# 计算列表 ETag 时取的列：排序键之外，任何一列变化都说明这一行变了
+VALIDATOR_FIELDS = ('id', 'updated_at', 'view_count', 'like_count', 'favorite_count', 'comment_count')
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _value(attr):
+    return lambda obj: getattr(obj, attr)
+
+
+# 字段名 -> (需要查询的列, 取值函数)
+POST_FIELDS = {
+    'id': ((), _value('id')),
+    'title': (('title',), _value('title')),
+    'excerpt': ((), _value('excerpt')),
+    'content': (('content',), _value('content')),
+    'author': (('author__id', 'author__username'),
+               lambda post: {'id': post.author_id, 'username': post.author.username}),
+    'category': (('category__id', 'category__name'),
+                 lambda post: {'id': post.category_id, 'name': post.category.name}),
+    'tags': (('tags',), _value('tags')),
+    'created_at': (('created_at',), _value('created_at')),
+    'updated_at': (('updated_at',), _value('updated_at')),
+    'view_count': (('view_count',), _value('view_count')),
+    'like_count': (('like_count',), _value('like_count')),
+    'favorite_count': (('favorite_count',), _value('favorite_count')),
+    'comment_count': (('comment_count',), _value('comment_count')),
+    'is_pinned': (('is_pinned',), _value('is_pinned')),
+    'url': ((), lambda post: reverse('tieba:api_post', args=[post.id])),
+}
+POST_GETTERS = {name: getter for name, (_, getter) in POST_FIELDS.items()}
+POST_LIST_FIELDS = tuple(name for name in POST_FIELDS if name != 'content')
+POST_DETAIL_FIELDS = tuple(name for name in POST_FIELDS if name != 'excerpt')
+
+COMMENT_FIELDS = {
+    'id': _value('id'),
+    'parent_id': _value('parent_id'),
+    'root_id': _value('root_id'),
+    'depth': _value('depth'),
+    'author': lambda comment: {'id': comment.author_id, 'username': comment.author.username},
+    'content': _value('content'),
+    'created_at': _value('created_at'),
+    'like_count': _value('like_count'),
+    'reply_count': _value('reply_count'),
+}
+
+CATEGORY_FIELDS = {
+    'id': _value('id'),
+    'name': _value('name'),
+    'description': _value('description'),
+    'post_count': _value('post_count'),
+}
+
+USER_FIELDS = {
+    'id': _value('id'),
+    'username': _value('username'),
+    'date_joined': _value('date_joined'),
+    'bio': lambda user: user.userprofile.bio,
+    'location': lambda user: user.userprofile.location,
+    'avatar': lambda user: user.userprofile.avatar.url if user.userprofile.avatar else None,
+    'avatar_sizes': lambda user: (
+        avatars.variant_urls(user.userprofile.avatar_hash) if user.userprofile.avatar_hash else None
+    ),
+    'post_count': lambda user: user.userprofile.post_count,
+    'comment_count': lambda user: user.userprofile.comment_count,
+    'likes_received': lambda user: user.userprofile.likes_received,
+    'favorites_received': lambda user: user.userprofile.favorites_received,
+}
+
+
+def _fields(request, allowed):
+    """解析 fields 参数，未指定时返回全部允许的字段"""
+    value = request.GET.get('fields')
+    if not value:
+        return tuple(allowed)
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise ApiError(f"不支持的字段: {', '.join(unknown)}")
+    return fields
+
+
+def _limit(request, default=PAGE_SIZE):
+    try:
+        limit = int(request.GET.get('limit', default))
+    except ValueError:
+        raise ApiError('limit 必须是整数')
+    return min(max(limit, 1), MAX_PAGE_SIZE)
+
+
+def _serialize(obj, fields, getters):
+    return {name: getters[name](obj) for name in fields}
+
+
+def _post_queryset(queryset, fields):
+    """按所需字段构造帖子查询，只取这些字段用到的列"""
+    columns = {'id'}
+    for name in fields:
+        columns.update(POST_FIELDS[name][0])
+    related = sorted({column.split('__')[0] for column in columns if '__' in column})
+    queryset = queryset.select_related(*related).only(*columns)
+    if 'excerpt' in fields:
+        queryset = queryset.annotate(excerpt=Substr('content', 1, EXCERPT_LENGTH))
+    return queryset
+
+
+def _etag(request, *parts):
+    """ETag 由请求路径（含查询参数）和校验数据计算，不同字段选择各有各的 ETag"""
+    digest = hashlib.md5(repr((request.get_full_path(), parts)).encode(), usedforsecurity=False)
+    return quote_etag(digest.hexdigest())
+
+
+def conditional(validate):
+    """条件请求装饰器
+
+    ``validate(request, **kwargs)`` 执行校验查询，返回
+    ``(传给视图的参数, ETag, 最后修改时间)``；与请求头匹配时直接返回 304，
+    否则调用 ``view(request, **参数)`` 生成响应。
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, **kwargs):
+            try:
+                context, etag, last_modified = validate(request, **kwargs)
+                timestamp = int(last_modified.timestamp()) if last_modified else None
+                response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+                if response is None:
+                    response = view(request, **context)
+            except ApiError as error:
+                return JsonResponse({'error': str(error)}, status=error.status)
+
+            if timestamp and not response.has_header('Last-Modified'):
+                response.headers['Last-Modified'] = http_date(timestamp)
+            response.headers.setdefault('ETag', etag)
+            # 内容与登录用户无关，允许边缘缓存保存，但每次使用前都要验证
+            patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+            return response
+        return require_safe(wrapper)
+    return decorator
+
+
+def _page_links(page):
+    return {'next_cursor': page.next_cursor, 'previous_cursor': page.previous_cursor}
+
+
+# 帖子列表
+
+def validate_post_list(request):
+    fields = _fields(request, POST_LIST_FIELDS)
+    sort = request.GET.get('sort', 'latest')
+    if sort not in ORDERINGS:
+        raise ApiError(f"sort 只能是 {', '.join(ORDERINGS)}")
+
+    queryset = Post.objects.filter(is_active=True, is_draft=False)
+    if request.GET.get('category'):
+        if not request.GET['category'].isdigit():
+            raise ApiError('category 必须是整数')
+        queryset = queryset.filter(category_id=request.GET['category'])
+    if request.GET.get('author'):
+        queryset = queryset.filter(author__username=request.GET['author'])
+
+    # 校验查询只取排序键和校验列，走与首页相同的排序索引
+    ordering = ORDERINGS[sort]
+    columns = set(VALIDATOR_FIELDS) | {name.lstrip('-') for name in ordering}
+    page = CursorPaginator(queryset.only(*columns), ordering, _limit(request)).page(request.GET.get('cursor'))
+
+    rows = [tuple(getattr(post, name) for name in VALIDATOR_FIELDS) for post in page]
+    last_modified = max((post.updated_at for post in page), default=None)
+    return {'page': page, 'fields': fields}, _etag(request, rows, page.next_cursor), last_modified
+
+
+@conditional(validate_post_list)
+def post_list(request, page, fields):
+    """帖子列表"""
+    posts = _post_queryset(Post.objects.filter(id__in=[post.id for post in page]), fields).in_bulk()
+    results = [_serialize(posts[post.id], fields, POST_GETTERS) for post in page if post.id in posts]
+    return JsonResponse({'results': results, **_page_links(page)})
+
+
+# 帖子详情
+
+def validate_post_detail(request, post_id):
+    fields = _fields(request, POST_DETAIL_FIELDS)
+    row = Post.objects.filter(id=post_id, is_active=True, is_draft=False).values_list(*VALIDATOR_FIELDS).first()
+    if row is None:
+        raise ApiError('帖子不存在', status=404)
+    return {'post_id': post_id, 'fields': fields}, _etag(request, row), row[1]
+
+
+@conditional(validate_post_detail)
+def post_detail(request, post_id, fields):
+    """帖子详情"""
+    post = _post_queryset(Post.objects.filter(id=post_id, is_active=True, is_draft=False), fields).first()
+    if post is None:
+        return JsonResponse({'error': '帖子不存在'}, status=404)
+    return JsonResponse(_serialize(post, fields, POST_GETTERS))
+
+
+# 评论
+
+def validate_post_comments(request, post_id):
+    fields = _fields(request, COMMENT_FIELDS)
+    comment_count = (
+        Post.objects.filter(id=post_id, is_active=True, is_draft=False).values_list('comment_count', flat=True).first()
+    )
+    if comment_count is None:
+        raise ApiError('帖子不存在', status=404)
+    mark = get_mark(f'comments:{post_id}')
+    context = {'post_id': post_id, 'fields': fields, 'limit': _limit(request, threads.COMMENTS_PER_PAGE)}
+    return context, _etag(request, comment_count, mark), None
+
+
+@conditional(validate_post_comments)
+def post_comments(request, post_id, fields, limit):
+    """楼层分页，每层带前几条回复"""
+    page = threads.load_thread_page(post_id, request.GET.get('cursor'), per_page=limit)
+    results = []
+    for root in page:
+        item = _serialize(root, fields, COMMENT_FIELDS)
+        item['replies'] = [_serialize(reply, fields, COMMENT_FIELDS) for reply in root.preview_replies]
+        item['more_replies_cursor'] = root.more_replies_cursor
+        results.append(item)
+    return JsonResponse({'results': results, **_page_links(page)})
+
+
+def validate_comment_replies(request, comment_id):
+    fields = _fields(request, COMMENT_FIELDS)
+    row = (
+        Comment.objects.filter(id=comment_id, depth=0, is_active=True)
+        .values_list('post_id', 'reply_count').first()
+    )
+    if row is None:
+        raise ApiError('评论不存在', status=404)
+    mark = get_mark(f'comments:{row[0]}')
+    context = {'comment_id': comment_id, 'fields': fields, 'limit': _limit(request, threads.REPLIES_PER_LOAD)}
+    return context, _etag(request, row, mark), None
+
+
+@conditional(validate_comment_replies)
+def comment_replies(request, comment_id, fields, limit):
+    """按楼层路径继续加载回复"""
+    page = threads.load_replies(comment_id, request.GET.get('cursor'), limit=limit)
+    return JsonResponse({
+        'results': [_serialize(reply, fields, COMMENT_FIELDS) for reply in page],
+        **_page_links(page),
+    })
+
+
+# 分类
+
+def validate_category_list(request):
+    fields = _fields(request, CATEGORY_FIELDS)
+    versions = get_versions(('posts', 'categories'))
+    return {'fields': fields}, _etag(request, sorted(versions.items())), None
+
+
+@conditional(validate_category_list)
+def category_list(request, fields):
+    """分类及有效帖子数，与侧栏共用缓存"""
+    categories = cached('categories', ('posts', 'categories'), lambda: list(categories_with_counts()))
+    return JsonResponse({'results': [_serialize(category, fields, CATEGORY_FIELDS) for category in categories]})
+
+
+# 用户
+
+def validate_user_detail(request, username):
+    fields = _fields(request, USER_FIELDS)
+    user = User.objects.select_related('userprofile').filter(username=username).first()
+    if user is None:
+        raise ApiError('用户不存在', status=404)
+    try:
+        profile = user.userprofile
+    except UserProfile.DoesNotExist:
+        # 只读接口不创建资料，按空资料输出
+        profile = user.userprofile = UserProfile(user=user)
+    row = (
+        user.id, profile.bio, profile.location, str(profile.avatar), profile.post_count,
+        profile.comment_count, profile.likes_received, profile.favorites_received,
+    )
+    # 用户行已经取到，304 省下的是序列化和传输
+    return {'user': user, 'fields': fields}, _etag(request, row), None
+
+
+@conditional(validate_user_detail)
+def user_detail(request, user, fields):
+    """用户资料和统计"""
+    return JsonResponse(_serialize(user, fields, USER_FIELDS))
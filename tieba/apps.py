@@ -1,7 +1,17 @@
+import atexit
+
 from django.apps import AppConfig
 
 
 class TiebaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tieba'
-    verbose_name = '贴吧'
\ No newline at end of file
+    verbose_name = '贴吧'
+
+    def ready(self):
+        from . import signals  # noqa: F401 注册信号处理函数
+        from . import tasks  # noqa: F401 注册后台任务
+        from .counters import flush_on_exit
+
+        # 进程退出时写回内存中尚未持久化的浏览数
+        atexit.register(flush_on_exit)
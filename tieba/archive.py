@@ -0,0 +1,242 @@
+"""软删除内容归档
+
+删帖、删评论只是把 ``is_active`` 置为 False，行一直留在帖子表、评论表里，
+表和索引越来越大，备份也越来越慢。``archive_deleted`` 命令把删除超过保留期
+的行搬到归档表（``ArchivedPost`` / ``ArchivedComment``），连同它们的点赞、
+收藏记录；需要时可以在后台原样恢复。
+
+- 帖子：删除时间（``deleted_at``）早于保留期的帖子连同其下全部评论一起归档；
+- 评论：所在帖子仍有效、且没有子评论的已删除评论单独归档（有子评论的等
+  子评论先归档，避免级联删除仍在显示的回复）。
+
+归档表和原表在同一个数据库中，每批在一个短事务里完成"写归档表 + 删除原行"，
+中途中断时已提交的批次不受影响，未提交的批次整体回滚，重新执行即可继续。
+删除原行时逐行触发的信号会扣减作者的获赞数等计数，每批最后按内容表重算
+相关用户的计数。
+
+配置示例（settings.py）::
+
+    TIEBA_ARCHIVE = {
+        'RETENTION_DAYS': 30,   # 删除多少天后归档
+        'BATCH_SIZE': 200,      # 每批归档的帖子/评论数
+        'PAUSE': 0.1,           # 批次之间的间隔（秒），让出 SQLite 写锁
+    }
+"""
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ArchivedComment, ArchivedPost, Comment, Favorite, Like, Post
+from . import moderation, stats, tags
+
+DEFAULTS = {
+    'RETENTION_DAYS': 30,
+    'BATCH_SIZE': 200,
+    'PAUSE': 0.1,
+}
+
+
+def get_config():
+    """读取归档配置，未配置的项使用默认值"""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'TIEBA_ARCHIVE', {}))
+    return config
+
+
+def cutoff(retention_days=None):
+    """删除时间早于该时间的行可以归档"""
+    if retention_days is None:
+        retention_days = get_config()['RETENTION_DAYS']
+    return timezone.now() - datetime.timedelta(days=retention_days)
+
+
+def _dump(obj):
+    """把一行的全部字段转成可存入 JSON 的字典，时间保留微秒"""
+    data = {}
+    for field in obj._meta.concrete_fields:
+        value = field.value_from_object(obj)
+        if isinstance(value, datetime.datetime):
+            value = value.isoformat()
+        data[field.attname] = value
+    return data
+
+
+def _load(model, data):
+    obj = model()
+    for field in model._meta.concrete_fields:
+        if field.attname in data:
+            value = data[field.attname]
+            if isinstance(field, models.DateTimeField) and value:
+                value = parse_datetime(value)
+            setattr(obj, field.attname, value)
+    return obj
+
+
+def _insert(model, rows):
+    """按原主键写回一组行；bulk_create 会用当前时间覆盖自动时间字段，写入后再改回原值"""
+    if not rows:
+        return []
+    model.objects.bulk_create([_load(model, data) for data in rows])
+    auto_fields = [
+        field.name for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    objs = [_load(model, data) for data in rows]
+    if auto_fields:
+        model.objects.bulk_update(objs, auto_fields)
+    return objs
+
+
+def deleted_posts(before):
+    """可以归档的帖子，走 (deleted_at) WHERE NOT is_active 的部分索引"""
+    return Post.objects.filter(is_active=False, deleted_at__lt=before)
+
+
+def deleted_comments(before):
+    """可以单独归档的评论：所在帖子有效，且没有子评论"""
+    return (
+        Comment.objects.filter(is_active=False, deleted_at__lt=before, post__is_active=True)
+        .exclude(Exists(Comment.objects.filter(parent=OuterRef('pk'))))
+    )
+
+
+def _group(rows, key):
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[getattr(row, key)].append(_dump(row))
+    return grouped
+
+
+def _archive_comments(comments):
+    comment_ids = [comment.id for comment in comments]
+    likes = _group(Like.objects.filter(comment_id__in=comment_ids), 'comment_id')
+    ArchivedComment.objects.bulk_create([
+        ArchivedComment(
+            id=comment.id, post_id=comment.post_id, author_id=comment.author_id, content=comment.content,
+            deleted_at=comment.deleted_at, data=_dump(comment), likes=likes[comment.id],
+        )
+        for comment in comments
+    ])
+
+
+def archive_posts(before, batch_size):
+    """归档一批已删除的帖子及其评论、点赞、收藏，返回归档的帖子数"""
+    with transaction.atomic():
+        posts = list(deleted_posts(before).order_by('deleted_at', 'id')[:batch_size])
+        if not posts:
+            return 0
+        post_ids = [post.id for post in posts]
+        comments = list(Comment.objects.filter(post_id__in=post_ids).order_by('id'))
+        likes = _group(Like.objects.filter(post_id__in=post_ids), 'post_id')
+        favorites = _group(Favorite.objects.filter(post_id__in=post_ids), 'post_id')
+        ArchivedPost.objects.bulk_create([
+            ArchivedPost(
+                id=post.id, author_id=post.author_id, title=post.title, content=post.content,
+                deleted_at=post.deleted_at, data=_dump(post), likes=likes[post.id], favorites=favorites[post.id],
+            )
+            for post in posts
+        ])
+        _archive_comments(comments)
+        # 评论、点赞、收藏、标签关联、动态收件箱随帖子级联删除
+        Post.objects.filter(id__in=post_ids).delete()
+        stats.reconcile({post.author_id for post in posts} | {comment.author_id for comment in comments})
+    return len(posts)
+
+
+def archive_comments(before, batch_size):
+    """归档一批已删除的评论及其点赞，返回归档的评论数"""
+    with transaction.atomic():
+        comments = list(deleted_comments(before).order_by('deleted_at', 'id')[:batch_size])
+        if not comments:
+            return 0
+        _archive_comments(comments)
+        Comment.objects.filter(id__in=[comment.id for comment in comments]).delete()
+        stats.reconcile({comment.author_id for comment in comments})
+    return len(comments)
+
+
+def _restore_comments(archived):
+    """按 id 顺序写回评论（父评论先于子评论）及其点赞"""
+    archived = sorted(archived, key=lambda comment: comment.id)
+    _insert(Comment, [comment.data for comment in archived])
+    _insert(Like, [like for comment in archived for like in comment.likes])
+    ArchivedComment.objects.filter(id__in=[comment.id for comment in archived]).delete()
+
+
+def restore_posts(post_ids, activate=True):
+    """把归档的帖子连同评论、点赞、收藏写回原表，返回恢复的帖子数
+
+    activate 为 True 时同时恢复显示；否则仍为已删除状态，删除时间从现在算起，
+    不会在下次归档时立即被搬走。
+    """
+    with transaction.atomic():
+        archived = list(ArchivedPost.objects.filter(id__in=post_ids))
+        if not archived:
+            return 0
+        post_ids = [post.id for post in archived]
+        _insert(Post, [post.data for post in archived])
+        _restore_comments(ArchivedComment.objects.filter(post_id__in=post_ids))
+        _insert(Like, [like for post in archived for like in post.likes])
+        _insert(Favorite, [favorite for post in archived for favorite in post.favorites])
+        ArchivedPost.objects.filter(id__in=post_ids).delete()
+
+        posts = Post.objects.filter(id__in=post_ids)
+        comment_authors = set(Comment.objects.filter(post_id__in=post_ids).values_list('author_id', flat=True))
+        if activate:
+            moderation.set_posts_active(posts, True)
+        else:
+            posts.update(deleted_at=timezone.now())
+        # 标签关联行已随帖子删除，按帖子当前状态重建
+        for post in posts.only('id', 'tags', 'created_at', 'is_active', 'is_draft'):
+            tags.sync_post(post)
+        stats.reconcile(comment_authors)
+    return len(archived)
+
+
+def restore_comments(comment_ids, activate=True):
+    """把单独归档的评论写回原表，返回 comment_ids 中恢复了的评论数
+
+    父评论也已归档时一并写回（保持删除状态）；所在帖子已归档的评论需随帖子恢复，
+    这里跳过。
+    """
+    with transaction.atomic():
+        archived = {comment.id: comment for comment in ArchivedComment.objects.filter(id__in=comment_ids)}
+        requested = set(archived)
+        parents = {comment.data.get('parent_id') for comment in archived.values()} - set(archived) - {None}
+        while parents:
+            found = {comment.id: comment for comment in ArchivedComment.objects.filter(id__in=parents)}
+            archived.update(found)
+            parents = {comment.data.get('parent_id') for comment in found.values()} - set(archived) - {None}
+
+        live_posts = set(
+            Post.objects.filter(id__in={comment.post_id for comment in archived.values()}).values_list('id', flat=True)
+        )
+        archived = [comment for comment in archived.values() if comment.post_id in live_posts]
+        if not archived:
+            return 0
+        _restore_comments(archived)
+
+        restored = Comment.objects.filter(id__in=[comment.id for comment in archived])
+        restored.filter(is_active=False).update(deleted_at=timezone.now())
+        if activate:
+            moderation.set_comments_active(restored.filter(id__in=requested), True)
+        stats.reconcile({comment.author_id for comment in archived})
+    return len(requested & {comment.id for comment in archived})
+
+
+def pending_counts(before):
+    """等待归档的帖子数和评论数"""
+    return deleted_posts(before).count(), deleted_comments(before).count()
+
+
+def search_count(model, query, fields, limit=1000):
+    """后台检索时统计归档表中的匹配数，最多数到 limit"""
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f'{field}__icontains': query})
+    return model.objects.filter(condition)[:limit].count()
@@ -0,0 +1,249 @@
+"""头像处理
+
+上传的头像不再原样保存：上传处理器把文件直接写入临时文件，超过大小上限
+立即丢弃；请求里只读取图片头部做校验，解码、裁剪、缩放和编码作为后台
+任务（``avatars.process``，见 jobs.py）由 ``run_jobs`` 进程执行，临时文件
+放在 FILE_UPLOAD_TEMP_DIR 中，worker 需要和 Web 进程运行在同一台机器上。
+每张头像生成若干尺寸的正方形缩略图，各有 WebP 和 JPEG（不支持 WebP 的
+浏览器使用）两种格式，文件名取自原图内容和处理参数的哈希，内容不变文件名
+就不变，可以长期缓存::
+
+    avatars/3f/3fa8c0d2e1b4a7c95d10/32.webp
+    avatars/3f/3fa8c0d2e1b4a7c95d10/32.jpg
+    ...
+
+``UserProfile.avatar_hash`` 记录当前使用的哈希，``avatar`` 指向最大尺寸的
+JPEG，模板里用 ``{% avatar %}`` 标签按显示尺寸选用最小的合适尺寸。
+
+配置示例（settings.py）::
+
+    TIEBA_AVATARS = {
+        'SIZES': (32, 64, 200),           # 生成的边长（像素）
+        'QUALITY': 82,                    # WebP/JPEG 压缩质量
+        'MAX_UPLOAD_SIZE': 5 * 1024 * 1024,
+        'MAX_PIXELS': 40_000_000,         # 超过该像素数的图片拒绝处理（防解压炸弹）
+        'UPLOAD_TO': 'avatars',
+    }
+"""
+import hashlib
+import io
+import os
+import tempfile
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.move import file_move_safe
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image, ImageOps
+
+DEFAULTS = {
+    'SIZES': (32, 64, 200),
+    'QUALITY': 82,
+    'MAX_UPLOAD_SIZE': 5 * 1024 * 1024,
+    'MAX_PIXELS': 40_000_000,
+    'UPLOAD_TO': 'avatars',
+}
+
+# 每种尺寸生成的格式：(扩展名, Pillow 格式名)
+FORMATS = (('webp', 'WEBP'), ('jpg', 'JPEG'))
+
+# 请求中校验时接受的图片格式
+ACCEPTED_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP', 'BMP'}
+
+
+class AvatarError(Exception):
+    """头像文件无法使用，消息可直接展示给用户"""
+
+
+def get_config():
+    """读取头像配置，未配置的项使用默认值"""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'TIEBA_AVATARS', {}))
+    config['SIZES'] = tuple(sorted(config['SIZES']))
+    return config
+
+
+# 上传
+
+class AvatarUploadHandler(TemporaryFileUploadHandler):
+    """上传内容直接写入临时文件，超过大小上限时丢弃该文件并记下错误"""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.max_size = get_config()['MAX_UPLOAD_SIZE']
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self.file.close()
+            self.request.avatar_error = f'头像不能超过 {filesizeformat(self.max_size)}'
+            raise SkipFile
+        return super().receive_data_chunk(raw_data, start)
+
+
+def avatar_upload(view):
+    """为视图装上头像上传处理器
+
+    CSRF 中间件会在视图之前读取请求体，那时再换上传处理器已经晚了，
+    因此按 Django 文档的做法：视图免除中间件校验，换好处理器后再由
+    ``csrf_protect`` 校验。
+    """
+    protected = csrf_protect(view)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers = [AvatarUploadHandler(request)]
+        return protected(request, *args, **kwargs)
+    return csrf_exempt(wrapper)
+
+
+def validate(path):
+    """只读取图片头部，确认格式和尺寸可以处理"""
+    try:
+        with Image.open(path) as image:
+            image_format, (width, height) = image.format, image.size
+    except (OSError, Image.DecompressionBombError):
+        raise AvatarError('无法识别的图片文件')
+    if image_format not in ACCEPTED_FORMATS:
+        raise AvatarError('头像只支持 JPG、PNG、GIF、WebP 格式')
+    if width * height > get_config()['MAX_PIXELS']:
+        raise AvatarError('图片尺寸过大')
+
+
+def _stash(upload):
+    """把上传文件移出请求的临时目录，请求结束后后台任务仍能读取"""
+    fd, path = tempfile.mkstemp(prefix='avatar-', dir=getattr(settings, 'FILE_UPLOAD_TEMP_DIR', None))
+    os.close(fd)
+    if hasattr(upload, 'temporary_file_path'):
+        file_move_safe(upload.temporary_file_path(), path, allow_overwrite=True)
+    else:
+        with open(path, 'wb') as target:
+            for chunk in upload.chunks():
+                target.write(chunk)
+    return path
+
+
+def submit(profile, upload):
+    """校验上传的头像并加入后台任务队列，校验失败时抛出 AvatarError"""
+    from .jobs import enqueue
+
+    path = _stash(upload)
+    try:
+        validate(path)
+    except AvatarError:
+        os.unlink(path)
+        raise
+    # 任务和资料在同一事务中写入，资料保存回滚时任务也一并撤销
+    enqueue('avatars.process', {'profile_id': profile.pk, 'path': path}, priority=10)
+
+
+def variant_name(digest, size, ext):
+    return f"{get_config()['UPLOAD_TO']}/{digest[:2]}/{digest}/{size}.{ext}"
+
+
+def render_variants(source):
+    """解码、裁剪并生成全部尺寸和格式，返回 (哈希, {文件名: 内容})"""
+    config = get_config()
+    data = source.read()
+    params = repr((config['SIZES'], config['QUALITY'], FORMATS)).encode()
+    digest = hashlib.sha256(data + params).hexdigest()[:20]
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.width * image.height > config['MAX_PIXELS']:
+            raise AvatarError('图片尺寸过大')
+        # JPEG 可以直接按缩小的比例解码，大图省去大部分解码开销
+        largest = config['SIZES'][-1]
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    except (OSError, Image.DecompressionBombError):
+        raise AvatarError('无法识别的图片文件')
+
+    # 居中裁成正方形，从大到小逐级缩放
+    side = min(image.size)
+    image = ImageOps.fit(image, (side, side), method=Image.Resampling.LANCZOS)
+    variants = {}
+    for size in reversed(config['SIZES']):
+        if image.width > size:
+            image = image.resize((size, size), Image.Resampling.LANCZOS)
+        for ext, image_format in FORMATS:
+            variant = image
+            if image_format == 'JPEG' and variant.mode == 'RGBA':
+                # JPEG 不支持透明，铺白底
+                background = Image.new('RGB', variant.size, 'white')
+                background.paste(variant, mask=variant.getchannel('A'))
+                variant = background
+            buffer = io.BytesIO()
+            if image_format == 'JPEG':
+                variant.save(buffer, image_format, quality=config['QUALITY'], optimize=True, progressive=True)
+            else:
+                variant.save(buffer, image_format, quality=config['QUALITY'], method=4)
+            variants[variant_name(digest, size, ext)] = buffer.getvalue()
+    return digest, variants
+
+
+def process_avatar(profile_id, source, delete_previous=True):
+    """生成缩略图并切换到新头像，返回新的哈希
+
+    delete_previous 为真时删除旧头像的文件（没有其他用户共用时）。
+    """
+    from .models import UserProfile
+
+    digest, variants = render_variants(source)
+    for name, content in variants.items():
+        # 同样的内容文件名相同，已存在就不必再写
+        if not default_storage.exists(name):
+            default_storage.save(name, ContentFile(content))
+
+    previous = UserProfile.objects.filter(pk=profile_id).values_list('avatar', 'avatar_hash').first()
+    if previous is None:
+        return digest
+    UserProfile.objects.filter(pk=profile_id).update(
+        avatar=variant_name(digest, get_config()['SIZES'][-1], 'jpg'), avatar_hash=digest,
+    )
+    if delete_previous:
+        delete_files(*previous, exclude=profile_id, keep=digest)
+    return digest
+
+
+def delete_files(name, digest, exclude=None, keep=None):
+    """删除一张头像的文件；其他用户仍在使用时保留"""
+    from .models import UserProfile
+
+    others = UserProfile.objects.exclude(pk=exclude)
+    if digest:
+        if digest == keep or others.filter(avatar_hash=digest).exists():
+            return
+        for size in get_config()['SIZES']:
+            for ext, _ in FORMATS:
+                default_storage.delete(variant_name(digest, size, ext))
+    elif name and not others.filter(avatar=name).exists():
+        # 尚未处理过的原图
+        default_storage.delete(name)
+
+
+# 模板
+
+def pick_size(pixels):
+    """不小于 pixels 的最小尺寸，都不够大时用最大的"""
+    sizes = get_config()['SIZES']
+    return next((size for size in sizes if size >= pixels), sizes[-1])
+
+
+def variant_url(digest, pixels, ext):
+    return default_storage.url(variant_name(digest, pick_size(pixels), ext))
+
+
+def variant_urls(digest):
+    """全部缩略图的地址：{尺寸: {扩展名: URL}}"""
+    return {
+        size: {ext: default_storage.url(variant_name(digest, size, ext)) for ext, _ in FORMATS}
+        for size in get_config()['SIZES']
+    }
@@ -0,0 +1,157 @@
+"""带版本号的缓存
+
+首页、搜索页侧栏的分类统计、热门帖子、全站帖子数/用户数几乎不变，却每次
+请求都要扫表。这里把它们放进缓存，缓存键里带上所依赖实体的版本号：
+发帖、编辑、删帖、注册等信号只需把对应实体的版本号加一，旧键自然失效，
+不用逐个删除。
+
+为防止热点键过期瞬间大量请求同时回源（缓存击穿），值里另存一个"软过期"
+时间：软过期后由抢到锁的那个请求重建，其他请求继续返回旧值；键完全不存在
+时，没抢到锁的请求短暂等待重建结果。
+
+配置示例（settings.py）::
+
+    TIEBA_CACHE = {
+        'ALIAS': 'default',   # 使用 CACHES 中的哪个缓存
+        'TIMEOUT': 300,       # 软过期秒数
+        'STALE_GRACE': 60,    # 软过期后旧值还能保留的秒数
+        'LOCK_TIMEOUT': 10,   # 重建锁的最长持有时间
+    }
+"""
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+DEFAULTS = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+    'STALE_GRACE': 60,
+    'LOCK_TIMEOUT': 10,
+}
+
+KEY_PREFIX = 'tieba'
+
+# 没抢到重建锁时，等待他人重建结果的最长时间和轮询间隔
+WAIT_TIMEOUT = 2.0
+WAIT_INTERVAL = 0.05
+
+
+def get_config():
+    """读取缓存配置，未配置的项使用默认值"""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'TIEBA_CACHE', {}))
+    return config
+
+
+def get_cache():
+    return caches[get_config()['ALIAS']]
+
+
+def is_process_local(cache):
+    """进程内缓存（locmem、dummy）里的数据，其他进程（管理命令、run_jobs）读不到"""
+    return isinstance(cache, (LocMemCache, DummyCache))
+
+
+def _version_key(entity):
+    return f'{KEY_PREFIX}:ver:{entity}'
+
+
+def get_versions(entities):
+    """返回 {实体: 版本号}，未初始化的实体版本号为 1"""
+    cache = get_cache()
+    keys = {_version_key(entity): entity for entity in entities}
+    found = cache.get_many(list(keys))
+    return {entity: found.get(key, 1) for key, entity in keys.items()}
+
+
+def bump_version(*entities):
+    """使依赖这些实体的缓存全部失效"""
+    cache = get_cache()
+    for entity in entities:
+        key = _version_key(entity)
+        # 版本号永不过期；首次递增前先写入初始值 1
+        cache.add(key, 1, timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 2, timeout=None)
+
+
+def _now():
+    return time.time()
+
+
+def _mark_key(name):
+    return f'{KEY_PREFIX}:mark:{name}'
+
+
+def touch_mark(*names):
+    """记录这些对象刚刚发生变化，高水位标记取当前时间"""
+    now = _now()
+    get_cache().set_many({_mark_key(name): now for name in names}, timeout=None)
+
+
+def get_mark(name):
+    """返回对象最近一次变化的时间戳
+
+    标记丢失（缓存被清空或淘汰）时从当前时间重新开始，宁可让客户端多取
+    一次，也不会把变化前的 ETag 误判为仍然有效。
+    """
+    cache = get_cache()
+    key = _mark_key(name)
+    mark = cache.get(key)
+    if mark is None:
+        cache.add(key, _now(), timeout=None)
+        mark = cache.get(key) or _now()
+    return mark
+
+
+def cached(name, entities, builder, timeout=None):
+    """读取缓存的值，缺失或过期时调用 builder() 重建
+
+    name 是缓存项名称，entities 是它依赖的实体（如 ``('posts', 'users')``），
+    任何一个实体的版本号变化都会让缓存失效。
+    """
+    config = get_config()
+    cache = get_cache()
+    timeout = timeout or config['TIMEOUT']
+
+    versions = get_versions(entities)
+    version_part = '.'.join(f'{entity}{versions[entity]}' for entity in sorted(versions))
+    key = f'{KEY_PREFIX}:{name}:{version_part}'
+    lock_key = f'{key}:lock'
+
+    envelope = cache.get(key)
+    if envelope is not None and envelope['expires'] > _now():
+        return envelope['value']
+
+    locked = cache.add(lock_key, 1, timeout=config['LOCK_TIMEOUT'])
+    if not locked:
+        if envelope is not None:
+            # 已有人在重建，先返回旧值
+            return envelope['value']
+        deadline = _now() + WAIT_TIMEOUT
+        while _now() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            envelope = cache.get(key)
+            if envelope is not None:
+                return envelope['value']
+        # 等待超时，自行重建（不释放别人持有的锁）
+
+    try:
+        value = builder()
+        # 软过期时间加一点随机抖动，避免同一批键同时过期
+        soft_timeout = timeout * random.uniform(0.9, 1.1)
+        cache.set(
+            key,
+            {'value': value, 'expires': _now() + soft_timeout},
+            timeout=soft_timeout + config['STALE_GRACE'],
+        )
+        return value
+    finally:
+        if locked:
+            cache.delete(lock_key)
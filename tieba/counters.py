@@ -0,0 +1,337 @@
+"""浏览数写回缓冲
+
+帖子详情页每次访问不再直接 UPDATE 整行，而是把浏览增量先累积在内存
+（或多进程共享的存储）中，按时间间隔或累计次数批量写回数据库。写回使用
+``F('view_count') + n`` 原子更新，只触及 view_count 一列，也不会改动
+``updated_at``。
+
+三种后端：
+
+- memory：进程内缓冲，由所在进程按节奏写回、退出时兜底写回，适合单进程部署；
+- database：增量记在 ``tieba_pendingview`` 小表里，每次浏览一条
+  ``INSERT … ON CONFLICT DO UPDATE SET count = count + excluded.count``，
+  写回时一条 ``DELETE … RETURNING`` 取出并清空，两者都是单条语句，多进程
+  同时浏览、同时写回都不会丢增量；多进程部署用它；
+- cache：增量记在 Django 缓存里，要求缓存的 ``incr``/``decr``/``add`` 是
+  原子操作（Redis、Memcached），否则并发的增量会互相覆盖；文件缓存、
+  locmem 都不满足，会在启动时报错。
+
+``flush_view_counts`` 命令运行在另一个进程中，只能配合 database、cache 后端使用。
+
+配置示例（settings.py）::
+
+    TIEBA_VIEW_COUNTER = {
+        'BACKEND': 'memory',     # memory / database / cache，见上
+        'CACHE_ALIAS': 'counters',
+        'FLUSH_INTERVAL': 10,    # 距上次写回超过 N 秒即写回
+        'FLUSH_THRESHOLD': 200,  # 累计 M 次浏览即写回
+    }
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.core.cache.backends.redis import RedisCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.db.models import F
+from django.dispatch import Signal
+
+from . import cache as tieba_cache
+from .ranking import refresh_scores
+
+DEFAULTS = {
+    'BACKEND': 'memory',
+    'CACHE_ALIAS': 'counters',
+    'FLUSH_INTERVAL': 10,
+    'FLUSH_THRESHOLD': 200,
+}
+
+# 浏览数写回数据库后发送，参数 post_ids 为本次写回的帖子
+views_flushed = Signal()
+
+
+def get_config():
+    """读取浏览数缓冲配置，未配置的项使用默认值"""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'TIEBA_VIEW_COUNTER', {}))
+    return config
+
+
+class BaseViewBuffer:
+    """浏览数缓冲基类，负责写回节奏控制和批量 F() 更新"""
+
+    def __init__(self, flush_interval, flush_threshold):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._hits = 0
+        self._last_flush = time.monotonic()
+        # 保护 _hits、_last_flush（子类也用它保护自己的计数）
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def add(self, post_id, n=1):
+        raise NotImplementedError
+
+    def pending(self, post_id):
+        """返回某帖子尚未写回数据库的浏览增量"""
+        raise NotImplementedError
+
+    def drain(self):
+        """取出并清空所有待写回的增量，返回 {post_id: n}"""
+        raise NotImplementedError
+
+    def record(self, post_id):
+        """记录一次浏览，达到写回条件时顺带写回"""
+        self.add(post_id)
+        with self._lock:
+            self._hits += 1
+            due = (self._hits >= self.flush_threshold
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """把缓冲的增量批量写回数据库，返回写回的帖子数"""
+        # 同一时刻只允许一个线程写回，其余线程直接跳过
+        if not self._flush_lock.acquire(blocking=False):
+            return 0
+        try:
+            with self._lock:
+                self._hits = 0
+                self._last_flush = time.monotonic()
+            deltas = self.drain()
+            self.write(deltas)
+            return len(deltas)
+        finally:
+            self._flush_lock.release()
+
+    def write(self, deltas):
+        """把 {post_id: n} 加到帖子的 view_count 上"""
+        if not deltas:
+            return
+
+        from .models import Post
+
+        # 增量相同的帖子合并成一条 UPDATE
+        by_delta = defaultdict(list)
+        for post_id, n in deltas.items():
+            by_delta[n].append(post_id)
+        for n, post_ids in by_delta.items():
+            Post.objects.filter(id__in=post_ids).update(view_count=F('view_count') + n)
+        refresh_scores(deltas)
+        views_flushed.send(sender=self.__class__, post_ids=list(deltas))
+
+
+class MemoryViewBuffer(BaseViewBuffer):
+    """进程内缓冲，适合单进程部署"""
+
+    def __init__(self, flush_interval, flush_threshold):
+        super().__init__(flush_interval, flush_threshold)
+        self._counts = defaultdict(int)
+
+    def add(self, post_id, n=1):
+        with self._lock:
+            self._counts[post_id] += n
+
+    def pending(self, post_id):
+        with self._lock:
+            return self._counts.get(post_id, 0)
+
+    def drain(self):
+        with self._lock:
+            counts, self._counts = dict(self._counts), defaultdict(int)
+        return counts
+
+
+class DatabaseViewBuffer(BaseViewBuffer):
+    """增量记在数据库的 tieba_pendingview 表里，多进程共享
+
+    记一次浏览、取出全部增量都是单条语句，由数据库保证原子性；写回时取出
+    与加到帖子上放在同一个事务里，中途失败时增量留在表里。
+    """
+
+    UPSERT_SQL = (
+        'INSERT INTO {table} (post_id, count) VALUES (%s, %s) '
+        'ON CONFLICT (post_id) DO UPDATE SET count = {table}.count + excluded.count'
+    )
+    DRAIN_SQL = 'DELETE FROM {table} RETURNING post_id, count'
+
+    def __init__(self, flush_interval, flush_threshold):
+        super().__init__(flush_interval, flush_threshold)
+        from .models import PendingView
+        self.model = PendingView
+        self.table = connection.ops.quote_name(PendingView._meta.db_table)
+
+    def add(self, post_id, n=1):
+        with connection.cursor() as cursor:
+            cursor.execute(self.UPSERT_SQL.format(table=self.table), [post_id, n])
+
+    def pending(self, post_id):
+        return self.model.objects.filter(post_id=post_id).values_list('count', flat=True).first() or 0
+
+    def drain(self):
+        with connection.cursor() as cursor:
+            cursor.execute(self.DRAIN_SQL.format(table=self.table))
+            return dict(cursor.fetchall())
+
+    def flush(self):
+        if not self.model.objects.exists():
+            # 没有待写回的增量时不开写事务
+            with self._lock:
+                self._hits = 0
+                self._last_flush = time.monotonic()
+            return 0
+        with transaction.atomic():
+            return super().flush()
+
+
+class CacheViewBuffer(BaseViewBuffer):
+    """基于 Django 缓存的缓冲，多进程共享同一份增量
+
+    每个帖子一个计数键；另维护一个"待写回帖子"集合键，只在帖子由无增量
+    变为有增量时登记，因此集合键的读写频率远低于浏览次数。计数和锁依赖
+    缓存的原子 incr/decr/add，只能用 Redis、Memcached（见 shared_cache）。
+    """
+
+    KEY_PREFIX = 'tieba:views:'
+    DIRTY_KEY = 'tieba:views:dirty'
+    LOCK_KEY = 'tieba:views:lock'
+
+    def __init__(self, flush_interval, flush_threshold, alias='counters'):
+        super().__init__(flush_interval, flush_threshold)
+        self.cache = shared_cache(alias)
+
+    def _key(self, post_id):
+        return f'{self.KEY_PREFIX}{post_id}'
+
+    def _acquire(self, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not self.cache.add(self.LOCK_KEY, 1, timeout=5):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _release(self):
+        self.cache.delete(self.LOCK_KEY)
+
+    def _mark_dirty(self, post_ids):
+        if not self._acquire():
+            return
+        try:
+            dirty = self.cache.get(self.DIRTY_KEY) or set()
+            dirty.update(post_ids)
+            self.cache.set(self.DIRTY_KEY, dirty, timeout=None)
+        finally:
+            self._release()
+
+    def add(self, post_id, n=1):
+        key = self._key(post_id)
+        self.cache.add(key, 0, timeout=None)
+        try:
+            value = self.cache.incr(key, n)
+        except ValueError:
+            # 键在 add 与 incr 之间被写回清除，重新建立
+            self.cache.set(key, n, timeout=None)
+            value = n
+        if value == n:
+            self._mark_dirty([post_id])
+
+    def pending(self, post_id):
+        return self.cache.get(self._key(post_id)) or 0
+
+    def drain(self):
+        if not self._acquire():
+            return {}
+        try:
+            dirty = self.cache.get(self.DIRTY_KEY) or set()
+            self.cache.set(self.DIRTY_KEY, set(), timeout=None)
+        finally:
+            self._release()
+        if not dirty:
+            return {}
+
+        keys = {self._key(post_id): post_id for post_id in dirty}
+        counts = {}
+        still_dirty = []
+        for key, value in self.cache.get_many(list(keys)).items():
+            if not value:
+                continue
+            # 只扣减读到的数量，写回期间的新增浏览会保留下来
+            remaining = self.cache.decr(key, value)
+            counts[keys[key]] = value
+            if remaining > 0:
+                still_dirty.append(keys[key])
+        if still_dirty:
+            self._mark_dirty(still_dirty)
+        return counts
+
+
+# incr/decr/add 在服务端原子执行的缓存后端；文件缓存的这些操作是先读后写，
+# 多个进程同时执行会互相覆盖
+ATOMIC_CACHES = (RedisCache, BaseMemcachedCache)
+
+
+def shared_cache(alias):
+    """返回可以存放浏览数增量的缓存：多进程共享、计数原子，且不与通用缓存共用"""
+    if alias not in settings.CACHES:
+        raise ImproperlyConfigured(f'TIEBA_VIEW_COUNTER 的 CACHE_ALIAS {alias!r} 不在 CACHES 中')
+    cache = caches[alias]
+    if not isinstance(cache, ATOMIC_CACHES):
+        raise ImproperlyConfigured(
+            f'浏览数 cache 后端需要计数原子的共享缓存（Redis、Memcached），{alias!r} 不是；'
+            "多进程部署请改用 database 后端，单进程部署用 memory 后端"
+        )
+    if alias == tieba_cache.get_config()['ALIAS']:
+        raise ImproperlyConfigured(
+            f'缓存 {alias!r} 与片段、限流等共用，淘汰键时会丢失浏览数，请为浏览数单独配置缓存别名'
+        )
+    return cache
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_view_buffer():
+    """返回按配置创建的全局浏览数缓冲"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                config = get_config()
+                if config['BACKEND'] == 'cache':
+                    _buffer = CacheViewBuffer(
+                        config['FLUSH_INTERVAL'], config['FLUSH_THRESHOLD'],
+                        alias=config['CACHE_ALIAS'],
+                    )
+                elif config['BACKEND'] == 'database':
+                    _buffer = DatabaseViewBuffer(config['FLUSH_INTERVAL'], config['FLUSH_THRESHOLD'])
+                else:
+                    _buffer = MemoryViewBuffer(config['FLUSH_INTERVAL'], config['FLUSH_THRESHOLD'])
+    return _buffer
+
+
+def record_view(post_id):
+    """记录一次帖子浏览"""
+    get_view_buffer().record(post_id)
+
+
+def pending_views(post_id):
+    """返回某帖子尚未写回的浏览数"""
+    return get_view_buffer().pending(post_id)
+
+
+def flush_views():
+    """立即写回所有缓冲的浏览数"""
+    return get_view_buffer().flush()
+
+
+def flush_on_exit():
+    """进程退出时写回本进程缓冲的浏览数（未记录过浏览的进程不做任何事）"""
+    if _buffer is not None:
+        _buffer.flush()
@@ -0,0 +1,8 @@
+"""为生产环境调优的 SQLite 数据库后端
+
+在 settings.DATABASES 中使用::
+
+    'ENGINE': 'tieba.db_backend'
+
+详见 base.py。
+"""
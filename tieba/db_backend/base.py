@@ -0,0 +1,115 @@
+"""调优过的 SQLite 后端
+
+默认的回滚日志模式下，写事务会阻塞所有读请求；Django 用 "BEGIN"（DEFERRED）
+开启事务，事务里先读后写时才去抢写锁，两个这样的事务互相等待时其中一个
+会立刻得到 "database is locked"，busy_timeout 也救不了。这里：
+
+- 新连接上开启 WAL 并设置同步级别、页缓存、内存映射和忙等待时间，读写互不阻塞；
+- 事务一律以 ``BEGIN IMMEDIATE`` 开始，开头就拿写锁，拿不到时按 busy_timeout 排队；
+- 不在事务中的单条语句（包括 BEGIN 本身）遇到锁冲突时按指数退避重试，
+  事务中途的语句不重试，由上层决定是否重做整个事务。
+
+配置示例（settings.py）::
+
+    TIEBA_SQLITE = {
+        'JOURNAL_MODE': 'WAL',
+        'SYNCHRONOUS': 'NORMAL',     # WAL 模式下 NORMAL 即可保证不损坏，只可能丢最后几个事务
+        'CACHE_SIZE': -64000,        # 负数表示 KiB，即 64MB 页缓存
+        'MMAP_SIZE': 256 * 1024 * 1024,
+        'BUSY_TIMEOUT': 5000,        # 毫秒
+        'TEMP_STORE': 'MEMORY',
+        'LOCK_RETRIES': 5,           # 锁冲突的重试次数
+        'RETRY_BACKOFF': 0.05,       # 首次重试前等待的秒数，之后逐次翻倍
+    }
+"""
+import random
+import sqlite3
+import time
+
+from django.conf import settings
+from django.db.backends.sqlite3 import base as sqlite_base
+
+DEFAULTS = {
+    'JOURNAL_MODE': 'WAL',
+    'SYNCHRONOUS': 'NORMAL',
+    'CACHE_SIZE': -64000,
+    'MMAP_SIZE': 256 * 1024 * 1024,
+    'BUSY_TIMEOUT': 5000,
+    'TEMP_STORE': 'MEMORY',
+    'LOCK_RETRIES': 5,
+    'RETRY_BACKOFF': 0.05,
+}
+
+LOCK_MESSAGES = ('database is locked', 'database table is locked')
+
+
+def get_config():
+    """读取 SQLite 配置，未配置的项使用默认值"""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'TIEBA_SQLITE', {}))
+    return config
+
+
+def is_lock_error(error):
+    return isinstance(error, sqlite3.OperationalError) and str(error).startswith(LOCK_MESSAGES)
+
+
+def retry_on_lock(func, retries, backoff):
+    """执行 func()，遇到锁冲突时按指数退避（带随机抖动）重试"""
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except sqlite3.OperationalError as error:
+            if attempt == retries or not is_lock_error(error):
+                raise
+            time.sleep(backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+
+class CursorWrapper(sqlite_base.SQLiteCursorWrapper):
+    """事务外的语句遇到锁冲突时重试"""
+
+    def execute(self, query, params=None):
+        if self.connection.in_transaction:
+            return super().execute(query, params)
+        config = get_config()
+        return retry_on_lock(
+            lambda: super(CursorWrapper, self).execute(query, params),
+            config['LOCK_RETRIES'], config['RETRY_BACKOFF'],
+        )
+
+    def executemany(self, query, param_list):
+        if self.connection.in_transaction:
+            return super().executemany(query, param_list)
+        # 参数可能是生成器，重试前先转成列表
+        param_list = list(param_list)
+        config = get_config()
+        return retry_on_lock(
+            lambda: super(CursorWrapper, self).executemany(query, param_list),
+            config['LOCK_RETRIES'], config['RETRY_BACKOFF'],
+        )
+
+
+class DatabaseWrapper(sqlite_base.DatabaseWrapper):
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        config = get_config()
+        conn.execute(f"PRAGMA busy_timeout = {int(config['BUSY_TIMEOUT'])}")
+        if config['JOURNAL_MODE']:
+            conn.execute(f"PRAGMA journal_mode = {config['JOURNAL_MODE']}")
+        if config['SYNCHRONOUS']:
+            conn.execute(f"PRAGMA synchronous = {config['SYNCHRONOUS']}")
+        if config['CACHE_SIZE']:
+            conn.execute(f"PRAGMA cache_size = {int(config['CACHE_SIZE'])}")
+        if config['MMAP_SIZE'] is not None:
+            conn.execute(f"PRAGMA mmap_size = {int(config['MMAP_SIZE'])}")
+        if config['TEMP_STORE']:
+            conn.execute(f"PRAGMA temp_store = {config['TEMP_STORE']}")
+        return conn
+
+    def create_cursor(self, name=None):
+        return self.connection.cursor(factory=CursorWrapper)
+
+    def _start_transaction_under_autocommit(self):
+        """以 BEGIN IMMEDIATE 开始事务，一开始就拿到写锁"""
+        self.cursor().execute('BEGIN IMMEDIATE')
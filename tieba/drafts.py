@@ -0,0 +1,224 @@
+"""草稿自动保存
+
+发帖页每隔几秒把改动过的字段提交到 ``autosave_draft``。第一次保存时创建
+一篇草稿（``is_draft=True``），之后每篇草稿每 ``INTERVAL`` 秒最多写一次
+数据库，只 UPDATE 改动过的列。间隔内的改动合并进缓存里的缓冲区，不写数据库；
+缓冲区由空变为有改动时（每个间隔一次）安排一次延迟写回，之后的改动只更新
+缓冲区。离开页面时前端带 ``flush`` 提交，连同缓冲的改动立即写回。
+
+延迟写回由谁执行取决于缓存能否跨进程读取：共享缓存（文件缓存等）时交给
+后台任务 ``drafts.flush``，由 ``run_jobs`` 读出缓冲写回；进程内缓存（locmem）
+时 ``run_jobs`` 读不到缓冲，改由本进程的定时器写回，进程退出时尚未写回的
+最多是最后一个间隔内的改动。
+
+草稿不进任何公开列表：首页、分类页、检索、热门等只查 ``is_draft=False``
+的行，对应的部分索引里也没有草稿（见 models.PUBLISHED）。``publish()``
+用一条带 ``is_draft=True`` 条件的 UPDATE 发布草稿，重复提交不会重复发布。
+
+配置示例（settings.py）::
+
+    TIEBA_DRAFTS = {
+        'INTERVAL': 10,               # 每篇草稿写数据库的最短间隔（秒）
+        'BUFFER_TIMEOUT': 24 * 3600,  # 缓冲区最长保留时间（秒）
+    }
+"""
+import json
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .cache import KEY_PREFIX, bump_version, get_cache, is_process_local
+from .models import Category, Post
+from .ranking import refresh_scores
+from . import feed, jobs, tags
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'INTERVAL': 10,
+    'BUFFER_TIMEOUT': 24 * 3600,
+}
+
+# 标题的最大长度，与 Post.title 一致
+TITLE_MAX_LENGTH = 200
+
+
+class DraftError(Exception):
+    """草稿不存在、不属于当前用户或提交的内容无效"""
+
+
+def get_config():
+    """读取草稿配置，未配置的项使用默认值"""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'TIEBA_DRAFTS', {}))
+    return config
+
+
+def _buffer_key(post_id):
+    return f'{KEY_PREFIX}:draft:{post_id}'
+
+
+def _saved_key(post_id):
+    return f'{KEY_PREFIX}:draft:{post_id}:saved'
+
+
+def clean(data):
+    """从表单中取出提交了的字段并校验，返回 {模型字段: 值}；未提交的字段不出现"""
+    changes = {}
+    if 'title' in data:
+        changes['title'] = data['title'].strip()[:TITLE_MAX_LENGTH]
+    if 'content' in data:
+        changes['content'] = data['content']
+    if data.get('category'):
+        category_id = data['category']
+        if not str(category_id).isdigit() or not Category.objects.filter(id=category_id).exists():
+            raise DraftError('分类不存在')
+        changes['category_id'] = int(category_id)
+    if 'tags' in data:
+        try:
+            changes['tags'] = tags.normalize(json.loads(data['tags'] or '[]'))
+        except (json.JSONDecodeError, TypeError):
+            raise DraftError('标签格式错误')
+    return changes
+
+
+def create(user, changes):
+    """第一次自动保存：创建草稿，未选分类时先放在第一个分类下"""
+    category_id = changes.get('category_id') or Category.objects.values_list('id', flat=True).first()
+    if category_id is None:
+        raise DraftError('还没有任何分类')
+    post = Post.objects.create(
+        author=user,
+        is_draft=True,
+        title=changes.get('title', ''),
+        content=changes.get('content', ''),
+        category_id=category_id,
+        tags=changes.get('tags', []),
+    )
+    # 刚写过一次，间隔内的保存先缓冲
+    get_cache().set(_saved_key(post.id), 1, timeout=get_config()['INTERVAL'])
+    return post
+
+
+def _write(post_id, fields):
+    """把缓冲的字段写入草稿，草稿已发布或已删除时返回 False"""
+    if not fields:
+        return True
+    return bool(
+        Post.objects.filter(id=post_id, is_draft=True, is_active=True)
+        .update(**fields, updated_at=timezone.now())
+    )
+
+
+def _schedule_flush(post_id, delay):
+    """安排 delay 秒后写回某草稿的缓冲"""
+    if is_process_local(get_cache()):
+        timer = threading.Timer(delay, _flush_in_thread, args=(post_id,))
+        timer.daemon = True
+        timer.start()
+    else:
+        jobs.enqueue(
+            'drafts.flush', {'post_id': post_id}, dedupe_key=f'draft:{post_id}',
+            run_at=timezone.now() + timedelta(seconds=delay),
+        )
+
+
+def _flush_in_thread(post_id):
+    close_old_connections()
+    try:
+        flush(post_id)
+    except Exception:
+        logger.exception('写回草稿 %s 失败', post_id)
+    finally:
+        close_old_connections()
+
+
+def save(user, post_id, changes, flush=False):
+    """合并一次自动保存，返回 (本次是否写入了数据库, 是否还有未写入的改动)"""
+    config = get_config()
+    cache = get_cache()
+    key = _buffer_key(post_id)
+    buffer = cache.get(key)
+    if buffer is None:
+        if not Post.objects.filter(id=post_id, author=user, is_draft=True, is_active=True).exists():
+            raise DraftError('草稿不存在')
+        buffer = {'author_id': user.id, 'fields': {}}
+    elif buffer['author_id'] != user.id:
+        raise DraftError('草稿不存在')
+
+    scheduled = bool(buffer['fields'])
+    buffer['fields'].update(changes)
+    if buffer['fields'] and (flush or cache.add(_saved_key(post_id), 1, timeout=config['INTERVAL'])):
+        if not _write(post_id, buffer['fields']):
+            cache.delete(key)
+            raise DraftError('草稿已发布或已删除')
+        cache.set(_saved_key(post_id), 1, timeout=config['INTERVAL'])
+        buffer['fields'] = {}
+        cache.set(key, buffer, timeout=config['BUFFER_TIMEOUT'])
+        return True, False
+
+    cache.set(key, buffer, timeout=config['BUFFER_TIMEOUT'])
+    if buffer['fields'] and not scheduled:
+        # 本间隔的第一处改动：安排一次延迟写回，之后的改动只更新缓冲区
+        _schedule_flush(post_id, config['INTERVAL'])
+    return False, bool(buffer['fields'])
+
+
+def flush(post_id):
+    """立即写回某草稿缓冲的改动，返回是否有改动写回"""
+    cache = get_cache()
+    key = _buffer_key(post_id)
+    buffer = cache.get(key)
+    if not buffer or not buffer['fields']:
+        return False
+    written = buffer['fields']
+    if not _write(post_id, written):
+        cache.delete(key)
+        return False
+    cache.set(_saved_key(post_id), 1, timeout=get_config()['INTERVAL'])
+    # 只清掉已写回的值：写回期间又缓冲的改动留给下一次写回
+    buffer = cache.get(key) or buffer
+    buffer['fields'] = {
+        name: value for name, value in buffer['fields'].items()
+        if name not in written or written[name] != value
+    }
+    cache.set(key, buffer, timeout=get_config()['BUFFER_TIMEOUT'])
+    if buffer['fields']:
+        _schedule_flush(post_id, get_config()['INTERVAL'])
+    return True
+
+
+def publish(user, post_id):
+    """发布草稿，返回发布后的帖子；草稿不存在或已发布时返回 None
+
+    缓冲中尚未写回的改动与发布合并为同一条 UPDATE，发布时间取当前时间。
+    """
+    cache = get_cache()
+    buffer = cache.get(_buffer_key(post_id))
+    pending = buffer['fields'] if buffer and buffer['author_id'] == user.id else {}
+    drafts = Post.objects.filter(id=post_id, author=user, is_draft=True, is_active=True)
+    current = drafts.values('title', 'content').first()
+    if current is None:
+        return None
+    current.update((name, pending[name]) for name in ('title', 'content') if name in pending)
+    if not current['title'] or not current['content'].strip():
+        raise DraftError('标题和内容不能为空')
+
+    now = timezone.now()
+    with transaction.atomic():
+        if not drafts.update(**pending, is_draft=False, created_at=now, updated_at=now):
+            return None
+        # UPDATE 不触发信号，这里补上发帖时信号做的事
+        refresh_scores([post_id])
+        post = Post.objects.get(id=post_id)
+        tags.sync_post(post)
+        jobs.enqueue('search.reindex', {'post_ids': [post_id]}, dedupe_key=f'search:{post_id}')
+        feed.fan_out_later(post_id)
+    # 已安排的延迟写回随后发现缓冲为空，什么也不做
+    cache.delete_many([_buffer_key(post_id), _saved_key(post_id)])
+    bump_version('posts')
+    return post
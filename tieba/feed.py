@@ -0,0 +1,280 @@
+"""关注动态
+
+用户可以关注其他用户和分类，动态页按发布时间倒序列出关注对象的新帖。
+直接查 ``author IN (...) OR category IN (...)`` 需要把每个关注对象的帖子
+合并排序，关注得越多越慢，所以采用推拉结合：
+
+- 推（写扩散）：帖子发布后由后台任务 ``feed.fanout`` 把帖子写进作者粉丝、
+  分类关注者的收件箱（``TimelineEntry``），动态页在
+  (user, -created_at, -post) 索引上做一次范围读取；
+- 拉（读合并）：粉丝数（分类为关注数）达到 ``FANOUT_LIMIT`` 的作者/分类
+  发帖时不扇出，读动态时从帖子表的 (author, -created_at, -id) /
+  (category, -created_at, -id) 部分索引各取一页，与收件箱按 (created_at, id) 合并。
+
+收件箱只保留每个用户最近的 ``MAX_ENTRIES`` 条，多出的由延迟任务
+``feed.trim`` 定期删除。新关注时把对方最近的 ``BACKFILL`` 篇帖子补进收件箱；
+取消关注时删除只因该关注对象而收到的条目。帖子被删除后条目保留，读时过滤。
+作者/分类跨过阈值只影响之后发布的帖子。
+
+配置示例（settings.py）::
+
+    TIEBA_FEED = {
+        'FANOUT_LIMIT': 1000,   # 粉丝数达到该值的作者/分类改为读时合并
+        'FANOUT_BATCH': 1000,   # 扇出时每批写入的收件箱数
+        'MAX_ENTRIES': 500,     # 每个用户的收件箱最多保留的条数
+        'BACKFILL': 50,         # 新关注时补入收件箱的帖子数
+        'TRIM_INTERVAL': 3600,  # 清理超长收件箱的间隔（秒）
+    }
+"""
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+
+from .models import Category, CategoryFollow, Follow, Post, TimelineEntry, UserProfile
+from .pagination import CursorPage, CursorPaginator, InvalidCursor, decode_cursor, encode_cursor
+from .queries import post_cards
+from . import jobs
+
+DEFAULTS = {
+    'FANOUT_LIMIT': 1000,
+    'FANOUT_BATCH': 1000,
+    'MAX_ENTRIES': 500,
+    'BACKFILL': 50,
+    'TRIM_INTERVAL': 3600,
+}
+
+# 关注对象类型 -> (关注模型, 关注者字段, 对象字段, 计数模型, 计数模型上的对象键, 帖子上的对象字段)
+SOURCES = {
+    'user': (Follow, 'follower', 'author', UserProfile, 'user_id', 'author_id'),
+    'category': (CategoryFollow, 'user', 'category', Category, 'id', 'category_id'),
+}
+
+# 收件箱和帖子表各自的排序键，最后一个键唯一
+ENTRY_ORDERING = ('-created_at', '-post_id')
+POST_ORDERING = ('-created_at', '-id')
+
+
+class FeedError(Exception):
+    """关注对象不存在或不能关注"""
+
+
+def get_config():
+    """读取动态配置，未配置的项使用默认值"""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'TIEBA_FEED', {}))
+    return config
+
+
+def _follower_count(source, target_id):
+    _, _, _, counter_model, key, _ = SOURCES[source]
+    return counter_model.objects.filter(**{key: target_id}).values_list('follower_count', flat=True).first()
+
+
+def is_pulled(source, target_id):
+    """该作者/分类的帖子是否改为读时合并"""
+    return (_follower_count(source, target_id) or 0) >= get_config()['FANOUT_LIMIT']
+
+
+def is_following(user, source, target_id):
+    follow_model, user_field, target_field, _, _, _ = SOURCES[source]
+    return follow_model.objects.filter(**{user_field: user, f'{target_field}_id': target_id}).exists()
+
+
+def toggle(user, source, target_id):
+    """切换关注状态，返回 (是否已关注, 最新关注数)"""
+    follow_model, user_field, target_field, counter_model, key, _ = SOURCES[source]
+    if source == 'user' and target_id == user.id:
+        raise FeedError('不能关注自己')
+    if _follower_count(source, target_id) is None:
+        raise FeedError('关注对象不存在')
+
+    lookup = {user_field: user, f'{target_field}_id': target_id}
+    with transaction.atomic():
+        deleted, _ = follow_model.objects.filter(**lookup).delete()
+        following = not deleted
+        if following:
+            try:
+                with transaction.atomic():
+                    follow_model.objects.create(**lookup)
+            except IntegrityError:
+                # 并发的重复关注，计数已由另一个请求增加
+                return True, _follower_count(source, target_id)
+        counter_model.objects.filter(**{key: target_id}).update(
+            follower_count=Greatest(F('follower_count') + (1 if following else -1), 0)
+        )
+        if following:
+            jobs.enqueue('feed.backfill', {'user_id': user.id, 'source': source, 'target_id': target_id},
+                         dedupe_key=f'feed:backfill:{user.id}:{source}:{target_id}')
+        else:
+            _remove_source(user.id, source, target_id)
+    return following, _follower_count(source, target_id)
+
+
+def _remove_source(user_id, source, target_id):
+    """取消关注后删除收件箱里只因该对象而收到的帖子（仍关注的另一类对象发的保留）"""
+    field = SOURCES[source][5]
+    other = 'category' if source == 'user' else 'user'
+    follow_model, user_field, target_field, _, _, other_field = SOURCES[other]
+    kept = follow_model.objects.filter(**{user_field: user_id}).values(f'{target_field}_id')
+    (
+        TimelineEntry.objects.filter(user_id=user_id, **{f'post__{field}': target_id})
+        .exclude(**{f'post__{other_field}__in': kept})
+        .delete()
+    )
+
+
+def _insert(user_ids, posts):
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=post.id, created_at=post.created_at)
+         for user_id in user_ids for post in posts],
+        ignore_conflicts=True,
+    )
+
+
+def _followers(source, target_id, batch_size):
+    """按关注者 id 分批取出某对象的关注者，走 (对象, 关注者) 唯一索引"""
+    follow_model, user_field, target_field, _, _, _ = SOURCES[source]
+    follows = follow_model.objects.filter(**{f'{target_field}_id': target_id}).order_by(f'{user_field}_id')
+    last_id = 0
+    while True:
+        user_ids = list(follows.filter(**{f'{user_field}_id__gt': last_id})
+                        .values_list(f'{user_field}_id', flat=True)[:batch_size])
+        if not user_ids:
+            return
+        yield user_ids
+        last_id = user_ids[-1]
+
+
+def fan_out(post_id):
+    """把新发布的帖子写进关注者的收件箱，返回写入的批数"""
+    post = (
+        Post.objects.filter(id=post_id, is_active=True, is_draft=False)
+        .only('id', 'author_id', 'category_id', 'created_at')
+        .first()
+    )
+    if post is None:
+        return 0
+    config = get_config()
+    batches = 0
+    for source in SOURCES:
+        target_id = getattr(post, SOURCES[source][5])
+        if is_pulled(source, target_id):
+            continue
+        for user_ids in _followers(source, target_id, config['FANOUT_BATCH']):
+            # 作者关注了帖子所在分类时不写给自己；同时关注作者和分类的由唯一约束去重
+            _insert([user_id for user_id in user_ids if user_id != post.author_id], [post])
+            batches += 1
+    if batches:
+        jobs.enqueue('feed.trim', dedupe_key='feed:trim', delay=config['TRIM_INTERVAL'])
+    return batches
+
+
+def fan_out_later(post_id):
+    jobs.enqueue('feed.fanout', {'post_id': post_id}, dedupe_key=f'feed:fanout:{post_id}')
+
+
+def backfill(user_id, source, target_id):
+    """新关注后把对方最近的帖子补进收件箱"""
+    if is_pulled(source, target_id) or not is_following(user_id, source, target_id):
+        return
+    field = SOURCES[source][5]
+    posts = list(
+        Post.objects.filter(is_active=True, is_draft=False, **{field: target_id})
+        .exclude(author_id=user_id)
+        .only('id', 'created_at')
+        .order_by(*POST_ORDERING)[:get_config()['BACKFILL']]
+    )
+    _insert([user_id], posts)
+    trim_user(user_id)
+
+
+def trim_user(user_id):
+    """只保留某用户收件箱中最近的 MAX_ENTRIES 条"""
+    max_entries = get_config()['MAX_ENTRIES']
+    entries = TimelineEntry.objects.filter(user_id=user_id)
+    boundary = list(entries.order_by(*ENTRY_ORDERING).values_list('created_at', 'post_id')[max_entries - 1:max_entries])
+    if not boundary:
+        return 0
+    created_at, post_id = boundary[0]
+    deleted, _ = entries.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, post_id__lt=post_id)).delete()
+    return deleted
+
+
+def trim():
+    """清理所有超长的收件箱，返回删除的条数"""
+    over = (
+        TimelineEntry.objects.order_by().values('user_id')
+        .annotate(n=Count('id')).filter(n__gt=get_config()['MAX_ENTRIES'])
+        .values_list('user_id', flat=True)
+    )
+    return sum(trim_user(user_id) for user_id in list(over))
+
+
+def pulled_sources(user):
+    """用户关注的、改为读时合并的作者和分类"""
+    limit = get_config()['FANOUT_LIMIT']
+    authors = Follow.objects.filter(follower=user, author__userprofile__follower_count__gte=limit)
+    categories = CategoryFollow.objects.filter(user=user, category__follower_count__gte=limit)
+    return (
+        list(authors.values_list('author_id', flat=True)),
+        list(categories.values_list('category_id', flat=True)),
+    )
+
+
+def _parse_cursor(cursor):
+    """游标解析为 (发布时间, 帖子 id)，无效时返回 None"""
+    if not cursor:
+        return None
+    try:
+        values, _ = decode_cursor(cursor)
+        created_at, post_id = values
+        return [Post._meta.get_field('created_at').to_python(created_at), int(post_id)]
+    except (InvalidCursor, ValidationError, TypeError, ValueError):
+        return None
+
+
+def load_page(user, cursor=None, per_page=20):
+    """动态页的一页帖子卡片，只支持向后翻页；游标无效时返回第一页"""
+    values = _parse_cursor(cursor)
+
+    def fetch(queryset, ordering):
+        rows = CursorPaginator(queryset, ordering, per_page).fetch(values, False, per_page + 1)
+        return [(row.created_at, getattr(row, ordering[-1].lstrip('-'))) for row in rows]
+
+    # 收件箱：一次索引范围读取
+    keys = fetch(TimelineEntry.objects.filter(user=user).only('created_at', 'post_id'), ENTRY_ORDERING)
+
+    # 粉丝多的作者和热门分类：各走帖子表的部分索引取一页后合并，同一帖子只保留一次
+    authors, categories = pulled_sources(user)
+    if authors or categories:
+        published = Post.objects.filter(is_active=True, is_draft=False).only('id', 'created_at')
+        for author_id in authors:
+            keys += fetch(published.filter(author_id=author_id), POST_ORDERING)
+        for category_id in categories:
+            keys += fetch(published.filter(category_id=category_id), POST_ORDERING)
+        merged = {post_id: created_at for created_at, post_id in keys}
+        keys = sorted(((created_at, post_id) for post_id, created_at in merged.items()), reverse=True)
+
+    has_next = len(keys) > per_page
+    keys = keys[:per_page]
+    cards = post_cards(Post.objects.filter(is_active=True, is_draft=False)).in_bulk([post_id for _, post_id in keys])
+    next_cursor = encode_cursor(list(keys[-1]), 'next') if has_next else None
+    return CursorPage([cards[post_id] for _, post_id in keys if post_id in cards], next_cursor)
+
+
+def rebuild_timelines(user_ids=None):
+    """按当前的关注关系重建收件箱（迁移、调整阈值后使用），返回处理的用户数"""
+    users = Follow.objects.values_list('follower_id', flat=True).union(
+        CategoryFollow.objects.values_list('user_id', flat=True)
+    )
+    user_ids = sorted(set(users) if user_ids is None else user_ids)
+    for user_id in user_ids:
+        with transaction.atomic():
+            TimelineEntry.objects.filter(user_id=user_id).delete()
+            for follow in Follow.objects.filter(follower_id=user_id).values_list('author_id', flat=True):
+                backfill(user_id, 'user', follow)
+            for follow in CategoryFollow.objects.filter(user_id=user_id).values_list('category_id', flat=True):
+                backfill(user_id, 'category', follow)
+    return len(user_ids)
@@ -0,0 +1,177 @@
+"""帖子片段缓存
+
+列表页的每张帖子卡片、详情页的正文都是同样的输入渲染出同样的 HTML，
+这里把渲染结果按帖子缓存起来。缓存键由帖子 id 和片段"版本"组成：
+版本取自 ``updated_at`` 以及卡片上显示的点赞数、分类名等，帖子被编辑或这些
+内容变化后键随之改变，旧片段自然过期，不必逐个删除。
+
+浏览数变化最频繁（每次写回浏览数都会变），不计入版本：模板里用
+``{{ views_slot }}`` 占位，取出片段后再换成当前的浏览数。只有"热门"
+标识是否显示（浏览数是否超过 ``HOT_VIEW_COUNT``）计入版本。
+
+片段数量多、保留时间长，使用单独的缓存别名（``ALIAS``，默认 ``fragments``），
+不会把缓存版本号、限流令牌桶等挤出通用缓存。
+
+一页列表只发一次 ``get_many``，只渲染缺失的片段，再用一次 ``set_many``
+写回。命中数、未命中数和渲染耗时累计在缓存里，``fragment_stats`` 命令
+据此给出命中率和节省的渲染时间。
+
+配置示例（settings.py）::
+
+    TIEBA_FRAGMENTS = {
+        'ENABLED': True,
+        'ALIAS': 'fragments',   # 使用 CACHES 中的哪个缓存，没有该别名时用通用缓存
+        'TIMEOUT': 24 * 3600,   # 片段最长保留时间（秒）
+        'VERSION': 1,           # 修改卡片模板后加一，使所有旧片段失效
+    }
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.defaultfilters import linebreaks_filter
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from .cache import KEY_PREFIX
+from . import cache as tieba_cache
+
+DEFAULTS = {
+    'ENABLED': True,
+    'ALIAS': 'fragments',
+    'TIMEOUT': 24 * 3600,
+    'VERSION': 1,
+}
+
+# 命中统计的键，渲染耗时以微秒计
+STAT_KEYS = {name: f'{KEY_PREFIX}:frag:stats:{name}' for name in ('hits', 'misses', 'render_us')}
+
+# 片段里浏览数的占位符，取出片段后替换
+VIEWS_SLOT = '<!--tieba:views-->'
+
+# 卡片显示"热门"标识的浏览数，与 post_card.html 一致
+HOT_VIEW_COUNT = 1000
+
+
+def get_config():
+    """读取片段缓存配置，未配置的项使用默认值"""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'TIEBA_FRAGMENTS', {}))
+    return config
+
+
+def get_cache():
+    """片段使用的缓存：配置了单独的别名就用它，否则用通用缓存"""
+    alias = get_config()['ALIAS']
+    return caches[alias] if alias in settings.CACHES else tieba_cache.get_cache()
+
+
+def post_version(post, *extra):
+    """卡片内容的版本：编辑时间加上卡片上显示的计数和关联名称（浏览数除外，见 VIEWS_SLOT）"""
+    parts = (
+        post.updated_at.timestamp() if post.updated_at else 0, post.view_count > HOT_VIEW_COUNT, post.like_count,
+        post.is_pinned, post.is_draft, post.category.name, post.author.username, *extra,
+    )
+    return hashlib.md5(repr(parts).encode()).hexdigest()[:12]
+
+
+def _key(kind, post_id, version):
+    return f"{KEY_PREFIX}:frag:{kind}:v{get_config()['VERSION']}:{post_id}:{version}"
+
+
+def _record(hits, misses, render_seconds):
+    cache = get_cache()
+    for name, delta in (('hits', hits), ('misses', misses), ('render_us', int(render_seconds * 1e6))):
+        if not delta:
+            continue
+        key = STAT_KEYS[name]
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            cache.set(key, delta, timeout=None)
+
+
+def _fill_views(html, post):
+    return html.replace(VIEWS_SLOT, str(post.view_count))
+
+
+def render_posts(posts, template_name, version=None, **context):
+    """渲染一组帖子片段并拼接，已缓存的片段直接取用
+
+    模板里可用的变量是 ``post`` 和 context 中的其他值；片段内容只能依赖
+    这些变量，不能依赖当前用户或请求。version(post) 可返回额外的版本部分
+    （如检索页的高亮结果）。
+    """
+    posts = list(posts)
+    if not posts:
+        return ''
+    template = get_template(template_name)
+    config = get_config()
+    context['views_slot'] = mark_safe(VIEWS_SLOT)
+    if not config['ENABLED']:
+        rendered = [template.render({'post': post, **context}) for post in posts]
+        return mark_safe(''.join(_fill_views(html, post) for post, html in zip(posts, rendered)))
+
+    cache = get_cache()
+    kind = template_name.rsplit('/', 1)[-1].split('.', 1)[0]
+    keys = [
+        _key(kind, post.pk, post_version(post, *(version(post) if version else ())))
+        for post in posts
+    ]
+    found = cache.get_many(keys)
+
+    rendered, missing = [], {}
+    started = time.perf_counter()
+    for post, key in zip(posts, keys):
+        html = found.get(key)
+        if html is None:
+            html = missing[key] = template.render({'post': post, **context})
+        rendered.append(_fill_views(html, post))
+    elapsed = time.perf_counter() - started if missing else 0
+
+    if missing:
+        cache.set_many(missing, timeout=config['TIMEOUT'])
+    _record(len(posts) - len(missing), len(missing), elapsed)
+    return mark_safe(''.join(rendered))
+
+
+def post_body(post):
+    """帖子正文的 HTML（linebreaks 处理后），按编辑时间缓存"""
+    config = get_config()
+    if not config['ENABLED']:
+        return linebreaks_filter(post.content, autoescape=True)
+    cache = get_cache()
+    version = int(post.updated_at.timestamp() * 1000) if post.updated_at else 0
+    key = _key('body', post.pk, version)
+    html = cache.get(key)
+    if html is not None:
+        _record(1, 0, 0)
+        return mark_safe(html)
+    started = time.perf_counter()
+    html = linebreaks_filter(post.content, autoescape=True)
+    elapsed = time.perf_counter() - started
+    cache.set(key, str(html), timeout=config['TIMEOUT'])
+    _record(0, 1, elapsed)
+    return html
+
+
+def stats():
+    """累计的命中数、未命中数、命中率和估算节省的渲染时间（毫秒）"""
+    values = get_cache().get_many(list(STAT_KEYS.values()))
+    hits, misses, render_us = (values.get(STAT_KEYS[name], 0) for name in ('hits', 'misses', 'render_us'))
+    total = hits + misses
+    average_ms = render_us / misses / 1000 if misses else 0
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0,
+        'render_ms': render_us / 1000,
+        'average_render_ms': average_ms,
+        'saved_ms': hits * average_ms,
+    }
+
+
+def reset_stats():
+    get_cache().delete_many(list(STAT_KEYS.values()))
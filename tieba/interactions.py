@@ -0,0 +1,128 @@
+"""点赞、收藏的原子切换
+
+点赞/收藏记录的插入和删除本身就是"条件操作"：插入撞上唯一约束说明已经
+点过，删除影响 0 行说明本来就没点。计数只在记录真正插入或删除时用
+``F()`` 加减，并且只更新计数这一列，不再整行保存，两次并发点击也不会把
+计数算错或减成负数。
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Comment, Favorite, Like, Post
+from .ranking import refresh_scores_later
+
+ACTIONS = ('like', 'unlike', 'toggle')
+
+# 目标类型 -> (计数所在模型, 记录模型, 记录中指向目标的外键, 计数字段)
+TARGETS = {
+    'post': (Post, Like, 'post_id', 'like_count'),
+    'comment': (Comment, Like, 'comment_id', 'like_count'),
+    'favorite': (Post, Favorite, 'post_id', 'favorite_count'),
+}
+
+
+def _insert(record_model, **fields):
+    """插入一条记录，已存在时返回 False"""
+    try:
+        with transaction.atomic():
+            record_model.objects.create(**fields)
+    except IntegrityError:
+        return False
+    return True
+
+
+def _apply(user, target, target_id, action):
+    """在当前事务中执行一次操作，返回操作后是否处于已点赞/收藏状态"""
+    counter_model, record_model, fk, counter = TARGETS[target]
+    lookup = {'user': user, fk: target_id}
+
+    if action in ('unlike', 'toggle'):
+        deleted, _ = record_model.objects.filter(**lookup).delete()
+        if deleted:
+            counter_model.objects.filter(id=target_id, **{f'{counter}__gt': 0}).update(
+                **{counter: F(counter) - 1}
+            )
+            return False
+        if action == 'unlike':
+            return False
+
+    if _insert(record_model, **lookup):
+        counter_model.objects.filter(id=target_id).update(**{counter: F(counter) + 1})
+    return True
+
+
+def _counts(target, target_ids):
+    counter_model, _, _, counter = TARGETS[target]
+    return dict(counter_model.objects.filter(id__in=target_ids).values_list('id', counter))
+
+
+def toggle(user, target, target_id):
+    """切换点赞/收藏状态，返回 (是否已点赞/收藏, 最新计数)"""
+    with transaction.atomic():
+        active = _apply(user, target, target_id, 'toggle')
+    if TARGETS[target][0] is Post:
+        refresh_scores_later([target_id])
+    return active, _counts(target, [target_id]).get(target_id, 0)
+
+
+def apply_batch(user, operations):
+    """在一个事务中执行多项操作
+
+    operations 形如 ``[{'type': 'post', 'id': 1, 'action': 'like'}, ...]``，
+    返回与之一一对应的结果列表。目标不存在或已删除的操作返回 error。
+    """
+    parsed = []
+    for op in operations:
+        if not isinstance(op, dict):
+            parsed.append(None)
+            continue
+        target, action = op.get('type'), op.get('action', 'toggle')
+        try:
+            target_id = int(op.get('id'))
+        except (TypeError, ValueError):
+            target_id = None
+        if target not in TARGETS or action not in ACTIONS or target_id is None:
+            parsed.append(None)
+        else:
+            parsed.append((target, target_id, action))
+
+    # 一次查出所有有效目标
+    valid = {
+        'post': set(Post.objects.filter(
+            id__in=[p[1] for p in parsed if p and p[0] != 'comment'], is_active=True, is_draft=False
+        ).values_list('id', flat=True)),
+        'comment': set(Comment.objects.filter(
+            id__in=[p[1] for p in parsed if p and p[0] == 'comment'], is_active=True
+        ).values_list('id', flat=True)),
+    }
+
+    states = []
+    touched = {target: set() for target in TARGETS}
+    with transaction.atomic():
+        for item in parsed:
+            if item is None:
+                states.append(None)
+                continue
+            target, target_id, action = item
+            if target_id not in valid['comment' if target == 'comment' else 'post']:
+                states.append(None)
+                continue
+            states.append(_apply(user, target, target_id, action))
+            touched[target].add(target_id)
+
+    refresh_scores_later(touched['post'] | touched['favorite'])
+    counts = {target: _counts(target, ids) for target, ids in touched.items() if ids}
+
+    results = []
+    for item, active in zip(parsed, states):
+        if active is None:
+            results.append({'error': 'invalid'})
+            continue
+        target, target_id, action = item
+        results.append({
+            'type': target,
+            'id': target_id,
+            'active': active,
+            'count': counts[target].get(target_id, 0),
+        })
+    return results
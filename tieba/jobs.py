@@ -0,0 +1,264 @@
+"""后台任务队列
+
+没有消息队列服务可用，任务直接存进现有数据库的 ``tieba_job`` 表：视图里
+``enqueue()`` 只写入一行就返回，``run_jobs`` 命令按优先级和计划时间成批
+认领，交给进程池执行。任务和业务数据写在同一个事务里，事务回滚时任务也
+随之撤销，提交后才对 worker 可见。
+
+- 优先级：数值大的先执行；
+- 计划时间：``delay`` / ``run_at`` 指定最早执行时间；
+- 去重：同一 ``dedupe_key`` 只保留一个等待中的任务，重复入队时合并为一个
+  （取较早的计划时间和较高的优先级），适合"重算某帖子分数"这类只需最后
+  执行一次的任务；
+- 重试：任务抛出异常后按指数退避重新排队，超过次数后标记为失败；
+- 认领租约：认领的任务超过 ``LEASE`` 秒仍未结束（worker 被杀）时会被
+  重新认领。
+
+任务用 ``@task`` 注册（见 tasks.py），worker 进程启动时随应用加载。
+
+配置示例（settings.py）::
+
+    TIEBA_JOBS = {
+        'EAGER': False,       # True 时不入库，事务提交后在当前进程直接执行（开发环境用）；
+                              # 指定了未来计划时间的任务仍入库，等 run_jobs 到期执行
+        'BATCH_SIZE': 20,     # worker 每次认领的任务数
+        'POLL_INTERVAL': 1,   # 队列为空时的轮询间隔（秒）
+        'LEASE': 600,         # 认领租约（秒）
+        'MAX_ATTEMPTS': 5,    # 默认最多执行次数
+        'RETRY_DELAY': 10,    # 首次重试的延迟（秒），之后每次翻倍
+        'KEEP_DONE': 86400,   # 已完成的任务保留多久（秒）
+    }
+"""
+import logging
+import os
+import random
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Avg, Count, DateTimeField, DurationField, ExpressionWrapper, F, Min, Q, Value
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'EAGER': False,
+    'BATCH_SIZE': 20,
+    'POLL_INTERVAL': 1,
+    'LEASE': 600,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_DELAY': 10,
+    'KEEP_DONE': 24 * 3600,
+}
+
+# 任务名 -> (函数, 最多执行次数)
+_registry = {}
+
+
+def get_config():
+    """读取任务队列配置，未配置的项使用默认值"""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'TIEBA_JOBS', {}))
+    return config
+
+
+def task(name, max_attempts=None):
+    """注册任务函数，任务参数以关键字参数传入，必须能序列化为 JSON"""
+    def decorator(func):
+        _registry[name] = (func, max_attempts)
+        return func
+    return decorator
+
+
+def enqueue(name, kwargs=None, priority=0, dedupe_key=None, delay=0, run_at=None):
+    """把任务加入队列，返回任务对象；与已有等待中的任务合并时返回 None"""
+    if name not in _registry:
+        raise KeyError(f'未注册的任务：{name}')
+    kwargs = kwargs or {}
+    config = get_config()
+    now = timezone.now()
+    run_at = run_at or now + timedelta(seconds=delay)
+    if config['EAGER'] and run_at <= now:
+        transaction.on_commit(lambda: execute(name, kwargs, log=True))
+        return None
+
+    max_attempts = _registry[name][1] or config['MAX_ATTEMPTS']
+    while True:
+        if dedupe_key is not None:
+            pending = Job.objects.filter(dedupe_key=dedupe_key, status=Job.PENDING)
+            current = pending.values('run_at', 'priority').first()
+            if current is not None:
+                if current['run_at'] <= run_at and current['priority'] >= priority:
+                    # 已有任务不晚于、不低于本次，什么都不用写
+                    return None
+                # 合并到已有任务：计划时间取较早的，优先级取较高的，一条 UPDATE 完成
+                if pending.filter(Q(run_at__gt=run_at) | Q(priority__lt=priority)).update(
+                    run_at=Least(F('run_at'), Value(run_at, output_field=DateTimeField())),
+                    priority=Greatest(F('priority'), Value(priority)),
+                ):
+                    return None
+                # 已有任务刚被认领，重新入队
+                continue
+        try:
+            with transaction.atomic():
+                return Job.objects.create(
+                    name=name, kwargs=kwargs, priority=priority, dedupe_key=dedupe_key,
+                    run_at=run_at, max_attempts=max_attempts,
+                )
+        except IntegrityError:
+            # 并发入队时另一个同键任务抢先写入，回头合并到它
+            continue
+
+
+def execute(name, kwargs, log=False):
+    """执行一个任务，成功返回 None，失败返回错误信息"""
+    close_old_connections()
+    try:
+        _registry[name][0](**kwargs)
+        return None
+    except Exception:
+        if log:
+            logger.exception('任务 %s 执行失败', name)
+        return traceback.format_exc()
+    finally:
+        close_old_connections()
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _requeue(job_id, **fields):
+    """把任务放回等待队列；已有同键的等待中任务时并入它，本任务直接结束"""
+    try:
+        with transaction.atomic():
+            Job.objects.filter(id=job_id).update(status=Job.PENDING, locked_by='', locked_until=None, **fields)
+    except IntegrityError:
+        Job.objects.filter(id=job_id).update(
+            status=Job.DONE, finished_at=timezone.now(), locked_by='', locked_until=None, **fields,
+        )
+
+
+def _reclaim_expired(now):
+    """回收认领到期的任务：还能重试的放回队列，否则标记为失败"""
+    expired = Job.objects.filter(status=Job.RUNNING, locked_until__lt=now)
+    expired.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, finished_at=now, last_error='执行超时（worker 可能已退出）',
+    )
+    for job_id in expired.values_list('id', flat=True):
+        _requeue(job_id, last_error='执行超时（worker 可能已退出），重新排队')
+
+
+def claim(worker, limit):
+    """认领一批到期的任务，返回任务列表
+
+    SQLite 后端的事务以 BEGIN IMMEDIATE 开始，同一时刻只有一个 worker 在认领；
+    支持 SKIP LOCKED 的数据库上多个 worker 跳过彼此锁住的行。
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        _reclaim_expired(now)
+        ready = Job.objects.filter(status=Job.PENDING, run_at__lte=now).order_by('-priority', 'run_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            ready = ready.select_for_update(skip_locked=True)
+        jobs = list(ready.only('id', 'name', 'kwargs', 'attempts', 'max_attempts', 'run_at')[:limit])
+        if jobs:
+            Job.objects.filter(id__in=[job.id for job in jobs]).update(
+                status=Job.RUNNING, locked_by=worker, started_at=now,
+                locked_until=now + timedelta(seconds=get_config()['LEASE']),
+                attempts=F('attempts') + 1,
+            )
+    for job in jobs:
+        job.attempts += 1
+    return jobs
+
+
+def release(jobs):
+    """把已认领但未执行的任务放回队列，不计入执行次数"""
+    for job in jobs:
+        _requeue(job.id, attempts=F('attempts') - 1)
+
+
+def finish(job, error=None):
+    """记录任务结果：成功标记完成，失败则按指数退避重新排队或标记为失败"""
+    now = timezone.now()
+    if error is None:
+        Job.objects.filter(id=job.id).update(status=Job.DONE, finished_at=now, locked_by='', locked_until=None)
+    elif job.attempts >= job.max_attempts:
+        Job.objects.filter(id=job.id).update(
+            status=Job.FAILED, finished_at=now, last_error=error, locked_by='', locked_until=None,
+        )
+        logger.error('任务 %s 执行 %s 次均失败：%s', job, job.attempts, error)
+    else:
+        delay = get_config()['RETRY_DELAY'] * 2 ** (job.attempts - 1) * random.uniform(0.8, 1.2)
+        _requeue(job.id, run_at=now + timedelta(seconds=delay), last_error=error)
+
+
+def retry(queryset):
+    """把失败的任务重新排队并清零执行次数，返回排队的任务数"""
+    job_ids = list(queryset.filter(status=Job.FAILED).values_list('id', flat=True))
+    for job_id in job_ids:
+        _requeue(job_id, attempts=0, run_at=timezone.now(), finished_at=None)
+    return len(job_ids)
+
+
+def purge(chunk_size=1000):
+    """删除保留期之前完成的任务，返回删除的行数"""
+    cutoff = timezone.now() - timedelta(seconds=get_config()['KEEP_DONE'])
+    total = 0
+    while True:
+        ids = list(
+            Job.objects.filter(status=Job.DONE, finished_at__lt=cutoff)
+            .values_list('id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return total
+        total += Job.objects.filter(id__in=ids).delete()[0]
+
+
+def stats(window=3600):
+    """队列状态：各任务的积压数、最老任务的等待时间，以及最近 window 秒内的执行耗时"""
+    now = timezone.now()
+    rows = {}
+    counts = (
+        Job.objects.filter(status__in=[Job.PENDING, Job.RUNNING, Job.FAILED])
+        .values('name')
+        .annotate(
+            ready=Count('id', filter=Q(status=Job.PENDING, run_at__lte=now)),
+            scheduled=Count('id', filter=Q(status=Job.PENDING, run_at__gt=now)),
+            running=Count('id', filter=Q(status=Job.RUNNING)),
+            failed=Count('id', filter=Q(status=Job.FAILED)),
+            oldest=Min('run_at', filter=Q(status=Job.PENDING, run_at__lte=now)),
+        )
+    )
+    for row in counts:
+        oldest = row.pop('oldest')
+        row['oldest_wait'] = (now - oldest).total_seconds() if oldest else 0
+        rows[row['name']] = row
+
+    recent = (
+        Job.objects.filter(status=Job.DONE, finished_at__gte=now - timedelta(seconds=window))
+        .values('name')
+        .annotate(
+            done=Count('id'),
+            wait=Avg(ExpressionWrapper(F('started_at') - F('run_at'), output_field=DurationField())),
+            run=Avg(ExpressionWrapper(F('finished_at') - F('started_at'), output_field=DurationField())),
+        )
+    )
+    for row in recent:
+        entry = rows.setdefault(row['name'], {
+            'name': row['name'], 'ready': 0, 'scheduled': 0, 'running': 0, 'failed': 0, 'oldest_wait': 0,
+        })
+        entry['done'] = row['done']
+        entry['avg_wait'] = row['wait'].total_seconds() if row['wait'] else 0
+        entry['avg_run'] = row['run'].total_seconds() if row['run'] else 0
+    for entry in rows.values():
+        entry.setdefault('done', 0)
+        entry.setdefault('avg_wait', 0)
+        entry.setdefault('avg_run', 0)
+    return sorted(rows.values(), key=lambda entry: entry['name'])
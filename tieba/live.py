@@ -0,0 +1,362 @@
+"""帖子详情页的实时更新
+
+新评论、评论删除、点赞/收藏/评论/浏览计数的变化由模型信号在事务提交后
+发布到按帖子划分的频道，``post_events`` 视图以 Server-Sent Events 推送给
+正在看该帖子的读者，浏览器据此局部更新页面，不再整页刷新。
+
+每个事件带有全局递增的 id，频道保留最近若干条事件：浏览器断线重连时带上
+``Last-Event-ID``，服务端补发错过的事件；错过的事件已被淘汰时发送
+``reset``，提示读者刷新页面。
+
+长连接只在 ASGI 下保持：等待中的连接只是事件循环里的一个协程和一个
+``asyncio.Event``，不占用线程。WSGI 部署或长连接数达到上限时，视图发送
+积压的事件后立即结束响应，并通过 ``retry`` 让浏览器隔一段时间再来取，
+即退化为轮询。
+
+配置示例（settings.py）::
+
+    TIEBA_LIVE = {
+        'BACKEND': 'memory',       # memory: 进程内频道；cache: Django 缓存（多进程共享）
+        'CACHE_ALIAS': 'default',
+        'HISTORY': 100,            # 每个帖子保留最近 N 条事件，用于断线补发
+        'MAX_CHANNELS': 10000,     # memory 后端最多保留多少个帖子的频道
+        'MAX_STREAMS': 5000,       # 本进程同时保持的长连接上限，超出后退化为轮询
+        'STREAM_TIMEOUT': 300,     # 单个长连接最长保持秒数，到期后浏览器自动重连
+        'KEEPALIVE': 15,           # 空闲时发送心跳的间隔秒数
+        'POLL_INTERVAL': 10,       # 退化为轮询时浏览器的重连间隔秒数
+        'CACHE_POLL_INTERVAL': 1,  # cache 后端中长连接检查新事件的间隔秒数
+    }
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.formats import date_format
+
+DEFAULTS = {
+    'BACKEND': 'memory',
+    'CACHE_ALIAS': 'default',
+    'HISTORY': 100,
+    'MAX_CHANNELS': 10000,
+    'MAX_STREAMS': 5000,
+    'STREAM_TIMEOUT': 300,
+    'KEEPALIVE': 15,
+    'POLL_INTERVAL': 10,
+    'CACHE_POLL_INTERVAL': 1,
+}
+
+
+def get_config():
+    """读取实时更新配置，未配置的项使用默认值"""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'TIEBA_LIVE', {}))
+    return config
+
+
+def encode_event(event):
+    """编码为一条 SSE 消息"""
+    data = json.dumps(event['data'], ensure_ascii=False, cls=DjangoJSONEncoder)
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {data}\n\n"
+
+
+class BaseHub:
+    """事件频道基类，负责长连接计数和重连时的缺口判断"""
+
+    def __init__(self, history, max_streams):
+        self.history = history
+        self.max_streams = max_streams
+        self._streams = 0
+        self._streams_lock = threading.Lock()
+
+    def latest_id(self):
+        """返回当前最新的事件 id，页面渲染时作为订阅起点"""
+        raise NotImplementedError
+
+    def publish(self, post_id, event, data):
+        raise NotImplementedError
+
+    def _load(self, post_id):
+        """返回 (最新事件 id, 频道已淘汰的最大事件 id, 频道内的事件列表)"""
+        raise NotImplementedError
+
+    async def wait(self, post_id, last_id, timeout):
+        """等待 last_id 之后的新事件，超时返回空列表"""
+        raise NotImplementedError
+
+    def since(self, post_id, last_id):
+        """返回 last_id 之后的事件；错过的事件无法补发时返回一条 reset"""
+        latest, floor, events = self._load(post_id)
+        if last_id > latest or last_id < floor:
+            # 序号比当前还大说明服务重启（或缓存被清空）过；小于 floor 说明中间的事件已被淘汰
+            return [{'id': latest, 'event': 'reset', 'data': {}}]
+        return [event for event in events if event['id'] > last_id]
+
+    def open_stream(self):
+        """占用一个长连接名额，名额用完返回 False"""
+        with self._streams_lock:
+            if self._streams >= self.max_streams:
+                return False
+            self._streams += 1
+            return True
+
+    def close_stream(self):
+        with self._streams_lock:
+            self._streams -= 1
+
+
+class Channel:
+    __slots__ = ('events', 'floor', 'waiters')
+
+    def __init__(self, history):
+        self.events = deque(maxlen=history)
+        self.floor = 0
+        self.waiters = set()
+
+
+class MemoryHub(BaseHub):
+    """进程内频道，适合单进程部署
+
+    发布方可以在任意线程（同步视图、信号）中调用 ``publish``，通过
+    ``call_soon_threadsafe`` 唤醒各事件循环里等待该帖子的连接。
+    """
+
+    def __init__(self, history, max_streams, max_channels):
+        super().__init__(history, max_streams)
+        self.max_channels = max_channels
+        self._channels = OrderedDict()
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def latest_id(self):
+        return self._seq
+
+    def publish(self, post_id, event, data):
+        with self._lock:
+            self._seq += 1
+            channel = self._channels.get(post_id)
+            if channel is None:
+                channel = self._channels[post_id] = Channel(self.history)
+                self._evict(keep=post_id)
+            else:
+                self._channels.move_to_end(post_id)
+            if len(channel.events) == channel.events.maxlen:
+                channel.floor = channel.events[0]['id']
+            channel.events.append({'id': self._seq, 'event': event, 'data': data})
+            waiters = list(channel.waiters)
+        for loop, flag in waiters:
+            try:
+                loop.call_soon_threadsafe(flag.set)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    def _evict(self, keep):
+        """频道过多时淘汰最久没有新事件、也没有连接在等待的频道"""
+        while len(self._channels) > self.max_channels:
+            for post_id, channel in self._channels.items():
+                if post_id != keep and not channel.waiters:
+                    del self._channels[post_id]
+                    break
+            else:
+                return
+
+    def _load(self, post_id):
+        with self._lock:
+            channel = self._channels.get(post_id)
+            if channel is None:
+                return self._seq, 0, []
+            return self._seq, channel.floor, list(channel.events)
+
+    async def wait(self, post_id, last_id, timeout):
+        events = self.since(post_id, last_id)
+        if events or timeout <= 0:
+            return events
+
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            channel = self._channels.get(post_id)
+            if channel is None:
+                channel = self._channels[post_id] = Channel(self.history)
+                self._evict(keep=post_id)
+            channel.waiters.add(waiter)
+        try:
+            # 登记之前发布的事件不会唤醒本连接，登记后再检查一次
+            events = self.since(post_id, last_id)
+            if not events:
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), timeout)
+                except asyncio.TimeoutError:
+                    return []
+                events = self.since(post_id, last_id)
+        finally:
+            with self._lock:
+                channel.waiters.discard(waiter)
+        return events
+
+
+class CacheHub(BaseHub):
+    """基于 Django 缓存的频道，多进程共享同一份事件
+
+    事件序号用缓存的原子自增生成，每个帖子的事件列表存为一个键，追加时
+    按帖子加锁。等待中的连接每隔 ``CACHE_POLL_INTERVAL`` 秒读一次该帖子的
+    键，空闲连接的开销是每秒一次缓存读取。
+    """
+
+    SEQ_KEY = 'tieba:live:seq'
+    KEY_PREFIX = 'tieba:live:post:'
+    LOCK_PREFIX = 'tieba:live:lock:'
+    TIMEOUT = 24 * 3600
+
+    def __init__(self, history, max_streams, poll_interval, alias='default'):
+        super().__init__(history, max_streams)
+        self.poll_interval = poll_interval
+        self.cache = caches[alias]
+
+    def _acquire(self, key, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not self.cache.add(key, 1, timeout=5):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def latest_id(self):
+        return self.cache.get(self.SEQ_KEY) or 0
+
+    def publish(self, post_id, event, data):
+        lock_key = f'{self.LOCK_PREFIX}{post_id}'
+        if not self._acquire(lock_key):
+            return
+        try:
+            # 在帖子锁内取序号，同一帖子的事件按 id 递增追加
+            self.cache.add(self.SEQ_KEY, 0, timeout=None)
+            seq = self.cache.incr(self.SEQ_KEY)
+            key = f'{self.KEY_PREFIX}{post_id}'
+            state = self.cache.get(key) or {'floor': 0, 'events': []}
+            state['events'].append({'id': seq, 'event': event, 'data': data})
+            if len(state['events']) > self.history:
+                dropped = state['events'][:-self.history]
+                state['floor'] = dropped[-1]['id']
+                state['events'] = state['events'][-self.history:]
+            self.cache.set(key, state, timeout=self.TIMEOUT)
+        finally:
+            self.cache.delete(lock_key)
+
+    def _load(self, post_id):
+        values = self.cache.get_many([self.SEQ_KEY, f'{self.KEY_PREFIX}{post_id}'])
+        state = values.get(f'{self.KEY_PREFIX}{post_id}') or {'floor': 0, 'events': []}
+        return values.get(self.SEQ_KEY) or 0, state['floor'], state['events']
+
+    async def wait(self, post_id, last_id, timeout):
+        since = sync_to_async(self.since, thread_sensitive=False)
+        deadline = time.monotonic() + timeout
+        while True:
+            events = await since(post_id, last_id)
+            remaining = deadline - time.monotonic()
+            if events or remaining <= 0:
+                return events
+            await asyncio.sleep(min(self.poll_interval, remaining))
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_hub():
+    """返回按配置创建的全局事件频道"""
+    global _hub
+    if _hub is None:
+        with _hub_lock:
+            if _hub is None:
+                config = get_config()
+                if config['BACKEND'] == 'cache':
+                    _hub = CacheHub(
+                        config['HISTORY'], config['MAX_STREAMS'], config['CACHE_POLL_INTERVAL'],
+                        alias=config['CACHE_ALIAS'],
+                    )
+                else:
+                    _hub = MemoryHub(config['HISTORY'], config['MAX_STREAMS'], config['MAX_CHANNELS'])
+    return _hub
+
+
+def latest_event_id():
+    return get_hub().latest_id()
+
+
+def comment_payload(comment):
+    """评论的 JSON 表示，实时推送和加载更多回复共用"""
+    return {
+        'id': comment.id,
+        'parent_id': comment.parent_id,
+        'root_id': comment.root_id,
+        'depth': comment.depth,
+        'author': comment.author.username,
+        'author_url': reverse('tieba:user_profile', args=[comment.author.username]),
+        'content': comment.content,
+        'created_at': date_format(timezone.localtime(comment.created_at), 'Y-m-d H:i'),
+        'like_count': comment.like_count,
+    }
+
+
+def publish_comment(comment):
+    get_hub().publish(comment.post_id, 'comment', comment_payload(comment))
+
+
+def publish_comment_removed(comment):
+    get_hub().publish(comment.post_id, 'comment_removed', {'id': comment.id})
+
+
+def publish_post_removed(post_id):
+    get_hub().publish(post_id, 'post_removed', {})
+
+
+# 同一事务里的多次点赞/收藏/评论合并，提交后每个帖子、评论只查询和推送一次最新计数
+_pending = threading.local()
+
+
+def counters_changed(post_id=None, comment_id=None):
+    """登记计数有变化的帖子或评论，事务提交后推送最新计数
+
+    推送的是提交后查到的计数而不是增量，读者自己点赞时页面上已经是
+    新计数，再收到事件也不会重复累加。事务回滚时登记会留到下一次提交，
+    那时查到的仍是正确的计数。
+    """
+    if post_id is not None:
+        _pending.__dict__.setdefault('posts', set()).add(post_id)
+    if comment_id is not None:
+        _pending.__dict__.setdefault('comments', set()).add(comment_id)
+    transaction.on_commit(publish_counters)
+
+
+def publish_counters():
+    from .models import Comment, Post
+
+    post_ids = _pending.__dict__.pop('posts', set())
+    comment_ids = _pending.__dict__.pop('comments', set())
+    hub = get_hub()
+    if comment_ids:
+        rows = Comment.objects.filter(id__in=comment_ids).values_list('id', 'post_id', 'like_count')
+        for comment_id, post_id, like_count in rows:
+            hub.publish(post_id, 'comment_counts', {'id': comment_id, 'like_count': like_count})
+    if post_ids:
+        rows = Post.objects.filter(id__in=post_ids).values('id', 'like_count', 'favorite_count', 'comment_count')
+        for row in rows:
+            hub.publish(row.pop('id'), 'counts', row)
+
+
+def publish_view_counts(post_ids):
+    """浏览数写回后推送这些帖子持久化后的浏览数"""
+    from .models import Post
+
+    hub = get_hub()
+    for post_id, view_count in Post.objects.filter(id__in=post_ids).values_list('id', 'view_count'):
+        hub.publish(post_id, 'counts', {'view_count': view_count})
@@ -0,0 +1,52 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+
+from tieba import archive
+
+
+class Command(BaseCommand):
+    help = '把删除超过保留期的帖子、评论分批移入归档表（可随时中断，重新执行即继续）'
+
+    def add_arguments(self, parser):
+        config = archive.get_config()
+        parser.add_argument('--days', type=int, default=config['RETENTION_DAYS'], help='删除多少天后归档')
+        parser.add_argument('--batch-size', type=int, default=config['BATCH_SIZE'], help='每批归档的行数')
+        parser.add_argument('--sleep', type=float, default=config['PAUSE'], help='批次之间的间隔（秒）')
+        parser.add_argument('--max-batches', type=int, help='最多执行的批数，不指定时归档完为止')
+        parser.add_argument('--dry-run', action='store_true', help='只统计等待归档的行数')
+
+    def handle(self, *args, **options):
+        before = archive.cutoff(options['days'])
+        if options['dry_run']:
+            posts, comments = archive.pending_counts(before)
+            self.stdout.write(f'等待归档：帖子 {posts} 个，评论 {comments} 条（删除时间早于 {before:%Y-%m-%d %H:%M}）')
+            return
+
+        # 收到 SIGTERM/Ctrl-C 时做完当前批次再退出
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        batches = 0
+        totals = {'posts': 0, 'comments': 0}
+        # 先归档帖子（其下评论随之归档），再归档帖子仍在的已删除评论
+        for kind, step in (('posts', archive.archive_posts), ('comments', archive.archive_comments)):
+            while not self.stopping and (options['max_batches'] is None or batches < options['max_batches']):
+                count = step(before, options['batch_size'])
+                if not count:
+                    break
+                batches += 1
+                totals[kind] += count
+                if options['verbosity'] >= 2:
+                    self.stdout.write(f'第 {batches} 批：归档 {count} 个{"帖子" if kind == "posts" else "评论"}')
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"已归档帖子 {totals['posts']} 个、评论 {totals['comments']} 条，共 {batches} 批"
+            + ('（已中断，重新执行即可继续）' if self.stopping else '')
+        ))
+
+    def stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import ThreadSensitiveContext
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from tieba.models import Post
+
+from .benchmark_views import percentile
+
+
+class Command(BaseCommand):
+    help = '对比 WSGI（固定工作线程）与 ASGI（单事件循环）部署在并发请求下的吞吐量和延迟'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='每种部署发出的请求总数')
+        parser.add_argument('--workers', type=int, default=4, help='WSGI 工作线程数（同时处理的请求数上限）')
+        parser.add_argument('--concurrency', type=int, default=32, help='同时在途的请求数')
+        parser.add_argument('--db-latency', type=float, default=0,
+                            help='给每条 SQL 附加的延迟（毫秒），模拟网络数据库的往返时间')
+
+    def urls(self):
+        post = Post.objects.filter(is_active=True).select_related('author').order_by('-id').first()
+        if post is None:
+            raise CommandError('没有可用的帖子，请先执行 seed_demo_data 生成数据')
+        return [
+            reverse('tieba:index'),
+            reverse('tieba:index') + '?sort=hot',
+            reverse('tieba:post_detail', args=[post.id]),
+            reverse('tieba:search') + f'?q={post.title[:2]}',
+            reverse('tieba:user_profile', args=[post.author.username]),
+        ]
+
+    def install_latency(self, delay):
+        """在所有（包括之后新建的）数据库连接上附加固定延迟"""
+        def wrapper(execute, sql, params, many, context):
+            time.sleep(delay)
+            return execute(sql, params, many, context)
+
+        def on_created(sender, connection, **kwargs):
+            # 同一个连接对象关闭后重连也会触发，避免重复附加
+            if wrapper not in connection.execute_wrappers:
+                connection.execute_wrappers.append(wrapper)
+
+        connection_created.connect(on_created, weak=False)
+        for conn in connections.all():
+            on_created(None, conn)
+        return lambda: connection_created.disconnect(on_created)
+
+    def run_wsgi(self, urls, total, workers, concurrency):
+        """WSGI：每个工作线程一次只处理一个请求，其余在途请求排队等待"""
+        local = threading.local()
+
+        def request(i, issued):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            try:
+                response = local.client.get(urls[i % len(urls)])
+            finally:
+                connections.close_all()
+            return (time.perf_counter() - issued) * 1000, response.status_code
+
+        # 保持 concurrency 个请求在途，延迟从发出请求算起（包含排队时间）
+        in_flight = threading.BoundedSemaphore(concurrency)
+        futures = []
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for i in range(total):
+                in_flight.acquire()
+                future = pool.submit(request, i, time.perf_counter())
+                future.add_done_callback(lambda _: in_flight.release())
+                futures.append(future)
+        return time.perf_counter() - started, [future.result() for future in futures]
+
+    def run_asgi(self, urls, total, concurrency):
+        """ASGI：单个事件循环，异步视图等待数据库时不占用线程"""
+        async def main():
+            client = AsyncClient()
+            in_flight = asyncio.Semaphore(concurrency)
+
+            async def request(i):
+                async with in_flight:
+                    issued = time.perf_counter()
+                    # 与 ASGIHandler 一样，每个请求的同步代码在各自的线程中执行
+                    async with ThreadSensitiveContext():
+                        response = await client.get(urls[i % len(urls)])
+                    return (time.perf_counter() - issued) * 1000, response.status_code
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*(request(i) for i in range(total)))
+            return time.perf_counter() - started, results
+
+        return asyncio.run(main())
+
+    def report(self, label, elapsed, results):
+        timings = [timing for timing, _ in results]
+        errors = sum(1 for _, status in results if status >= 400)
+        self.stdout.write(
+            f'{label:<6} {len(results) / elapsed:8.1f} 请求/秒  p50 {percentile(timings, 50):8.1f}  '
+            f'p95 {percentile(timings, 95):8.1f}  p99 {percentile(timings, 99):8.1f} ms  错误 {errors}'
+        )
+        return len(results) / elapsed
+
+    def handle(self, *args, **options):
+        urls = self.urls()
+        uninstall = self.install_latency(options['db_latency'] / 1000) if options['db_latency'] else None
+
+        request_logger = logging.getLogger('django.request')
+        log_level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                # 预热：建立连接、加载模板、填充侧栏缓存
+                for url in urls:
+                    Client().get(url)
+
+                self.stdout.write(
+                    f"{options['requests']} 个请求，{options['concurrency']} 个并发，"
+                    f"WSGI {options['workers']} 个工作线程，每条 SQL 附加 {options['db_latency']} ms"
+                )
+                wsgi = self.report('WSGI', *self.run_wsgi(
+                    urls, options['requests'], options['workers'], options['concurrency'],
+                ))
+                asgi = self.report('ASGI', *self.run_asgi(urls, options['requests'], options['concurrency']))
+        finally:
+            request_logger.setLevel(log_level)
+            if uninstall:
+                uninstall()
+
+        self.stdout.write(self.style.SUCCESS(f'ASGI / WSGI 吞吐量：{asgi / wsgi:.2f} 倍'))
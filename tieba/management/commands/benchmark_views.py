@@ -0,0 +1,271 @@
+import json
+import logging
+import statistics
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from tieba import urls as tieba_urls
+from tieba.models import Category, Comment, Post
+
+# 每个 URL 名称要压测的请求：(标签, 方法, 查询参数或表单, 是否登录)
+# 新增 URL 后需在这里补充，否则压测时会给出提示
+SCENARIOS = {
+    'index': [
+        ('最新', 'get', {}, False),
+        ('热门', 'get', {'sort': 'hot'}, False),
+        ('推荐', 'get', {'sort': 'recommend'}, False),
+        ('分类筛选', 'get', {'category': '{category_id}'}, False),
+    ],
+    'category_posts': [('', 'get', {}, False)],
+    'post_detail': [('', 'get', {}, False)],
+    'post_events': [
+        ('SSE', 'get', {}, False),
+        ('轮询', 'get', {'format': 'json'}, False),
+    ],
+    'create_post': [
+        ('表单', 'get', {}, True),
+        ('提交', 'post', {'title': '压测帖子', 'content': '压测内容', 'category': '{category_id}'}, True),
+    ],
+    'edit_post': [('表单', 'get', {}, True)],
+    'delete_post': [('提交', 'post', {}, True)],
+    'create_comment': [('提交', 'post', {'content': '压测评论'}, True)],
+    'delete_comment': [('提交', 'post', {}, True)],
+    'comment_replies': [('', 'get', {}, False)],
+    'like_post': [('', 'post', {}, True)],
+    'like_comment': [('', 'post', {}, True)],
+    'batch_interactions': [('', 'json', {'operations': [
+        {'type': 'post', 'id': '{post_id}', 'action': 'toggle'},
+        {'type': 'favorite', 'id': '{post_id}', 'action': 'toggle'},
+        {'type': 'comment', 'id': '{comment_id}', 'action': 'toggle'},
+    ]}, True)],
+    'favorite_post': [('', 'post', {}, True)],
+    'user_profile': [('', 'get', {}, False)],
+    'edit_profile': [('表单', 'get', {}, True)],
+    'profile': [('', 'get', {}, True)],
+    'search': [
+        ('关键词', 'get', {'q': '{keyword}'}, False),
+        ('空关键词', 'get', {}, False),
+    ],
+    'register': [('表单', 'get', {}, False)],
+    'api_posts': [
+        ('最新', 'get', {}, False),
+        ('热门', 'get', {'sort': 'hot'}, False),
+        ('字段筛选', 'get', {'fields': 'id,title,like_count'}, False),
+    ],
+    'api_post': [('', 'get', {}, False)],
+    'api_post_comments': [('', 'get', {}, False)],
+    'api_comment_replies': [('', 'get', {}, False)],
+    'api_categories': [('', 'get', {}, False)],
+    'api_user': [('', 'get', {}, False)],
+}
+
+
+def fill(value, sample):
+    """把场景里的 {post_id} 等占位符替换成样本数据"""
+    if isinstance(value, str):
+        filled = value.format(**sample)
+        return int(filled) if value.startswith('{') and filled.isdigit() else filled
+    if isinstance(value, dict):
+        return {key: fill(item, sample) for key, item in value.items()}
+    if isinstance(value, list):
+        return [fill(item, sample) for item in value]
+    return value
+
+
+def percentile(values, pct):
+    """最近秩法取百分位数"""
+    ordered = sorted(values)
+    index = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = '逐个请求 tieba 的全部 URL，统计延迟分位数、每请求查询数和 SQLite 执行步数，结果写入 JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='每个场景的请求次数')
+        parser.add_argument('--warmup', type=int, default=3, help='每个场景正式计时前的预热次数')
+        parser.add_argument('--only', action='append', default=[], metavar='URL_NAME',
+                            help='只压测指定的 URL 名称，可多次指定')
+        parser.add_argument('--output', help='结果 JSON 文件路径，默认 benchmarks/<时间>.json')
+        parser.add_argument('--label', default='', help='本次运行的说明，写入结果文件')
+        parser.add_argument('--compare', help='与之前的结果文件对比 p95')
+
+    def samples(self):
+        """挑选压测用的帖子、评论、用户"""
+        post = (
+            Post.objects.filter(is_active=True, comment_count__gt=0)
+            .select_related('author').order_by('-comment_count', '-id').first()
+            or Post.objects.filter(is_active=True).select_related('author').order_by('-id').first()
+        )
+        if post is None:
+            raise CommandError('没有可用的帖子，请先执行 seed_demo_data 生成数据')
+        root = Comment.objects.filter(post=post, depth=0, is_active=True).order_by('-reply_count').first()
+        # 删除评论要求是本人的评论
+        comment = Comment.objects.filter(author=post.author, is_active=True).order_by('-id').first() or root
+        return post.author, {
+            'post_id': post.id,
+            'category_id': post.category_id,
+            'comment_id': comment.id if comment else 0,
+            'root_id': root.id if root else 0,
+            'username': post.author.username,
+            'keyword': post.title[:2],
+        }
+
+    def url_kwargs(self, pattern, sample):
+        names = {
+            'post_id': sample['post_id'],
+            'category_id': sample['category_id'],
+            'comment_id': (
+                sample['root_id'] if pattern.name in ('comment_replies', 'api_comment_replies')
+                else sample['comment_id']
+            ),
+            'username': sample['username'],
+        }
+        return {key: names[key] for key in pattern.pattern.converters}
+
+    def host(self):
+        """测试客户端使用的 Host，需在 ALLOWED_HOSTS 内"""
+        for host in settings.ALLOWED_HOSTS:
+            if host != '*':
+                return host.lstrip('.') or 'localhost'
+        return 'localhost'
+
+    def run_scenario(self, client, method, url, data, count):
+        timings, queries, steps = [], [], []
+        status = None
+        counter = {'steps': 0}
+
+        def progress():
+            counter['steps'] += 1
+            return 0
+
+        raw = connection.connection
+        for _ in range(count):
+            counter['steps'] = 0
+            # SQLite 不提供每条语句读取的行数，用虚拟机指令数（每 100 条计 1）近似扫描量
+            raw.set_progress_handler(progress, 100)
+            try:
+                # 写操作在保存点内执行后回滚，每次请求面对的数据相同
+                with transaction.atomic(), CaptureQueriesContext(connection) as ctx:
+                    started = time.perf_counter()
+                    if method == 'json':
+                        response = client.post(url, json.dumps(data), content_type='application/json')
+                    else:
+                        response = getattr(client, method)(url, data)
+                    elapsed = time.perf_counter() - started
+                    transaction.set_rollback(True)
+            finally:
+                raw.set_progress_handler(None, 0)
+            status = response.status_code
+            timings.append(elapsed * 1000)
+            queries.append(len(ctx.captured_queries))
+            steps.append(counter['steps'] * 100)
+        return status, timings, queries, steps
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('执行步数统计依赖 SQLite，目前仅支持 SQLite')
+        if options['requests'] < 1:
+            raise CommandError('--requests 至少为 1')
+
+        user, sample = self.samples()
+        connection.ensure_connection()
+        host = self.host()
+        anonymous = Client(HTTP_HOST=host, raise_request_exception=False)
+        logged_in = Client(HTTP_HOST=host, raise_request_exception=False)
+        logged_in.force_login(user)
+
+        # 4xx/5xx 已体现在结果的状态码里，压测期间不输出请求日志
+        request_logger = logging.getLogger('django.request')
+        log_level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            # 查询数按连接统计，异步视图里的并发查询改为在请求线程中执行；
+            # 并发能力由 benchmark_concurrency 单独评估
+            with override_settings(TIEBA_CONCURRENT_QUERIES=False):
+                results = self.run_all(options, sample, anonymous, logged_in)
+        finally:
+            request_logger.setLevel(log_level)
+
+        report = {
+            'label': options['label'],
+            'created_at': timezone.now().isoformat(),
+            'database': str(settings.DATABASES['default']['NAME']),
+            'requests': options['requests'],
+            'rows': {
+                'users': User.objects.count(),
+                'posts': Post.objects.count(),
+                'comments': Comment.objects.count(),
+                'categories': Category.objects.count(),
+            },
+            'results': results,
+        }
+        output = Path(options['output'] or Path('benchmarks') / f"{timezone.now():%Y%m%d-%H%M%S}.json")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+        self.stdout.write(self.style.SUCCESS(f'结果已写入 {output}'))
+
+        if options['compare']:
+            self.compare(json.loads(Path(options['compare']).read_text(encoding='utf-8')), results)
+
+    def run_all(self, options, sample, anonymous, logged_in):
+        results = []
+        for pattern in tieba_urls.urlpatterns:
+            if options['only'] and pattern.name not in options['only']:
+                continue
+            scenarios = SCENARIOS.get(pattern.name)
+            if scenarios is None:
+                self.stderr.write(self.style.WARNING(f'{pattern.name} 没有压测场景，已跳过'))
+                continue
+            path = reverse(f'tieba:{pattern.name}', kwargs=self.url_kwargs(pattern, sample))
+
+            for label, method, data, login in scenarios:
+                client = logged_in if login else anonymous
+                data = fill(data, sample)
+                self.run_scenario(client, method, path, data, options['warmup'])
+                status, timings, queries, steps = self.run_scenario(
+                    client, method, path, data, options['requests'],
+                )
+                result = {
+                    'name': pattern.name + (f' [{label}]' if label else ''),
+                    'method': method.upper(),
+                    'path': path,
+                    'params': data if method == 'get' else None,
+                    'status': status,
+                    'p50_ms': round(percentile(timings, 50), 2),
+                    'p95_ms': round(percentile(timings, 95), 2),
+                    'p99_ms': round(percentile(timings, 99), 2),
+                    'mean_ms': round(statistics.fmean(timings), 2),
+                    'queries': round(statistics.fmean(queries), 1),
+                    'sqlite_steps': int(statistics.fmean(steps)),
+                }
+                results.append(result)
+                self.stdout.write(
+                    f"{result['name']:<32} {result['status']:>3}  p50 {result['p50_ms']:>8.2f}  "
+                    f"p95 {result['p95_ms']:>8.2f}  p99 {result['p99_ms']:>8.2f} ms  "
+                    f"查询 {result['queries']:>5}  步数 {result['sqlite_steps']}"
+                )
+        return results
+
+    def compare(self, baseline, results):
+        previous = {item['name']: item for item in baseline['results']}
+        self.stdout.write(f"\n与 {baseline.get('label') or baseline['created_at']} 对比 p95：")
+        for result in results:
+            before = previous.get(result['name'])
+            if before is None:
+                continue
+            change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+            style = self.style.ERROR if change > 10 else self.style.SUCCESS if change < -10 else str
+            self.stdout.write(style(
+                f"{result['name']:<32} {before['p95_ms']:>8.2f} -> {result['p95_ms']:>8.2f} ms ({change:+.1f}%)"
+            ))
@@ -0,0 +1,161 @@
+import math
+import re
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from tieba import counters
+from tieba.models import Post
+
+# 允许整表扫描的小表（分类全部列出是预期行为）
+ALLOWED_SCANS = {'tieba_category'}
+
+# 匹配 "SCAN tieba_post"、"SCAN TABLE tieba_post AS U0"，不匹配走索引的 "SCAN ... USING INDEX"；
+# 子查询、窗口函数外层等派生表的 "SCAN (subquery-1)" 不是真实的表，另行排除
+FULL_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(?P<table>\S+)(?: AS \S+)?$')
+
+# 按索引遍历整张表后还要另行排序，说明没有索引能同时满足过滤和排序
+INDEX_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(?P<table>\S+)(?: AS \S+)? USING (?:COVERING )?INDEX ')
+TEMP_SORT_RE = re.compile(r'^USE TEMP B-TREE FOR (?:RIGHT PART OF |LAST \d+ TERMS OF )?ORDER BY')
+
+# 按索引定位后，索引只满足排序键的前几列（如缺少 -id 结尾），SQLite 报告
+# "USE TEMP B-TREE FOR RIGHT PART OF ORDER BY"，要把命中的行全部取出再排序
+INDEX_SEARCH_RE = re.compile(r'^SEARCH (?:TABLE )?(?P<table>\S+)(?: AS \S+)? USING (?:COVERING )?INDEX ')
+PARTIAL_SORT_RE = re.compile(r'^USE TEMP B-TREE FOR (?:RIGHT PART OF |LAST \d+ TERMS OF )ORDER BY')
+
+
+class Command(BaseCommand):
+    help = '请求主要页面，对其中的查询执行 EXPLAIN QUERY PLAN，出现整表扫描时报错'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--allow', action='append', default=[], metavar='TABLE',
+                            help='额外允许整表扫描的表，可多次指定')
+        parser.add_argument('--show-plans', action='store_true', help='输出每条查询的执行计划')
+
+    def targets(self):
+        """要检查的页面：(名称, URL, 是否需要登录)"""
+        post = Post.objects.filter(is_active=True).select_related('author').order_by('-id').first()
+        if post is None:
+            raise CommandError('没有可用的帖子，请先准备数据')
+        keyword = post.title[:2]
+        return post.author, [
+            ('首页-最新', reverse('tieba:index'), False),
+            ('首页-热门', reverse('tieba:index') + '?sort=hot', False),
+            ('首页-推荐', reverse('tieba:index') + '?sort=recommend', False),
+            ('首页-分类筛选', reverse('tieba:index') + f'?category={post.category_id}', False),
+            ('分类页', reverse('tieba:category_posts', args=[post.category_id]), False),
+            *([('标签页', reverse('tieba:tag_posts', args=[post.tags[0]]), False)] if post.tags else []),
+            ('关注动态', reverse('tieba:feed'), True),
+            ('帖子详情', reverse('tieba:post_detail', args=[post.id]), False),
+            ('搜索', reverse('tieba:search') + f'?q={keyword}', False),
+            ('搜索-空关键词', reverse('tieba:search'), False),
+            ('用户资料页', reverse('tieba:user_profile', args=[post.author.username]), False),
+            ('个人中心', reverse('tieba:profile'), True),
+            ('API-帖子列表', reverse('tieba:api_posts'), False),
+            ('API-热门帖子', reverse('tieba:api_posts') + '?sort=hot', False),
+            ('API-作者帖子', reverse('tieba:api_posts') + f'?author={post.author.username}', False),
+            ('API-帖子详情', reverse('tieba:api_post', args=[post.id]), False),
+            ('API-评论', reverse('tieba:api_post_comments', args=[post.id]), False),
+            ('API-用户', reverse('tieba:api_user', args=[post.author.username]), False),
+        ]
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def full_scans(self, plan, tables, allowed):
+        checked = tables - allowed
+        sorts = [detail for detail in plan if TEMP_SORT_RE.match(detail)]
+        partial_sorts = [detail for detail in plan if PARTIAL_SORT_RE.match(detail)]
+        scans = []
+        for detail in plan:
+            match = FULL_SCAN_RE.match(detail)
+            if match and match.group('table') in checked:
+                scans.append(detail)
+                continue
+            match = INDEX_SCAN_RE.match(detail)
+            if match and sorts and match.group('table') in checked:
+                scans.append(f'{detail} + {sorts[0]}')
+                continue
+            match = INDEX_SEARCH_RE.match(detail)
+            if match and partial_sorts and match.group('table') in checked:
+                scans.append(f'{detail} + {partial_sorts[0]}')
+        return scans
+
+    def check_pages(self, allowed, show_plans=False):
+        """请求各页面并检查其中的查询，返回 [(页面, URL, SQL, 问题列表)]"""
+        tables = set(connection.introspection.table_names())
+
+        # 侧栏等缓存命中时不会发出查询，检查期间改用 DummyCache；
+        # 异步视图中的并发查询改为在请求线程中执行，才能在同一连接上捕获
+        dummy_caches = {
+            alias: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+            for alias in settings.CACHES
+        }
+        # 清单存储在没有执行 collectstatic 时渲染 {% static %} 会出错，检查期间改用普通存储
+        storages = {
+            **settings.STORAGES,
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        }
+
+        # 检查期间的浏览记在一个不会写回的临时缓冲里，结束后丢弃，不能留到
+        # 进程退出时写回数据库（cache 后端的缓冲还与 web 进程共用）
+        saved_buffer = counters._buffer
+        counters._buffer = counters.MemoryViewBuffer(flush_interval=math.inf, flush_threshold=math.inf)
+        failures = []
+        try:
+            with override_settings(CACHES=dummy_caches, STORAGES=storages, TIEBA_CONCURRENT_QUERIES=False), \
+                    transaction.atomic():
+                user, targets = self.targets()
+                for name, url, login_required in targets:
+                    client = Client(raise_request_exception=False)
+                    if login_required:
+                        client.force_login(user)
+                    with CaptureQueriesContext(connection) as ctx:
+                        response = client.get(url)
+                    if response.status_code != 200:
+                        # 页面出错时仍检查出错前已执行的查询
+                        self.stderr.write(self.style.WARNING(f'{name} {url} 返回 {response.status_code}'))
+
+                    selects = [
+                        q['sql'] for q in ctx.captured_queries
+                        if q['sql'].lstrip().upper().startswith(('SELECT', 'WITH'))
+                    ]
+                    for sql in selects:
+                        plan = self.explain(sql)
+                        if show_plans:
+                            self.stdout.write(f'[{name}] {sql}')
+                            for detail in plan:
+                                self.stdout.write(f'    {detail}')
+                        scans = self.full_scans(plan, tables, allowed)
+                        if scans:
+                            failures.append((name, url, sql, scans))
+                    self.stdout.write(f'{name:<10} {url}  {len(selects)} 条查询')
+                # 检查过程中的写入（会话等）全部回滚
+                transaction.set_rollback(True)
+        finally:
+            counters._buffer = saved_buffer
+        return failures
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('EXPLAIN QUERY PLAN 检查仅支持 SQLite')
+        allowed = ALLOWED_SCANS | set(options['allow'])
+
+        setup_test_environment()
+        try:
+            failures = self.check_pages(allowed, options['show_plans'])
+        finally:
+            teardown_test_environment()
+
+        if failures:
+            for name, url, sql, scans in failures:
+                self.stderr.write(f'\n[{name}] {url}\n  {sql}\n  -> ' + '\n  -> '.join(scans))
+            raise CommandError(f'{len(failures)} 条查询出现整表扫描')
+        self.stdout.write(self.style.SUCCESS('全部查询均走索引'))
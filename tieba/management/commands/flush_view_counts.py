@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tieba.counters import flush_views, get_config
+
+
+class Command(BaseCommand):
+    help = '把缓冲中的帖子浏览数立即写回数据库（停机前执行，需使用 database 或 cache 后端）'
+
+    def handle(self, *args, **options):
+        if get_config()['BACKEND'] == 'memory':
+            # memory 后端的增量在 web 进程里，本命令所在的进程读不到
+            raise CommandError(
+                "浏览数缓冲使用进程内的 memory 后端，由 web 进程自行写回（退出时兜底写回）；"
+                "需要由本命令写回时请把 TIEBA_VIEW_COUNTER['BACKEND'] 设为 'database'"
+            )
+        flushed = flush_views()
+        self.stdout.write(self.style.SUCCESS(f'已写回 {flushed} 个帖子的浏览数'))
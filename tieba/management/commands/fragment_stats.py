@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tieba import fragments
+from tieba.cache import is_process_local
+
+
+class Command(BaseCommand):
+    help = '查看帖子片段缓存的命中率和节省的渲染时间（统计保存在缓存中，多进程部署需使用共享缓存）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='输出后清零统计')
+
+    def handle(self, *args, **options):
+        if is_process_local(fragments.get_cache()):
+            # 统计累计在 web 进程的进程内缓存里，本命令所在的进程读到的永远是 0
+            raise CommandError('片段缓存是进程内缓存，命令读不到 web 进程的统计；请设置 TIEBA_CACHE_BACKEND=file 使用共享缓存')
+        stats = fragments.stats()
+        self.stdout.write(
+            f"命中 {stats['hits']}  未命中 {stats['misses']}  命中率 {stats['hit_rate']:.1%}\n"
+            f"渲染耗时 {stats['render_ms']:.1f} ms（平均每个片段 {stats['average_render_ms']:.3f} ms）\n"
+            f"估算节省 {stats['saved_ms']:.1f} ms"
+        )
+        if options['reset']:
+            fragments.reset_stats()
+            self.stdout.write(self.style.SUCCESS('统计已清零'))
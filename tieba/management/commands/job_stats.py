@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from tieba import jobs
+
+
+class Command(BaseCommand):
+    help = '查看后台任务队列的积压数和等待、执行耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=3600, help='统计最近多少秒内完成的任务')
+
+    def handle(self, *args, **options):
+        rows = jobs.stats(window=options['window'])
+        if not rows:
+            self.stdout.write('队列为空')
+            return
+        self.stdout.write(
+            f"{'任务':<20}{'待执行':>8}{'未到期':>8}{'执行中':>8}{'失败':>8}"
+            f"{'已完成':>8}{'最久等待(s)':>14}{'平均等待(s)':>14}{'平均执行(s)':>14}"
+        )
+        for row in rows:
+            self.stdout.write(
+                f"{row['name']:<20}{row['ready']:>8}{row['scheduled']:>8}{row['running']:>8}{row['failed']:>8}"
+                f"{row['done']:>8}{row['oldest_wait']:>14.1f}{row['avg_wait']:>14.2f}{row['avg_run']:>14.3f}"
+            )
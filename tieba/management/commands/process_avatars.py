@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from tieba import avatars
+from tieba.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = '为尚未处理的头像生成多尺寸缩略图（上线头像处理前上传的头像）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2,
+                            help='并行处理的线程数')
+        parser.add_argument('--force', action='store_true',
+                            help='已处理过的头像也重新生成（以当前最大尺寸为原图，修改尺寸配置后使用）')
+        parser.add_argument('--delete-originals', action='store_true', help='处理完成后删除原图')
+
+    def process(self, profile_id, name, delete_originals):
+        try:
+            with default_storage.open(name, 'rb') as source:
+                avatars.process_avatar(profile_id, source, delete_previous=delete_originals)
+            return None
+        except (OSError, avatars.AvatarError) as exc:
+            return f'{name}: {exc}'
+        finally:
+            connections.close_all()
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.exclude(avatar='').exclude(avatar__isnull=True)
+        if not options['force']:
+            profiles = profiles.filter(avatar_hash='')
+        todo = list(profiles.values_list('id', 'avatar'))
+
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as pool:
+            errors = [error for error in pool.map(
+                lambda item: self.process(*item, options['delete_originals']), todo,
+            ) if error]
+
+        for error in errors:
+            self.stderr.write(self.style.WARNING(error))
+        self.stdout.write(self.style.SUCCESS(f'已处理 {len(todo) - len(errors)} 个头像，失败 {len(errors)} 个'))
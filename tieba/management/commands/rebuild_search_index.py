@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from tieba.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = '重建帖子全文检索索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='每批写入的帖子数')
+
+    def handle(self, *args, **options):
+        total = rebuild_index(chunk_size=options['chunk_size'])
+        if total is None:
+            self.stdout.write(self.style.WARNING('当前数据库不支持 FTS5，检索将使用 icontains 退回模式'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'已索引 {total} 个帖子'))
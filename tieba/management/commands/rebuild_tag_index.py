@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from tieba.tags import rebuild_index
+
+
+class Command(BaseCommand):
+    help = '按 Post.tags 重建标签索引并重算各标签的帖子数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='每批处理的帖子数')
+
+    def handle(self, *args, **options):
+        total = rebuild_index(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'已处理 {total} 个帖子'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from tieba.feed import rebuild_timelines
+
+
+class Command(BaseCommand):
+    help = '按当前的关注关系重建关注动态的收件箱（调整 FANOUT_LIMIT 后使用）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help='只重建指定用户 id，可重复')
+
+    def handle(self, *args, **options):
+        total = rebuild_timelines(options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(f'已重建 {total} 个用户的收件箱'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from tieba.ranking import recompute_all
+
+
+class Command(BaseCommand):
+    help = '分批重算全部帖子的热度分和推荐分'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='每批处理的帖子数')
+
+    def handle(self, *args, **options):
+        total = recompute_all(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'已重算 {total} 个帖子的分数'))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from tieba.models import Comment, Favorite, Like, Post
+from tieba.ranking import recompute_all
+
+
+def count_subquery(model, fk, **filters):
+    """按外键分组计数的相关子查询，没有记录时为 0"""
+    rows = (
+        model.objects.filter(**{fk: OuterRef('pk')}, **filters)
+        .order_by()
+        .values(fk)
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+class Command(BaseCommand):
+    help = '根据点赞、收藏、评论记录重新计算帖子和评论上的计数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='每批处理的 id 区间大小')
+
+    def reconcile(self, model, chunk_size, **counters):
+        """按 id 区间分批执行 UPDATE ... SET counter = (SELECT COUNT ...)，每批一个短事务"""
+        last = model.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        updated = 0
+        for start in range(0, last + 1, chunk_size):
+            with transaction.atomic():
+                updated += model.objects.filter(id__gte=start, id__lt=start + chunk_size).update(**counters)
+        return updated
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+
+        posts = self.reconcile(
+            Post, chunk_size,
+            like_count=count_subquery(Like, 'post'),
+            favorite_count=count_subquery(Favorite, 'post'),
+            comment_count=count_subquery(Comment, 'post', is_active=True),
+        )
+        comments = self.reconcile(Comment, chunk_size, like_count=count_subquery(Like, 'comment'))
+
+        # 计数变化后热度分也要跟着重算
+        recompute_all()
+
+        self.stdout.write(self.style.SUCCESS(f'已校正 {posts} 个帖子、{comments} 条评论的计数'))
@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tieba.models import UserProfile
+from tieba.stats import reconcile
+
+
+class Command(BaseCommand):
+    help = '根据帖子、评论重新计算用户资料中的发帖数、评论数、获赞数和被收藏数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='每批处理的用户数')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+
+        # 先补建缺失的用户资料
+        missing = User.objects.filter(userprofile__isnull=True).values_list('id', flat=True)
+        created = len(UserProfile.objects.bulk_create(
+            [UserProfile(user_id=user_id) for user_id in missing], batch_size=500
+        ))
+
+        updated = 0
+        last_id = 0
+        while True:
+            user_ids = list(
+                UserProfile.objects.filter(user_id__gt=last_id)
+                .order_by('user_id')
+                .values_list('user_id', flat=True)[:chunk_size]
+            )
+            if not user_ids:
+                break
+            # 每批一个短事务
+            with transaction.atomic():
+                updated += reconcile(user_ids)
+            last_id = user_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'已补建 {created} 份用户资料，校正 {updated} 个用户的计数'))
@@ -0,0 +1,130 @@
+import multiprocessing
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand
+
+from tieba import jobs
+from tieba.worker import init_process
+
+# 清理已完成任务的间隔（秒）
+PURGE_INTERVAL = 600
+
+
+class Command(BaseCommand):
+    help = '执行后台任务队列中的任务（主进程认领任务，进程池执行）'
+
+    def add_arguments(self, parser):
+        config = jobs.get_config()
+        parser.add_argument('--processes', type=int, default=2,
+                            help='执行任务的子进程数，0 表示在主进程中执行')
+        parser.add_argument('--batch-size', type=int, default=config['BATCH_SIZE'], help='每次认领的任务数')
+        parser.add_argument('--sleep', type=float, default=config['POLL_INTERVAL'],
+                            help='队列为空时的轮询间隔（秒）')
+        parser.add_argument('--once', action='store_true', help='执行完当前到期的任务后退出')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.worker = jobs.worker_id()
+        self.processes = max(options['processes'], 0)
+        self.verbosity = options['verbosity']
+        self.done = self.failed = 0
+
+        if self.processes:
+            self.run_pool(options)
+        else:
+            self.run_inline(options)
+        self.stdout.write(self.style.SUCCESS(f'已退出：成功 {self.done} 个任务，失败 {self.failed} 个'))
+
+    def stop(self, signum, frame):
+        # 不再认领新任务，执行中的任务完成后退出
+        self.stopping = True
+
+    def new_pool(self):
+        return ProcessPoolExecutor(
+            max_workers=self.processes, mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_process,
+        )
+
+    def run_pool(self, options):
+        pool = self.new_pool()
+        in_flight = {}
+        last_purge = 0
+        try:
+            while True:
+                last_purge = self.maybe_purge(last_purge)
+                # 在途任务不超过子进程数的两倍，子进程空闲时队列里总有下一个任务
+                free = self.processes * 2 - len(in_flight)
+                claimed = []
+                if not self.stopping and free > 0:
+                    claimed = jobs.claim(self.worker, min(options['batch_size'], free))
+                    for job in claimed:
+                        in_flight[pool.submit(jobs.execute, job.name, job.kwargs)] = job
+                if not in_flight:
+                    if self.stopping or options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+                timeout = 0 if claimed and len(in_flight) < self.processes * 2 else options['sleep']
+                finished, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in finished:
+                    job = in_flight.pop(future)
+                    try:
+                        error = future.result()
+                    except BrokenProcessPool as exc:
+                        error = f'子进程异常退出：{exc!r}'
+                        broken = True
+                    except Exception as exc:
+                        error = repr(exc)
+                    self.record(job, error)
+                if broken:
+                    # 进程池已不可用，剩余的在途任务也会失败，换一个新的进程池
+                    for job in in_flight.values():
+                        self.record(job, '子进程异常退出')
+                    in_flight.clear()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = self.new_pool()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def run_inline(self, options):
+        last_purge = 0
+        while not self.stopping:
+            last_purge = self.maybe_purge(last_purge)
+            claimed = jobs.claim(self.worker, options['batch_size'])
+            for job in claimed:
+                self.record(job, jobs.execute(job.name, job.kwargs))
+                if self.stopping:
+                    # 已认领但未执行的任务放回队列
+                    jobs.release(claimed[claimed.index(job) + 1:])
+                    break
+            if not claimed:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+
+    def record(self, job, error):
+        jobs.finish(job, error)
+        if error is None:
+            self.done += 1
+        else:
+            self.failed += 1
+        if self.verbosity >= 2:
+            status = '完成' if error is None else f'失败（第 {job.attempts} 次）'
+            self.stdout.write(f'{job} {job.kwargs} {status}')
+        if error is not None and self.verbosity >= 1:
+            self.stderr.write(self.style.WARNING(f'{job} 执行失败：{error.strip().splitlines()[-1]}'))
+
+    def maybe_purge(self, last_purge):
+        now = time.monotonic()
+        if now - last_purge < PURGE_INTERVAL:
+            return last_purge
+        purged = jobs.purge()
+        if purged and self.verbosity >= 2:
+            self.stdout.write(f'已清理 {purged} 个已完成的任务')
+        return now
@@ -0,0 +1,286 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from tieba.cache import bump_version
+from tieba.models import Category, Comment, Favorite, Like, Post, UserProfile
+from tieba.threads import MAX_DEPTH, PATH_WIDTH
+
+CATEGORY_NAMES = [
+    '综合讨论', '数码科技', '游戏', '动漫', '影视', '音乐', '体育', '美食',
+    '旅行', '摄影', '编程', '考研', '职场', '情感', '宠物', '汽车',
+]
+
+TAGS = [
+    'python', 'django', '前端', '求助', '分享', '经验', '新手', '提问', '教程', '吐槽',
+    '攻略', '推荐', '测评', '日常', '讨论', '资源', '原创', '转载', '水贴', '精华',
+]
+
+WORDS = [
+    '今天', '大家', '我们', '这个', '问题', '感觉', '真的', '非常', '有点', '还是',
+    '觉得', '已经', '可以', '不过', '因为', '所以', '如果', '时候', '东西', '朋友',
+    '学习', '工作', '游戏', '电脑', '手机', '数据', '代码', '项目', '服务器', '数据库',
+    '性能', '优化', '体验', '推荐', '分享', '经验', '方法', '教程', '攻略', '版本',
+    '更新', '发布', '测试', '配置', '安装', '运行', '报错', '解决', '原因', '结果',
+    'Django', 'Python', 'SQLite', 'bug', 'API', '缓存', '索引', '查询', '页面', '用户',
+]
+
+PUNCTUATION = ['，', '。', '！', '？', '；']
+
+
+@contextmanager
+def manual_timestamps(model, *field_names):
+    """临时关闭 auto_now / auto_now_add，让批量插入保留生成的时间"""
+    fields = [model._meta.get_field(name) for name in field_names]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = '按给定规模生成演示/压测数据：用户、分类、帖子（含标签和草稿）、楼中楼评论、点赞和收藏'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='用户数')
+        parser.add_argument('--categories', type=int, default=len(CATEGORY_NAMES), help='分类数')
+        parser.add_argument('--posts', type=int, default=10000, help='帖子数')
+        parser.add_argument('--comments', type=int, default=100000, help='评论总数（近似）')
+        parser.add_argument('--likes', type=int, default=50000, help='点赞数（近似，重复的会被忽略）')
+        parser.add_argument('--favorites', type=int, default=10000, help='收藏数（近似，重复的会被忽略）')
+        parser.add_argument('--draft-ratio', type=float, default=0.05, help='草稿占帖子的比例')
+        parser.add_argument('--deleted-ratio', type=float, default=0.02, help='已删除内容的比例')
+        parser.add_argument('--days', type=int, default=365, help='帖子发布时间分布在最近多少天内')
+        parser.add_argument('--seed', type=int, default=20231201, help='随机种子，相同参数和种子生成相同数据')
+        parser.add_argument('--batch-size', type=int, default=2000, help='每次 bulk_create 的行数')
+        parser.add_argument('--prefix', default='seed', help='生成的用户名前缀')
+        parser.add_argument('--skip-reconcile', action='store_true',
+                            help='跳过计数校正、热度分和全文索引重建（之后可手动执行相应命令）')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.days = options['days']
+        started = time.monotonic()
+
+        if User.objects.filter(username__startswith=f"{options['prefix']}_").exists():
+            raise CommandError(f"已存在前缀为 {options['prefix']}_ 的用户，请换一个 --prefix")
+
+        user_ids = self.create_users(options['users'], options['prefix'])
+        category_ids = self.create_categories(options['categories'])
+        post_ids = self.create_posts(
+            options['posts'], user_ids, category_ids, options['draft_ratio'], options['deleted_ratio'],
+        )
+        comment_ids = self.create_comments(options['comments'], post_ids, user_ids, options['deleted_ratio'])
+        self.create_likes(options['likes'], user_ids, post_ids, comment_ids)
+        self.create_favorites(options['favorites'], user_ids, post_ids)
+
+        if not options['skip_reconcile']:
+            # bulk_create 不触发信号，计数、分数、用户统计和全文索引统一重算
+            call_command('reconcile_counters', stdout=self.stdout)
+            call_command('reconcile_user_stats', stdout=self.stdout)
+            call_command('rebuild_search_index', stdout=self.stdout)
+        bump_version('posts', 'categories', 'users')
+
+        self.stdout.write(self.style.SUCCESS(f'数据生成完成，用时 {time.monotonic() - started:.1f} 秒'))
+
+    # 生成工具
+
+    def next_id(self, model):
+        return (model.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+
+    def bulk_insert(self, model, objects):
+        for start in range(0, len(objects), self.batch_size):
+            model.objects.bulk_create(objects[start:start + self.batch_size])
+
+    def sentence(self, min_words, max_words):
+        words = self.rng.choices(WORDS, k=self.rng.randint(min_words, max_words))
+        return ''.join(words) + self.rng.choice(PUNCTUATION)
+
+    def paragraph(self, sentences):
+        return ''.join(self.sentence(4, 12) for _ in range(sentences))
+
+    def random_time(self, after=None):
+        """发布时间：越近的时间越密集"""
+        if after is None:
+            age = min(self.rng.expovariate(3.0 / self.days), self.days)
+            return self.now - timedelta(days=age)
+        span = max((self.now - after).total_seconds(), 1)
+        return after + timedelta(seconds=min(self.rng.expovariate(1 / 86400), span))
+
+    def progress(self, label, done, total):
+        if total and (done == total or done % (self.batch_size * 10) == 0):
+            self.stdout.write(f'{label}: {done}/{total}')
+
+    # 各类数据
+
+    def create_users(self, count, prefix):
+        # 哈希计算很慢，所有生成用户共用同一个密码哈希
+        password = make_password('tieba-seed')
+        first_id = self.next_id(User)
+        with transaction.atomic():
+            users = [
+                User(
+                    id=first_id + i,
+                    username=f'{prefix}_{first_id + i}',
+                    password=password,
+                    date_joined=self.now - timedelta(days=self.rng.uniform(0, self.days)),
+                )
+                for i in range(count)
+            ]
+            self.bulk_insert(User, users)
+            self.bulk_insert(UserProfile, [UserProfile(user_id=user.id) for user in users])
+        self.progress('用户', count, count)
+        return [user.id for user in users]
+
+    def create_categories(self, count):
+        existing = list(Category.objects.values_list('id', flat=True))
+        names = set(Category.objects.values_list('name', flat=True))
+        new = []
+        for i in range(count):
+            name = CATEGORY_NAMES[i % len(CATEGORY_NAMES)]
+            if i >= len(CATEGORY_NAMES):
+                name = f'{name}{i // len(CATEGORY_NAMES) + 1}'
+            if name not in names:
+                new.append(Category(name=name, description=self.sentence(4, 8)))
+                names.add(name)
+        Category.objects.bulk_create(new)
+        return existing + list(Category.objects.filter(name__in=[c.name for c in new]).values_list('id', flat=True))
+
+    def create_posts(self, count, user_ids, category_ids, draft_ratio, deleted_ratio):
+        if not user_ids or not category_ids:
+            raise CommandError('至少需要一个用户和一个分类')
+        first_id = self.next_id(Post)
+        post_ids = []
+        with manual_timestamps(Post, 'created_at', 'updated_at'):
+            for start in range(0, count, self.batch_size):
+                batch = []
+                for i in range(start, min(start + self.batch_size, count)):
+                    created_at = self.random_time()
+                    batch.append(Post(
+                        id=first_id + i,
+                        title=self.sentence(3, 8)[:-1],
+                        content=self.paragraph(self.rng.randint(2, 12)),
+                        # 少数用户发帖多：作者按幂律分布抽取
+                        author_id=user_ids[int(len(user_ids) * self.rng.random() ** 2)],
+                        category_id=self.rng.choice(category_ids),
+                        tags=self.rng.sample(TAGS, self.rng.randint(0, 4)),
+                        created_at=created_at,
+                        updated_at=created_at,
+                        view_count=int(self.rng.paretovariate(1.2) * 10),
+                        is_pinned=self.rng.random() < 0.001,
+                        is_draft=self.rng.random() < draft_ratio,
+                        is_active=self.rng.random() >= deleted_ratio,
+                    ))
+                with transaction.atomic():
+                    Post.objects.bulk_create(batch)
+                post_ids.extend((post.id, post.created_at) for post in batch if post.is_active and not post.is_draft)
+                self.progress('帖子', start + len(batch), count)
+        return post_ids
+
+    def create_comments(self, count, post_ids, user_ids, deleted_ratio):
+        """按帖子生成楼层和楼中楼，直接算好 root/depth/path/reply_count，返回评论 id 范围"""
+        first_id = comment_id = self.next_id(Comment)
+        if not post_ids or count <= 0:
+            return range(0)
+        average = count / len(post_ids)
+        created = flushes = 0
+        batch = []
+        for post_id, post_created_at in post_ids:
+            # 评论数按指数分布，少数热门帖子评论很多
+            thread = []
+            for _ in range(int(self.rng.expovariate(1 / average))):
+                parent = None
+                if thread and self.rng.random() < 0.45:
+                    parent = self.rng.choice(thread[-20:])
+                segment = str(comment_id).zfill(PATH_WIDTH)
+                if parent is None:
+                    root_id, depth, path = None, 0, segment
+                else:
+                    root_id = parent.root_id or parent.id
+                    prefix, depth = parent.path, parent.depth
+                    if depth >= MAX_DEPTH:
+                        prefix, depth = prefix.rsplit('/', 1)[0], depth - 1
+                    depth, path = depth + 1, f'{prefix}/{segment}'
+                thread.append(Comment(
+                    id=comment_id,
+                    post_id=post_id,
+                    author_id=self.rng.choice(user_ids),
+                    content=self.sentence(3, 20),
+                    created_at=self.random_time(parent.created_at if parent else post_created_at),
+                    parent=parent,
+                    root_id=root_id,
+                    depth=depth,
+                    path=path,
+                    is_active=self.rng.random() >= deleted_ratio,
+                ))
+                comment_id += 1
+
+            reply_counts = {}
+            for comment in thread:
+                if comment.root_id and comment.is_active:
+                    reply_counts[comment.root_id] = reply_counts.get(comment.root_id, 0) + 1
+            for comment in thread:
+                comment.reply_count = reply_counts.get(comment.id, 0)
+            batch.extend(thread)
+
+            if len(batch) >= self.batch_size:
+                created += self.flush_comments(batch)
+                batch = []
+                flushes += 1
+                if flushes % 10 == 0:
+                    self.stdout.write(f'评论: {created}')
+        if batch:
+            created += self.flush_comments(batch)
+        self.stdout.write(f'评论: {created}')
+        return range(first_id, comment_id)
+
+    def flush_comments(self, batch):
+        with manual_timestamps(Comment, 'created_at'), transaction.atomic():
+            self.bulk_insert(Comment, batch)
+        return len(batch)
+
+    def insert_pairs(self, model, count, user_ids, targets, field):
+        """分批生成随机的 (用户, 目标) 记录，目标按幂律抽取（靠前的更热门），重复的忽略"""
+        inserted = 0
+        for start in range(0, count, self.batch_size):
+            pairs = {
+                (self.rng.choice(user_ids), targets[int(len(targets) * self.rng.random() ** 3)])
+                for _ in range(min(self.batch_size, count - start))
+            }
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    [model(user_id=user_id, **{field: target}) for user_id, target in sorted(pairs)],
+                    ignore_conflicts=True,
+                )
+            inserted += len(pairs)
+        return inserted
+
+    def create_likes(self, count, user_ids, post_ids, comment_ids):
+        # 帖子按发布时间倒序排列，幂律抽样时新帖子更容易被点赞
+        posts = [post_id for post_id, _ in sorted(post_ids, key=lambda item: item[1], reverse=True)]
+        post_likes = int(count * 0.7) if comment_ids else count
+        total = 0
+        if posts:
+            total += self.insert_pairs(Like, post_likes, user_ids, posts, 'post_id')
+        if comment_ids:
+            total += self.insert_pairs(Like, count - post_likes, user_ids, comment_ids, 'comment_id')
+        self.stdout.write(f'点赞: {total}')
+
+    def create_favorites(self, count, user_ids, post_ids):
+        posts = [post_id for post_id, _ in sorted(post_ids, key=lambda item: item[1], reverse=True)]
+        if posts:
+            self.stdout.write(f'收藏: {self.insert_pairs(Favorite, count, user_ids, posts, "post_id")}')
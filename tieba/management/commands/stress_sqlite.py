@@ -0,0 +1,187 @@
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.utils import OperationalError
+from django.utils import timezone
+
+from tieba.models import Comment, Post
+from tieba.queries import post_cards
+
+from .benchmark_views import percentile
+
+# 对比的两种配置：Django 自带的 SQLite 后端和调优后的后端
+PROFILES = {
+    'default': 'django.db.backends.sqlite3',
+    'tuned': 'tieba.db_backend',
+}
+
+
+class Command(BaseCommand):
+    help = '多线程混合读写压测，对比默认 SQLite 后端与调优后端的吞吐量和锁冲突'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='并发线程数')
+        parser.add_argument('--duration', type=float, default=10, help='每种配置压测的秒数')
+        parser.add_argument('--write-ratio', type=float, default=0.3, help='写操作占比')
+        parser.add_argument('--profile', choices=sorted(PROFILES), action='append',
+                            help='只压测指定配置，可多次指定；默认两种都测')
+        parser.add_argument('--seed', type=int, default=1, help='随机种子')
+
+    def handle(self, *args, **options):
+        source = connections['default']
+        if source.vendor != 'sqlite':
+            raise CommandError('仅支持 SQLite')
+        post_ids = list(Post.objects.filter(is_active=True).values_list('id', flat=True)[:5000])
+        user_ids = list(Post.objects.values_list('author_id', flat=True).distinct()[:500])
+        if not post_ids:
+            raise CommandError('没有可用的帖子，请先执行 seed_demo_data 生成数据')
+
+        workdir = Path(tempfile.mkdtemp(prefix='tieba-stress-'))
+        try:
+            results = {}
+            for profile in options['profile'] or ['default', 'tuned']:
+                alias = f'stress_{profile}'
+                path = workdir / f'{profile}.sqlite3'
+                self.copy_database(source, path)
+                settings_dict = dict(source.settings_dict, ENGINE=PROFILES[profile], NAME=str(path))
+                connections.settings[alias] = settings_dict
+                try:
+                    results[profile] = self.run(alias, post_ids, user_ids, options)
+                finally:
+                    connections[alias].close()
+                    del connections.settings[alias]
+                self.report(profile, results[profile], options['duration'])
+
+            if len(results) == 2:
+                before, after = results['default'], results['tuned']
+                ratio = after['ops'] / before['ops'] if before['ops'] else float('inf')
+                self.stdout.write(self.style.SUCCESS(
+                    f"\n吞吐量 {before['ops'] / options['duration']:.0f} -> "
+                    f"{after['ops'] / options['duration']:.0f} 次/秒（{ratio:.2f} 倍），"
+                    f"锁冲突 {before['locked']} -> {after['locked']}"
+                ))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def copy_database(self, source, path):
+        """用 SQLite 在线备份复制一份数据库，并恢复为默认的回滚日志模式"""
+        source.ensure_connection()
+        target = sqlite3.connect(path)
+        source.connection.backup(target)
+        target.execute('PRAGMA journal_mode = DELETE')
+        target.close()
+
+    def run(self, alias, post_ids, user_ids, options):
+        deadline = time.monotonic() + options['duration']
+        lock = threading.Lock()
+        totals = {'ops': 0, 'reads': [], 'writes': [], 'locked': 0, 'errors': 0}
+
+        def worker(index):
+            rng = random.Random(options['seed'] * 1000 + index)
+            reads, writes, locked, errors = [], [], 0, 0
+            try:
+                while time.monotonic() < deadline:
+                    is_write = rng.random() < options['write_ratio']
+                    operation = rng.choice(WRITES if is_write else READS)
+                    started = time.perf_counter()
+                    try:
+                        operation(alias, rng, post_ids, user_ids)
+                    except OperationalError as error:
+                        if 'locked' in str(error):
+                            locked += 1
+                        else:
+                            errors += 1
+                        continue
+                    (writes if is_write else reads).append((time.perf_counter() - started) * 1000)
+            finally:
+                connections[alias].close()
+            with lock:
+                totals['ops'] += len(reads) + len(writes)
+                totals['reads'] += reads
+                totals['writes'] += writes
+                totals['locked'] += locked
+                totals['errors'] += errors
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return totals
+
+    def report(self, profile, result, duration):
+        self.stdout.write(f'\n[{profile}] {PROFILES[profile]}')
+        self.stdout.write(
+            f"  完成 {result['ops']} 次操作（{result['ops'] / duration:.0f} 次/秒），"
+            f"锁冲突失败 {result['locked']} 次，其他错误 {result['errors']} 次"
+        )
+        for label, timings in (('读', result['reads']), ('写', result['writes'])):
+            if timings:
+                self.stdout.write(
+                    f'  {label} {len(timings):>6} 次  p50 {percentile(timings, 50):8.2f}  '
+                    f'p95 {percentile(timings, 95):8.2f}  p99 {percentile(timings, 99):8.2f} ms'
+                )
+
+
+# 读操作：首页一页、帖子详情
+
+def read_feed(alias, rng, post_ids, user_ids):
+    list(post_cards(Post.objects.using(alias).filter(is_active=True)).order_by('-created_at', '-id')[:12])
+
+
+def read_detail(alias, rng, post_ids, user_ids):
+    post_id = rng.choice(post_ids)
+    Post.objects.using(alias).select_related('author', 'category').get(id=post_id)
+    list(Comment.objects.using(alias).filter(post_id=post_id, depth=0, is_active=True)
+         .select_related('author').order_by('created_at', 'id')[:20])
+
+
+# 写操作：与应用里的语句一致，但直接执行 SQL，不触发信号（信号会写默认数据库）
+
+def write_like(alias, rng, post_ids, user_ids):
+    """先查后写的点赞切换，默认后端下 DEFERRED 事务在这里最容易死锁"""
+    post_id, user_id = rng.choice(post_ids), rng.choice(user_ids)
+    with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+        cursor.execute('SELECT id FROM tieba_like WHERE user_id = %s AND post_id = %s', [user_id, post_id])
+        if cursor.fetchone():
+            cursor.execute('DELETE FROM tieba_like WHERE user_id = %s AND post_id = %s', [user_id, post_id])
+            delta = -1
+        else:
+            cursor.execute(
+                'INSERT INTO tieba_like (user_id, post_id, created_at) VALUES (%s, %s, %s)',
+                [user_id, post_id, timezone.now()],
+            )
+            delta = 1
+        cursor.execute('UPDATE tieba_post SET like_count = like_count + %s WHERE id = %s', [delta, post_id])
+
+
+def write_comment(alias, rng, post_ids, user_ids):
+    post_id = rng.choice(post_ids)
+    with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO tieba_comment (post_id, author_id, content, created_at, depth, path, '
+            'reply_count, like_count, is_active) VALUES (%s, %s, %s, %s, 0, %s, 0, 0, 1)',
+            [post_id, rng.choice(user_ids), '压测评论', timezone.now(), ''],
+        )
+        cursor.execute('UPDATE tieba_post SET comment_count = comment_count + 1 WHERE id = %s', [post_id])
+
+
+def write_views(alias, rng, post_ids, user_ids):
+    """浏览数缓冲的批量写回（自动提交的单条语句）"""
+    ids = rng.sample(post_ids, min(20, len(post_ids)))
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            f"UPDATE tieba_post SET view_count = view_count + 1 WHERE id IN ({', '.join(['%s'] * len(ids))})",
+            ids,
+        )
+
+
+READS = [read_feed, read_detail]
+WRITES = [write_like, write_comment, write_views]
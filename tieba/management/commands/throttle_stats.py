@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tieba import throttle
+from tieba.cache import get_cache, is_process_local
+
+
+class Command(BaseCommand):
+    help = '查看各写操作被限流拒绝的次数（统计保存在缓存中，多进程部署需使用共享缓存）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='输出后清零统计')
+
+    def handle(self, *args, **options):
+        if is_process_local(get_cache()):
+            # 拒绝次数累计在 web 进程的进程内缓存里，本命令所在的进程读到的永远是 0
+            raise CommandError('限流统计在进程内缓存中，命令读不到 web 进程的统计；请设置 TIEBA_CACHE_BACKEND=file 使用共享缓存')
+        rates = throttle.get_config()['RATES']
+        for scope, counts in throttle.stats().items():
+            limits = '  '.join(f'{kind} {rates[scope].get(kind) or "不限"}' for kind in throttle.KINDS)
+            self.stdout.write(f"{scope:<10} 按用户拒绝 {counts['user']}  按 IP 拒绝 {counts['ip']}  （{limits}）")
+        if options['reset']:
+            throttle.reset_stats()
+            self.stdout.write(self.style.SUCCESS('统计已清零'))
@@ -0,0 +1,65 @@
+import re
+
+from django.db import migrations
+
+CREATE_SQL = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS tieba_post_fts '
+    "USING fts5(title, content, tags, tokenize='unicode61')"
+)
+INSERT_SQL = 'INSERT INTO tieba_post_fts (rowid, title, content, tags) VALUES (%s, %s, %s, %s)'
+
+# 分词规则按写这个迁移时的 tieba.search.segment 固定下来，之后修改分词不影响本迁移
+CJK_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+
+
+def segment(text):
+    """把连续汉字切成重叠二元组，其余文本原样保留"""
+    def bigrams(match):
+        run = match.group()
+        if len(run) == 1:
+            return f' {run} '
+        return ' ' + ' '.join(run[i:i + 2] for i in range(len(run) - 1)) + ' '
+    return CJK_RE.sub(bigrams, text or '')
+
+
+def create_search_index(apps, schema_editor):
+    # 只有 SQLite 且编译了 FTS5 时才建表，否则检索自动退回 icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute(CREATE_SQL)
+        except Exception:
+            return
+
+        # 为已有帖子建立索引
+        Post = apps.get_model('tieba', 'Post')
+        rows = []
+        for post in Post.objects.filter(is_active=True, is_draft=False).iterator(chunk_size=500):
+            tags = post.tags if isinstance(post.tags, list) else []
+            rows.append((
+                post.id, segment(post.title), segment(post.content),
+                segment(' '.join(str(tag) for tag in tags)),
+            ))
+            if len(rows) >= 500:
+                cursor.executemany(INSERT_SQL, rows)
+                rows = []
+        if rows:
+            cursor.executemany(INSERT_SQL, rows)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS tieba_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tieba', '0003_post_is_draft_post_tags'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
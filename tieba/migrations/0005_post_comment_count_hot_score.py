@@ -0,0 +1,73 @@
+# Generated by Django 4.2 on 2026-10-18 09:44
+
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+# 评分公式按写这个迁移时的 tieba.ranking 固定下来，之后调整公式不影响本迁移
+EPOCH = datetime(2023, 1, 1, tzinfo=dt_timezone.utc)
+HOT_GRAVITY = 45000
+RECOMMEND_GRAVITY = 90000
+
+
+def hot_score(view_count, like_count, favorite_count, comment_count, created_at):
+    points = view_count * 0.1 + like_count * 2 + favorite_count * 3 + comment_count * 1.5
+    return math.log10(max(points, 1)) + (created_at - EPOCH).total_seconds() / HOT_GRAVITY
+
+
+def recommend_score(view_count, like_count, favorite_count, comment_count, created_at):
+    engagement = like_count + favorite_count * 2 + comment_count
+    quality = engagement / (view_count + 20)
+    return (
+        math.log10(1 + quality * 100)
+        + 0.5 * math.log10(max(engagement, 1))
+        + (created_at - EPOCH).total_seconds() / RECOMMEND_GRAVITY
+    )
+
+
+def backfill_scores(apps, schema_editor):
+    Post = apps.get_model('tieba', 'Post')
+    last_id = 0
+    while True:
+        posts = list(
+            Post.objects.filter(id__gt=last_id)
+            .annotate(active_comments=Count('comments', filter=Q(comments__is_active=True)))
+            .order_by('id')[:1000]
+        )
+        if not posts:
+            break
+        for post in posts:
+            post.comment_count = post.active_comments
+            values = [post.view_count, post.like_count, post.favorite_count, post.comment_count]
+            post.hot_score = hot_score(*values, post.created_at)
+            post.recommend_score = recommend_score(*values, post.created_at)
+        Post.objects.bulk_update(posts, ['comment_count', 'hot_score', 'recommend_score'])
+        last_id = posts[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tieba', '0004_post_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='评论数'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='hot_score',
+            field=models.FloatField(db_index=True, default=0, verbose_name='热度分'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='recommend_score',
+            field=models.FloatField(db_index=True, default=0, verbose_name='推荐分'),
+        ),
+        migrations.RunPython(backfill_scores, migrations.RunPython.noop),
+    ]
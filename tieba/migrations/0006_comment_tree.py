@@ -0,0 +1,85 @@
+# Generated by Django 4.2 on 2026-10-18 09:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# 与 tieba.threads 保持一致
+PATH_WIDTH = 10
+MAX_DEPTH = 20
+
+
+def backfill_tree(apps, schema_editor):
+    """按帖子逐个回填 root/depth/path/reply_count"""
+    Comment = apps.get_model('tieba', 'Comment')
+    post_ids = Comment.objects.order_by().values_list('post_id', flat=True).distinct()
+    for post_id in post_ids.iterator():
+        comments = {
+            c.id: c for c in Comment.objects.filter(post_id=post_id).only('id', 'parent_id', 'is_active')
+        }
+        resolved = {}
+
+        def resolve(comment):
+            if comment.id in resolved:
+                return resolved[comment.id]
+            parent = comments.get(comment.parent_id)
+            segment = str(comment.id).zfill(PATH_WIDTH)
+            if parent is None:
+                node = (comment.id, 0, segment)
+            else:
+                root_id, depth, path = resolve(parent)
+                if depth >= MAX_DEPTH:
+                    path, depth = path.rsplit('/', 1)[0], depth - 1
+                node = (root_id, depth + 1, f'{path}/{segment}')
+            resolved[comment.id] = node
+            return node
+
+        reply_counts = {}
+        for comment in comments.values():
+            root_id, comment.depth, comment.path = resolve(comment)
+            comment.root_id = None if root_id == comment.id else root_id
+            if comment.root_id and comment.is_active:
+                reply_counts[root_id] = reply_counts.get(root_id, 0) + 1
+        for comment in comments.values():
+            comment.reply_count = reply_counts.get(comment.id, 0)
+        Comment.objects.bulk_update(
+            comments.values(), ['root', 'depth', 'path', 'reply_count'], batch_size=500
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tieba', '0005_post_comment_count_hot_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='层级'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='楼层路径'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='回复数'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='root',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='descendants', to='tieba.comment', verbose_name='所属楼层'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'depth', 'created_at'], name='comment_post_depth_created'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['root', 'path'], name='comment_root_path'),
+        ),
+        migrations.RunPython(backfill_tree, migrations.RunPython.noop),
+    ]
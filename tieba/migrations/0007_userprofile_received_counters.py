@@ -0,0 +1,57 @@
+# Generated by Django 4.2 on 2026-10-18 09:48
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def _aggregate(model, aggregate):
+    rows = (
+        model.objects.filter(author=OuterRef('user_id'), is_active=True)
+        .order_by()
+        .values('author')
+        .annotate(total=aggregate)
+        .values('total')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def backfill_counters(apps, schema_editor):
+    """补建缺失的用户资料，并按内容表回填计数"""
+    User = apps.get_model('auth', 'User')
+    UserProfile = apps.get_model('tieba', 'UserProfile')
+    Post = apps.get_model('tieba', 'Post')
+    Comment = apps.get_model('tieba', 'Comment')
+
+    missing = User.objects.filter(userprofile__isnull=True).values_list('id', flat=True)
+    UserProfile.objects.bulk_create(
+        [UserProfile(user_id=user_id) for user_id in missing.iterator()], batch_size=500
+    )
+    UserProfile.objects.update(
+        post_count=_aggregate(Post, Count('id')),
+        comment_count=_aggregate(Comment, Count('id')),
+        likes_received=_aggregate(Post, Sum('like_count')) + _aggregate(Comment, Sum('like_count')),
+        favorites_received=_aggregate(Post, Sum('favorite_count')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('tieba', '0006_comment_tree'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='favorites_received',
+            field=models.PositiveIntegerField(default=0, verbose_name='被收藏数'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='likes_received',
+            field=models.PositiveIntegerField(default=0, verbose_name='获赞数'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2 on 2026-10-18 09:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tieba', '0007_userprofile_received_counters'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='comment_post_depth_created',
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='hot_score',
+            field=models.FloatField(default=0, verbose_name='热度分'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='recommend_score',
+            field=models.FloatField(default=0, verbose_name='推荐分'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['post', 'depth', 'created_at'], name='comment_post_active_created'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['author', '-created_at'], name='comment_author_created'),
+        ),
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', '-created_at'], name='favorite_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at', '-id'], name='post_active_created'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', '-created_at'], name='post_category_created'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['author', '-created_at'], name='post_author_created'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-hot_score', '-id'], name='post_active_hot'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-recommend_score', '-id'], name='post_active_recommend'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-view_count'], name='post_active_views'),
+        ),
+    ]
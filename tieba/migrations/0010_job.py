@@ -0,0 +1,54 @@
+# Generated by Django 4.2 on 2026-10-18 10:21
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tieba', '0009_userprofile_avatar_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='任务')),
+                ('kwargs', models.JSONField(blank=True, default=dict, verbose_name='参数')),
+                ('priority', models.SmallIntegerField(default=0, verbose_name='优先级')),
+                ('status', models.CharField(choices=[('pending', '等待执行'), ('running', '执行中'), ('done', '已完成'), ('failed', '失败')], default='pending', max_length=10, verbose_name='状态')),
+                ('dedupe_key', models.CharField(blank=True, max_length=200, null=True, verbose_name='去重键')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='计划执行时间')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='已执行次数')),
+                ('max_attempts', models.PositiveSmallIntegerField(default=5, verbose_name='最多执行次数')),
+                ('last_error', models.TextField(blank=True, verbose_name='最近一次错误')),
+                ('locked_by', models.CharField(blank=True, max_length=100, verbose_name='执行进程')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='认领到期时间')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='结束时间')),
+            ],
+            options={
+                'verbose_name': '后台任务',
+                'verbose_name_plural': '后台任务',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['-priority', 'run_at', 'id'], name='job_pending'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(('status', 'running')), fields=['locked_until'], name='job_running'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(('status', 'done')), fields=['finished_at'], name='job_done'),
+        ),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('dedupe_key',), name='job_pending_dedupe'),
+        ),
+    ]
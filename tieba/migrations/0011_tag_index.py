@@ -0,0 +1,112 @@
+# Generated by Django 4.2 on 2026-10-18 10:26
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def _names(tags):
+    """与 tags.normalize 相同的整理规则"""
+    names = []
+    for tag in tags if isinstance(tags, list) else []:
+        if not isinstance(tag, str):
+            continue
+        name = tag.strip().lower()
+        if name and len(name) <= 20 and '/' not in name and name not in names:
+            names.append(name)
+    return names[:5]
+
+
+def backfill_tags(apps, schema_editor):
+    """按 id 区间分批从 Post.tags 回填标签和关联表，最后统计各标签的帖子数"""
+    Post = apps.get_model('tieba', 'Post')
+    Tag = apps.get_model('tieba', 'Tag')
+    PostTag = apps.get_model('tieba', 'PostTag')
+
+    last_id = 0
+    while True:
+        posts = list(
+            Post.objects.filter(id__gt=last_id)
+            .only('id', 'tags', 'created_at', 'is_active', 'is_draft')
+            .order_by('id')[:500]
+        )
+        if not posts:
+            break
+        names = sorted({name for post in posts for name in _names(post.tags)})
+        Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+        tag_ids = dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+        PostTag.objects.bulk_create([
+            PostTag(post_id=post.id, tag_id=tag_ids[name], created_at=post.created_at,
+                    is_visible=post.is_active and not post.is_draft)
+            for post in posts
+            for name in _names(post.tags)
+        ])
+        last_id = posts[-1].id
+
+    rows = (
+        PostTag.objects.filter(tag=OuterRef('pk'), is_visible=True)
+        .order_by()
+        .values('tag')
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+    Tag.objects.update(post_count=Coalesce(Subquery(rows, output_field=IntegerField()), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tieba', '0010_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(verbose_name='帖子发布时间')),
+                ('is_visible', models.BooleanField(default=True, verbose_name='是否可见')),
+            ],
+            options={
+                'verbose_name': '帖子标签',
+                'verbose_name_plural': '帖子标签',
+            },
+        ),
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20, unique=True, verbose_name='标签名')),
+                ('post_count', models.PositiveIntegerField(default=0, verbose_name='帖子数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+            ],
+            options={
+                'verbose_name': '标签',
+                'verbose_name_plural': '标签',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['-post_count', 'name'], name='tag_popular'),
+        ),
+        migrations.AddField(
+            model_name='posttag',
+            name='post',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_links', to='tieba.post', verbose_name='帖子'),
+        ),
+        migrations.AddField(
+            model_name='posttag',
+            name='tag',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='post_links', to='tieba.tag', verbose_name='标签'),
+        ),
+        migrations.AddIndex(
+            model_name='posttag',
+            index=models.Index(condition=models.Q(('is_visible', True)), fields=['tag', '-created_at', '-post'], name='post_tag_feed'),
+        ),
+        migrations.AddConstraint(
+            model_name='posttag',
+            constraint=models.UniqueConstraint(fields=('post', 'tag'), name='post_tag_unique'),
+        ),
+        migrations.RunPython(backfill_tags, migrations.RunPython.noop),
+    ]
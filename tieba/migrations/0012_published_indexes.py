@@ -0,0 +1,53 @@
+# Generated by Django 4.2 on 2026-10-18 10:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tieba', '0011_tag_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='post',
+            name='post_active_created',
+        ),
+        migrations.RemoveIndex(
+            model_name='post',
+            name='post_category_created',
+        ),
+        migrations.RemoveIndex(
+            model_name='post',
+            name='post_active_hot',
+        ),
+        migrations.RemoveIndex(
+            model_name='post',
+            name='post_active_recommend',
+        ),
+        migrations.RemoveIndex(
+            model_name='post',
+            name='post_active_views',
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_draft', False)), fields=['-created_at', '-id'], name='post_public_created'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_draft', False)), fields=['category', '-created_at'], name='post_public_category'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_draft', False)), fields=['-hot_score', '-id'], name='post_public_hot'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_draft', False)), fields=['-recommend_score', '-id'], name='post_public_recommend'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_draft', False)), fields=['-view_count'], name='post_public_views'),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 4.2 on 2026-10-18 10:37
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+import django.db.models.deletion
+
+
+def backfill_deleted_at(apps, schema_editor):
+    """已软删除的行没有删除时间，帖子取最后修改时间，评论取发表时间"""
+    Post = apps.get_model('tieba', 'Post')
+    Comment = apps.get_model('tieba', 'Comment')
+    Post.objects.filter(is_active=False, deleted_at__isnull=True).update(deleted_at=F('updated_at'))
+    Comment.objects.filter(is_active=False, deleted_at__isnull=True).update(deleted_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tieba', '0013_follow_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedComment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='评论 id')),
+                ('post_id', models.BigIntegerField(db_index=True, verbose_name='所属帖子 id')),
+                ('content', models.TextField(verbose_name='评论内容')),
+                ('deleted_at', models.DateTimeField(blank=True, null=True, verbose_name='删除时间')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='归档时间')),
+                ('data', models.JSONField(verbose_name='评论数据')),
+                ('likes', models.JSONField(default=list, verbose_name='点赞记录')),
+            ],
+            options={
+                'verbose_name': '归档评论',
+                'verbose_name_plural': '归档评论',
+                'ordering': ['-archived_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedPost',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='帖子 id')),
+                ('title', models.CharField(max_length=200, verbose_name='帖子标题')),
+                ('content', models.TextField(verbose_name='帖子内容')),
+                ('deleted_at', models.DateTimeField(verbose_name='删除时间')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='归档时间')),
+                ('data', models.JSONField(verbose_name='帖子数据')),
+                ('likes', models.JSONField(default=list, verbose_name='点赞记录')),
+                ('favorites', models.JSONField(default=list, verbose_name='收藏记录')),
+            ],
+            options={
+                'verbose_name': '归档帖子',
+                'verbose_name_plural': '归档帖子',
+                'ordering': ['-deleted_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='删除时间'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='删除时间'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_active', False)), fields=['deleted_at'], name='comment_deleted'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', False)), fields=['deleted_at'], name='post_deleted'),
+        ),
+        migrations.AddField(
+            model_name='archivedpost',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='作者'),
+        ),
+        migrations.AddField(
+            model_name='archivedcomment',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='评论者'),
+        ),
+        migrations.RunPython(backfill_deleted_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-18 10:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tieba', '0014_archive'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='post',
+            name='post_author_created',
+        ),
+        migrations.RemoveIndex(
+            model_name='post',
+            name='post_public_category',
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_draft', False)), fields=['category', '-created_at', '-id'], name='post_public_category'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['author', '-created_at', '-id'], name='post_author_created'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tieba', '0015_cursor_index_tiebreak'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingView',
+            fields=[
+                ('post_id', models.PositiveIntegerField(primary_key=True, serialize=False, verbose_name='帖子')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='浏览增量')),
+            ],
+            options={
+                'verbose_name': '待写回浏览数',
+                'verbose_name_plural': '待写回浏览数',
+            },
+        ),
+    ]
@@ -2,12 +2,22 @@ from django.db import models
 from django.contrib.auth.models import User as AuthUser
 from django.utils import timezone
 
+# 只索引有效（未删除）的行
+ACTIVE = models.Q(is_active=True)
+
+# 公开列表只查已发布的帖子：有效且不是草稿
+PUBLISHED = models.Q(is_active=True, is_draft=False)
+
+# 已软删除、等待归档的行
+DELETED = models.Q(is_active=False)
+
 
 class Category(models.Model):
     """贴吧分类模型"""
     name = models.CharField(max_length=50, verbose_name='分类名称')
     description = models.TextField(blank=True, verbose_name='分类描述')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    follower_count = models.PositiveIntegerField(default=0, verbose_name='关注数')
     
     class Meta:
         verbose_name = '分类'
@@ -30,19 +40,86 @@ class Post(models.Model):
     view_count = models.PositiveIntegerField(default=0, verbose_name='浏览数')
     like_count = models.PositiveIntegerField(default=0, verbose_name='点赞数')
     favorite_count = models.PositiveIntegerField(default=0, verbose_name='收藏数')
+    comment_count = models.PositiveIntegerField(default=0, verbose_name='评论数')
+    hot_score = models.FloatField(default=0, verbose_name='热度分')
+    recommend_score = models.FloatField(default=0, verbose_name='推荐分')
     is_pinned = models.BooleanField(default=False, verbose_name='是否置顶')
     is_active = models.BooleanField(default=True, verbose_name='是否有效')
     is_draft = models.BooleanField(default=False, verbose_name='是否为草稿')
+    deleted_at = models.DateTimeField(null=True, blank=True, verbose_name='删除时间')
     
     class Meta:
         verbose_name = '帖子'
         verbose_name_plural = '帖子'
         ordering = ['-created_at']
+        indexes = [
+            # 列表页只查已发布的帖子。Django 把 is_active=True 生成为 WHERE "is_active"，
+            # SQLite 无法用这种条件匹配 (is_active, ...) 复合索引的前缀，
+            # 因此统一用带同样条件的部分索引，草稿和已删除的帖子不进索引，
+            # 公开列表跳过它们没有任何开销
+            # 首页、搜索页"最新"排序
+            models.Index(fields=['-created_at', '-id'], name='post_public_created', condition=PUBLISHED),
+            # 分类页、首页分类筛选
+            # （以 -id 结尾，与游标分页的排序键一致，否则同一时间内的行要另行排序）
+            models.Index(fields=['category', '-created_at', '-id'], name='post_public_category', condition=PUBLISHED),
+            # 个人中心、用户资料页（个人中心要列出自己的草稿）
+            models.Index(fields=['author', '-created_at', '-id'], name='post_author_created', condition=ACTIVE),
+            # 热门、推荐排序及侧栏热门帖子
+            models.Index(fields=['-hot_score', '-id'], name='post_public_hot', condition=PUBLISHED),
+            models.Index(fields=['-recommend_score', '-id'], name='post_public_recommend', condition=PUBLISHED),
+            models.Index(fields=['-view_count'], name='post_public_views', condition=PUBLISHED),
+            # 归档：按删除时间取出超过保留期的帖子（见 archive.py）
+            models.Index(fields=['deleted_at'], name='post_deleted', condition=DELETED),
+        ]
     
     def __str__(self):
         return self.title
 
 
+class Tag(models.Model):
+    """标签（见 tags.py），名称统一为小写"""
+    name = models.CharField(max_length=20, unique=True, verbose_name='标签名')
+    post_count = models.PositiveIntegerField(default=0, verbose_name='帖子数')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+
+    class Meta:
+        verbose_name = '标签'
+        verbose_name_plural = '标签'
+        indexes = [
+            # 侧栏热门标签
+            models.Index(fields=['-post_count', 'name'], name='tag_popular'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class PostTag(models.Model):
+    """帖子与标签的倒排索引
+
+    冗余保存帖子的发布时间和可见性（有效且不是草稿），标签页按
+    (tag, -created_at, -post) 的部分索引直接取出一页，不必关联帖子表排序。
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='tag_links', verbose_name='帖子')
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='post_links', verbose_name='标签')
+    created_at = models.DateTimeField(verbose_name='帖子发布时间')
+    is_visible = models.BooleanField(default=True, verbose_name='是否可见')
+
+    class Meta:
+        verbose_name = '帖子标签'
+        verbose_name_plural = '帖子标签'
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'tag'], name='post_tag_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['tag', '-created_at', '-post'], name='post_tag_feed',
+                         condition=models.Q(is_visible=True)),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id} - {self.tag_id}'
+
+
 class Comment(models.Model):
     """评论模型"""
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments', verbose_name='所属帖子')
@@ -51,13 +128,29 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='评论时间')
     parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, 
                               related_name='replies', verbose_name='父评论')
+    root = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE,
+                             related_name='descendants', verbose_name='所属楼层')
+    depth = models.PositiveSmallIntegerField(default=0, verbose_name='层级')
+    path = models.CharField(max_length=255, blank=True, default='', verbose_name='楼层路径')
+    reply_count = models.PositiveIntegerField(default=0, verbose_name='回复数')
     like_count = models.PositiveIntegerField(default=0, verbose_name='点赞数')
     is_active = models.BooleanField(default=True, verbose_name='是否有效')
+    deleted_at = models.DateTimeField(null=True, blank=True, verbose_name='删除时间')
     
     class Meta:
         verbose_name = '评论'
         verbose_name_plural = '评论'
         ordering = ['created_at']
+        indexes = [
+            # 楼层分页：某帖子的有效顶层评论按时间排列
+            models.Index(fields=['post', 'depth', 'created_at'], name='comment_post_active_created',
+                         condition=ACTIVE),
+            # 楼中楼：某楼层的全部回复按路径排列
+            models.Index(fields=['root', 'path'], name='comment_root_path'),
+            # 用户发表的评论
+            models.Index(fields=['author', '-created_at'], name='comment_author_created', condition=ACTIVE),
+            models.Index(fields=['deleted_at'], name='comment_deleted', condition=DELETED),
+        ]
     
     def __str__(self):
         return f'{self.author.username} - {self.content[:20]}'
@@ -67,11 +160,16 @@ class UserProfile(models.Model):
     """用户扩展信息模型"""
     user = models.OneToOneField(AuthUser, on_delete=models.CASCADE, verbose_name='用户')
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True, verbose_name='头像')
+    # 处理后的缩略图哈希，为空表示头像尚未处理（见 avatars.py）
+    avatar_hash = models.CharField(max_length=20, blank=True, default='', verbose_name='头像版本')
     bio = models.TextField(blank=True, verbose_name='个人简介')
     location = models.CharField(max_length=100, blank=True, verbose_name='所在地')
     join_date = models.DateTimeField(auto_now_add=True, verbose_name='加入时间')
     post_count = models.PositiveIntegerField(default=0, verbose_name='发帖数')
     comment_count = models.PositiveIntegerField(default=0, verbose_name='评论数')
+    likes_received = models.PositiveIntegerField(default=0, verbose_name='获赞数')
+    favorites_received = models.PositiveIntegerField(default=0, verbose_name='被收藏数')
+    follower_count = models.PositiveIntegerField(default=0, verbose_name='粉丝数')
     
     class Meta:
         verbose_name = '用户资料'
@@ -110,6 +208,180 @@ class Favorite(models.Model):
         verbose_name = '收藏'
         verbose_name_plural = '收藏'
         unique_together = [('user', 'post')]
+        indexes = [
+            # 个人中心的收藏列表按收藏时间倒序
+            models.Index(fields=['user', '-created_at'], name='favorite_user_created'),
+        ]
     
     def __str__(self):
-        return f'{self.user.username} 收藏了帖子: {self.post.title}'
\ No newline at end of file
+        return f'{self.user.username} 收藏了帖子: {self.post.title}'
+
+class Follow(models.Model):
+    """关注用户"""
+    follower = models.ForeignKey(AuthUser, on_delete=models.CASCADE, related_name='following', verbose_name='关注者')
+    author = models.ForeignKey(AuthUser, on_delete=models.CASCADE, related_name='followers', verbose_name='被关注的用户')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='关注时间')
+
+    class Meta:
+        verbose_name = '关注用户'
+        verbose_name_plural = '关注用户'
+        constraints = [
+            # 兼作发帖扇出时按作者取粉丝的索引
+            models.UniqueConstraint(fields=['author', 'follower'], name='follow_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.follower_id} -> {self.author_id}'
+
+
+class CategoryFollow(models.Model):
+    """关注分类"""
+    user = models.ForeignKey(AuthUser, on_delete=models.CASCADE, related_name='category_follows', verbose_name='用户')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='follows', verbose_name='分类')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='关注时间')
+
+    class Meta:
+        verbose_name = '关注分类'
+        verbose_name_plural = '关注分类'
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'user'], name='category_follow_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} -> {self.category_id}'
+
+
+class TimelineEntry(models.Model):
+    """关注动态的收件箱（见 feed.py）
+
+    发帖时写入关注者的收件箱，冗余帖子的发布时间，动态页按
+    (user, -created_at, -post) 的索引直接取出一页。每个用户只保留最近的若干条。
+    """
+    user = models.ForeignKey(AuthUser, on_delete=models.CASCADE, related_name='timeline', verbose_name='用户')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries', verbose_name='帖子')
+    created_at = models.DateTimeField(verbose_name='帖子发布时间')
+
+    class Meta:
+        verbose_name = '关注动态'
+        verbose_name_plural = '关注动态'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'], name='timeline_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='timeline_user_feed'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} - {self.post_id}'
+
+
+class ArchivedPost(models.Model):
+    """归档的帖子（见 archive.py）
+
+    主键沿用原帖子 id；标题、正文、作者单独成列供后台检索，其余字段和
+    点赞、收藏记录原样存为 JSON，恢复时写回原表。
+    """
+    id = models.BigIntegerField(primary_key=True, verbose_name='帖子 id')
+    author = models.ForeignKey(AuthUser, on_delete=models.CASCADE, related_name='+', verbose_name='作者')
+    title = models.CharField(max_length=200, verbose_name='帖子标题')
+    content = models.TextField(verbose_name='帖子内容')
+    deleted_at = models.DateTimeField(verbose_name='删除时间')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='归档时间')
+    data = models.JSONField(verbose_name='帖子数据')
+    likes = models.JSONField(default=list, verbose_name='点赞记录')
+    favorites = models.JSONField(default=list, verbose_name='收藏记录')
+
+    class Meta:
+        verbose_name = '归档帖子'
+        verbose_name_plural = '归档帖子'
+        ordering = ['-deleted_at']
+
+    def __str__(self):
+        return self.title
+
+
+class ArchivedComment(models.Model):
+    """归档的评论，帖子归档时其下全部评论一并归档"""
+    id = models.BigIntegerField(primary_key=True, verbose_name='评论 id')
+    # 所属帖子可能在帖子表，也可能已归档，不加外键
+    post_id = models.BigIntegerField(db_index=True, verbose_name='所属帖子 id')
+    author = models.ForeignKey(AuthUser, on_delete=models.CASCADE, related_name='+', verbose_name='评论者')
+    content = models.TextField(verbose_name='评论内容')
+    deleted_at = models.DateTimeField(null=True, blank=True, verbose_name='删除时间')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='归档时间')
+    data = models.JSONField(verbose_name='评论数据')
+    likes = models.JSONField(default=list, verbose_name='点赞记录')
+
+    class Meta:
+        verbose_name = '归档评论'
+        verbose_name_plural = '归档评论'
+        ordering = ['-archived_at']
+
+    def __str__(self):
+        return self.content[:20]
+
+
+class Job(models.Model):
+    """后台任务（见 jobs.py）"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, '等待执行'),
+        (RUNNING, '执行中'),
+        (DONE, '已完成'),
+        (FAILED, '失败'),
+    ]
+
+    name = models.CharField(max_length=100, verbose_name='任务')
+    kwargs = models.JSONField(default=dict, blank=True, verbose_name='参数')
+    priority = models.SmallIntegerField(default=0, verbose_name='优先级')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, verbose_name='状态')
+    dedupe_key = models.CharField(max_length=200, null=True, blank=True, verbose_name='去重键')
+    run_at = models.DateTimeField(default=timezone.now, verbose_name='计划执行时间')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='已执行次数')
+    max_attempts = models.PositiveSmallIntegerField(default=5, verbose_name='最多执行次数')
+    last_error = models.TextField(blank=True, verbose_name='最近一次错误')
+    locked_by = models.CharField(max_length=100, blank=True, verbose_name='执行进程')
+    locked_until = models.DateTimeField(null=True, blank=True, verbose_name='认领到期时间')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='开始时间')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='结束时间')
+
+    class Meta:
+        verbose_name = '后台任务'
+        verbose_name_plural = '后台任务'
+        indexes = [
+            # worker 认领：等待中的任务按优先级、计划时间排列
+            models.Index(fields=['-priority', 'run_at', 'id'], name='job_pending',
+                         condition=models.Q(status='pending')),
+            # 回收认领到期（worker 已退出）的任务
+            models.Index(fields=['locked_until'], name='job_running', condition=models.Q(status='running')),
+            # 清理已完成的任务、统计最近的执行耗时
+            models.Index(fields=['finished_at'], name='job_done', condition=models.Q(status='done')),
+        ]
+        constraints = [
+            # 同一去重键只保留一个等待中的任务
+            models.UniqueConstraint(fields=['dedupe_key'], condition=models.Q(status='pending'),
+                                    name='job_pending_dedupe'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.id}'
+
+
+class PendingView(models.Model):
+    """尚未写回帖子的浏览增量（浏览数 database 后端，见 counters.py）
+
+    不设外键：每次浏览都要写这张表，不为它检查帖子是否存在。
+    """
+    post_id = models.PositiveIntegerField(primary_key=True, verbose_name='帖子')
+    count = models.PositiveIntegerField(default=0, verbose_name='浏览增量')
+
+    class Meta:
+        verbose_name = '待写回浏览数'
+        verbose_name_plural = '待写回浏览数'
+
+    def __str__(self):
+        return f'{self.post_id} +{self.count}'
@@ -0,0 +1,97 @@
+"""批量审核操作
+
+后台的批量软删除、恢复、置顶、移动分类。每批选中的行只执行一条 UPDATE，
+不逐行 save()，因此不会逐行触发信号；信号原本维护的冗余数据（作者计数、
+帖子评论数、楼层回复数、检索索引、标签索引、侧栏缓存、实时推送）在这里按集合一次性
+修正。计数用相关子查询按内容表重算而不是按增量加减，与其他写入交错或重复
+执行时结果仍然正确。
+"""
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache import bump_version, touch_mark
+from .models import Comment, Post
+from .ranking import refresh_scores
+from . import live, search, stats, tags
+
+# 每批处理的行数，每批一个短事务，避免长时间持有 SQLite 写锁
+CHUNK_SIZE = 500
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _active_comment_count(fk):
+    """按外键统计有效评论数的相关子查询"""
+    rows = (
+        Comment.objects.filter(**{fk: OuterRef('pk')}, is_active=True)
+        .order_by()
+        .values(fk)
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def set_posts_active(queryset, active):
+    """批量软删除（active=False）或恢复帖子，返回状态变化的帖子数"""
+    rows = list(queryset.filter(is_active=not active).order_by().values_list('id', 'author_id'))
+    for chunk in _chunks(rows):
+        post_ids = [post_id for post_id, _ in chunk]
+        with transaction.atomic():
+            Post.objects.filter(id__in=post_ids).update(is_active=active, deleted_at=None if active else timezone.now())
+            stats.reconcile({author_id for _, author_id in chunk})
+            search.reindex_posts(post_ids)
+            tags.refresh_posts(post_ids)
+            if not active:
+                transaction.on_commit(lambda post_ids=post_ids: [
+                    live.publish_post_removed(post_id) for post_id in post_ids
+                ])
+    if rows:
+        bump_version('posts')
+    return len(rows)
+
+
+def set_comments_active(queryset, active):
+    """批量软删除或恢复评论，返回状态变化的评论数"""
+    rows = list(queryset.filter(is_active=not active).order_by().values_list('id', 'post_id', 'root_id', 'author_id'))
+    for chunk in _chunks(rows):
+        comment_ids = [row[0] for row in chunk]
+        post_ids = {row[1] for row in chunk}
+        root_ids = {row[2] for row in chunk if row[2]}
+        with transaction.atomic():
+            Comment.objects.filter(id__in=comment_ids).update(
+                is_active=active, deleted_at=None if active else timezone.now(),
+            )
+            Post.objects.filter(id__in=post_ids).update(comment_count=_active_comment_count('post'))
+            Comment.objects.filter(id__in=root_ids).update(reply_count=_active_comment_count('root'))
+            stats.reconcile({row[3] for row in chunk})
+            refresh_scores(post_ids)
+            for post_id in post_ids:
+                live.counters_changed(post_id=post_id)
+
+            def publish(chunk=chunk, post_ids=post_ids):
+                touch_mark(*(f'comments:{post_id}' for post_id in post_ids))
+                if not active:
+                    for comment_id, post_id, _, _ in chunk:
+                        live.publish_comment_removed(Comment(id=comment_id, post_id=post_id))
+            transaction.on_commit(publish)
+    return len(rows)
+
+
+def set_posts_pinned(queryset, pinned):
+    """批量置顶或取消置顶，返回变化的帖子数"""
+    return queryset.exclude(is_pinned=pinned).update(is_pinned=pinned)
+
+
+def move_posts(queryset, category):
+    """批量移动到另一个分类，返回移动的帖子数"""
+    moved = queryset.exclude(category=category).update(category=category)
+    if moved:
+        # 侧栏的分类帖子数依赖帖子版本号
+        bump_version('posts')
+    return moved
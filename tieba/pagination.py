@@ -0,0 +1,230 @@
+"""游标（keyset）分页
+
+Django 自带的 Paginator 每次请求都要 COUNT(*)，并用 OFFSET 翻页，页码越深
+越慢。这里按排序键（如 ``(created_at, id)``）记住当前页首尾两行的取值，
+下一页用 ``WHERE (created_at, id) < (...)`` 直接从索引定位，翻到多深都是
+同样的开销。游标是不透明的 base64 字符串，模板只需原样放进链接。
+
+总数是可选的：``count_limit`` 给定时只数到上限为止（``LIMIT n+1`` 的子查询），
+超过上限时显示"n+"，不做整表 COUNT。
+
+后台列表仍用页码分页，``EstimatedCountPaginator`` 在大表上用估算值代替
+COUNT(*)。
+"""
+import base64
+import datetime
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(Exception):
+    """游标无法解析"""
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """保留时间的微秒部分（DjangoJSONEncoder 会截到毫秒，导致边界行重复）"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values, direction):
+    """把排序键取值和翻页方向编码成不透明的游标字符串"""
+    payload = json.dumps({'v': list(values), 'd': direction}, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """解析游标，返回 (取值列表, 方向)"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        values, direction = payload['v'], payload['d']
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor(token)
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        raise InvalidCursor(token)
+    return values, direction
+
+
+class CursorPage:
+    """一页结果，接口尽量与 django.core.paginator.Page 保持一致"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, total=None, total_exact=True):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.total = total
+        self.total_exact = total_exact
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """按排序键做游标分页
+
+    ordering 是排序字段元组，如 ``('-created_at', '-id')``，最后一个字段必须
+    唯一（通常是 id），以保证翻页不重不漏。
+    """
+
+    def __init__(self, queryset, ordering, per_page, count_limit=None):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.count_limit = count_limit
+
+    @property
+    def fields(self):
+        return [name.lstrip('-') for name in self.ordering]
+
+    def _parse_values(self, values):
+        if len(values) != len(self.ordering):
+            raise InvalidCursor(values)
+        parsed = []
+        for name, value in zip(self.fields, values):
+            try:
+                field = self.queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                # 注解字段（如得分）直接使用原值，只接受标量
+                if not isinstance(value, (int, float, str)):
+                    raise InvalidCursor(values)
+                parsed.append(value)
+                continue
+            try:
+                value = field.to_python(value)
+            except (ValidationError, TypeError, ValueError):
+                # 伪造的游标可能带来任意 JSON 值（如 {}），to_python 会抛 TypeError
+                raise InvalidCursor(values)
+            if value is None:
+                raise InvalidCursor(values)
+            parsed.append(value)
+        return parsed
+
+    def _boundary_filter(self, values, reverse):
+        """构造 (a, b, c) 在排序方向上位于 values 之后的条件"""
+        condition = Q()
+        for i, name in enumerate(self.ordering):
+            field = name.lstrip('-')
+            descending = name.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            term = Q(**{f'{field}__{lookup}': values[i]})
+            for prev_name, prev_value in zip(self.fields[:i], values[:i]):
+                term &= Q(**{prev_name: prev_value})
+            condition |= term
+        return condition
+
+    def _key(self, obj):
+        return [getattr(obj, field) for field in self.fields]
+
+    def fetch(self, values, reverse, limit):
+        """取出游标之后（reverse 时为之前）的 limit 行，按正常顺序返回"""
+        queryset = self.queryset
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(name[1:] if name.startswith('-') else f'-{name}' for name in ordering)
+        if values is not None:
+            queryset = queryset.filter(self._boundary_filter(values, reverse))
+        rows = list(queryset.order_by(*ordering)[:limit])
+        if reverse:
+            rows.reverse()
+        return rows
+
+    def count(self):
+        """有上限的计数，返回 (总数, 是否精确)"""
+        total = self.queryset.order_by()[:self.count_limit + 1].count()
+        if total > self.count_limit:
+            return self.count_limit, False
+        return total, True
+
+    def page(self, cursor=None):
+        """返回游标指向的一页，游标无效时返回第一页"""
+        values, direction = None, 'next'
+        if cursor:
+            try:
+                values, direction = decode_cursor(cursor)
+                values = self._parse_values(values)
+            except InvalidCursor:
+                values, direction = None, 'next'
+
+        reverse = direction == 'prev'
+        rows = self.fetch(values, reverse, self.per_page + 1)
+        has_more = len(rows) > self.per_page
+        if has_more:
+            rows = rows[1:] if reverse else rows[:-1]
+
+        if reverse:
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = encode_cursor(self._key(rows[-1]), 'next')
+        if rows and has_previous:
+            previous_cursor = encode_cursor(self._key(rows[0]), 'prev')
+
+        total, total_exact = (None, True)
+        if self.count_limit is not None:
+            total, total_exact = self.count()
+        return CursorPage(rows, next_cursor, previous_cursor, total, total_exact)
+
+
+class EstimatedCountPaginator(Paginator):
+    """页码分页器，大表上不做整表 COUNT(*)
+
+    未加筛选时用最大主键估算总数。软删除不会留下空洞，但归档（见 archive.py）
+    和后台的物理删除会，估算值只是上限，归档得越多偏差越大；翻到估算出的
+    末尾几页而实际没有数据时，改用精确计数并退回真正的末页，不显示空页。
+    加了筛选或搜索时只数到 ``count_limit`` 为止，超出部分需要进一步筛选。
+    表本身小于 ``count_limit`` 时照常精确计数。
+    """
+    count_limit = 10000
+    estimated = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        if not queryset.query.where:
+            estimate = queryset.aggregate(n=Max('pk'))['n'] or 0
+            if estimate > self.count_limit:
+                self.estimated = True
+                return estimate
+            return queryset.count()
+        return queryset[:self.count_limit].count()
+
+    def page(self, number):
+        page = super().page(number)
+        if self.estimated and page.number > 1 and not page.object_list:
+            # 估算偏大翻到了空页：只在这时精确计数一次，退回真正的末页
+            self.estimated = False
+            self.__dict__['count'] = self.object_list.order_by().count()
+            self.__dict__.pop('num_pages', None)
+            self.__dict__.pop('page_range', None)
+            page = super().page(min(page.number, self.num_pages))
+        return page
@@ -0,0 +1,90 @@
+"""列表页共用的查询集
+
+各列表模板只用到帖子的少数几列以及作者名、分类名，这里统一用
+select_related 一次性取回关联对象，并用 only() 只取模板用到的列；
+卡片上的摘要由数据库截取正文前若干字符，不再取回整段 content。
+"""
+from django.contrib.auth.models import User
+from django.db.models import Count, Q
+from django.db.models.functions import Substr
+
+from .cache import cached
+from .models import Category, Comment, Favorite, Post
+from .tags import popular_tags
+
+# 卡片摘要截取的字符数
+EXCERPT_LENGTH = 200
+
+# 帖子卡片用到的列；热度分、推荐分是首页排序的游标键，一并取出
+CARD_FIELDS = (
+    'id', 'title', 'created_at', 'updated_at', 'view_count', 'like_count', 'is_pinned', 'is_draft',
+    'hot_score', 'recommend_score',
+    'author__id', 'author__username', 'category__id', 'category__name',
+)
+
+
+def post_cards(queryset=None, excerpt=None):
+    """帖子卡片查询：预取作者和分类，正文只取摘要
+
+    excerpt 可传入自定义的摘要表达式，默认截取正文开头。
+    """
+    if queryset is None:
+        queryset = Post.objects.all()
+    if excerpt is None:
+        excerpt = Substr('content', 1, EXCERPT_LENGTH)
+    return (
+        queryset
+        .select_related('author', 'category')
+        .only(*CARD_FIELDS)
+        .annotate(excerpt=excerpt)
+    )
+
+
+def hot_posts(limit=5):
+    """侧栏热门帖子，只取标题和计数"""
+    return (
+        Post.objects.filter(is_active=True, is_draft=False)
+        .only('id', 'title', 'view_count', 'like_count')
+        .order_by('-view_count')[:limit]
+    )
+
+
+def categories_with_counts():
+    """分类列表及每个分类的有效帖子数"""
+    return Category.objects.annotate(post_count=Count('post', filter=Q(post__is_active=True, post__is_draft=False)))
+
+
+def user_comments(user):
+    """用户发表的评论，预取所属帖子的标题"""
+    return (
+        Comment.objects.filter(author=user, is_active=True)
+        .select_related('post')
+        .only('id', 'content', 'created_at', 'author_id', 'post__id', 'post__title')
+        .order_by('-created_at')
+    )
+
+
+def favorite_cards(user):
+    """用户收藏的帖子，预取帖子及其作者、分类，正文只取摘要"""
+    return (
+        Favorite.objects.filter(user=user)
+        .select_related('post', 'post__author', 'post__category')
+        .only(
+            'id', 'created_at', 'user_id',
+            'post__id', 'post__title', 'post__created_at', 'post__view_count', 'post__like_count',
+            'post__author__id', 'post__author__username', 'post__category__id', 'post__category__name',
+        )
+        .annotate(post_excerpt=Substr('post__content', 1, EXCERPT_LENGTH))
+        .order_by('-created_at')
+    )
+
+
+def sidebar_widgets():
+    """首页、搜索页侧栏用到的统计数据，走带版本号的缓存"""
+    return {
+        'categories': cached('categories', ('posts', 'categories'), lambda: list(categories_with_counts())),
+        'hot_posts': cached('hot_posts', ('posts',), lambda: list(hot_posts())),
+        'total_posts': cached('total_posts', ('posts',), Post.objects.filter(is_active=True, is_draft=False).count),
+        'total_users': cached('total_users', ('users',), User.objects.count),
+        'popular_tags': popular_tags(),
+    }
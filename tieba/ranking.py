@@ -0,0 +1,106 @@
+"""帖子热度与推荐分
+
+热门、推荐两种排序不再每次请求按原始计数排序整表，而是把分数存进
+带索引的 ``hot_score`` / ``recommend_score`` 列，排序变成索引扫描加 LIMIT。
+
+两个分数都采用"对数互动量 + 发帖时间线性项"的形式：发帖时间越晚基础分越高，
+互动量需要成倍增长才能抵消时间差，老帖子自然沉下去。由于时间项只取决于
+发帖时间，分数不需要随时间衰减重算，只在计数变化时更新。
+
+- 热度分：互动总量（浏览、点赞、收藏、评论加权），时间常数 12.5 小时；
+- 推荐分：更看重互动质量（点赞/收藏/评论占浏览的比例），时间常数 25 小时，
+  让优质但浏览不多的帖子也能被推上去。
+"""
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models.expressions import Combinable
+from django.utils import timezone
+
+# 时间项的起点
+EPOCH = datetime(2023, 1, 1, tzinfo=dt_timezone.utc)
+
+HOT_GRAVITY = 45000
+RECOMMEND_GRAVITY = 90000
+
+# 影响分数的计数字段
+SCORE_FIELDS = ('view_count', 'like_count', 'favorite_count', 'comment_count')
+
+
+def _age_term(created_at, gravity):
+    created_at = created_at or timezone.now()
+    return (created_at - EPOCH).total_seconds() / gravity
+
+
+def hot_score(view_count, like_count, favorite_count, comment_count, created_at):
+    """热度分"""
+    points = view_count * 0.1 + like_count * 2 + favorite_count * 3 + comment_count * 1.5
+    return math.log10(max(points, 1)) + _age_term(created_at, HOT_GRAVITY)
+
+
+def recommend_score(view_count, like_count, favorite_count, comment_count, created_at):
+    """推荐分"""
+    engagement = like_count + favorite_count * 2 + comment_count
+    quality = engagement / (view_count + 20)
+    return (
+        math.log10(1 + quality * 100)
+        + 0.5 * math.log10(max(engagement, 1))
+        + _age_term(created_at, RECOMMEND_GRAVITY)
+    )
+
+
+def apply_scores(post):
+    """按帖子当前的计数重新计算分数（只改实例，不保存）
+
+    计数字段是 F() 表达式时无法计算，返回 False。
+    """
+    values = [getattr(post, name) for name in SCORE_FIELDS]
+    if any(isinstance(value, Combinable) for value in values):
+        return False
+    post.hot_score = hot_score(*values, post.created_at)
+    post.recommend_score = recommend_score(*values, post.created_at)
+    return True
+
+
+def refresh_scores(post_ids):
+    """计数被 F() 原子更新后，批量重算这些帖子的分数"""
+    from .models import Post
+
+    post_ids = list(post_ids)
+    if not post_ids:
+        return 0
+    posts = list(Post.objects.filter(id__in=post_ids).only('id', 'created_at', *SCORE_FIELDS))
+    for post in posts:
+        apply_scores(post)
+    Post.objects.bulk_update(posts, ['hot_score', 'recommend_score'])
+    return len(posts)
+
+
+def refresh_scores_later(post_ids):
+    """把分数重算交给后台任务，同一帖子等待中的重算只保留一个"""
+    from .jobs import enqueue
+
+    for post_id in set(post_ids):
+        enqueue('ranking.refresh', {'post_ids': [post_id]}, dedupe_key=f'scores:{post_id}')
+
+
+def recompute_all(chunk_size=1000):
+    """按 id 区间分批重算全部帖子的分数，返回处理的帖子数"""
+    from .models import Post
+
+    total = 0
+    last_id = 0
+    while True:
+        posts = list(
+            Post.objects.filter(id__gt=last_id)
+            .only('id', 'created_at', *SCORE_FIELDS)
+            .order_by('id')[:chunk_size]
+        )
+        if not posts:
+            break
+        for post in posts:
+            apply_scores(post)
+        Post.objects.bulk_update(posts, ['hot_score', 'recommend_score'])
+        total += len(posts)
+        last_id = posts[-1].id
+    return total
@@ -0,0 +1,299 @@
+"""帖子全文检索
+
+使用 SQLite FTS5 虚拟表 ``tieba_post_fts`` 对标题、正文、标签建立倒排
+索引，rowid 即帖子 id。FTS5 自带的 unicode61 分词器会把一整串汉字当成
+一个词，因此写入索引和构造查询之前，先把连续的汉字切成重叠的二元组
+（"百度贴吧" -> "百度 度贴 贴吧"），查询词同样切分后按短语匹配，再用
+BM25 排序。
+
+数据库不是 SQLite、或 SQLite 未编译 FTS5 时自动退回 icontains 查询。
+检索词里有单个汉字时（如"吧"）也退回 icontains：单字只能作为二元组的
+前缀匹配，找不到"贴吧"这样单字在后的词。
+
+配置示例（settings.py）::
+
+    TIEBA_SEARCH = {
+        'BACKEND': 'auto',    # auto: 有 FTS5 索引表就用；basic: 始终用 icontains
+        'COUNT_LIMIT': 1000,  # 结果数最多数到多少，超过显示为"1000+"
+    }
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q, Value
+from django.db.models.functions import Greatest, StrIndex, Substr
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .pagination import CursorPaginator
+
+FTS_TABLE = 'tieba_post_fts'
+
+# 标题、正文、标签在 BM25 中的权重
+BM25_WEIGHTS = (10.0, 1.0, 5.0)
+
+DEFAULTS = {
+    'BACKEND': 'auto',
+    'COUNT_LIMIT': 1000,
+}
+
+CJK_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+
+_fts_ready = None
+
+
+def get_config():
+    """读取检索配置，未配置的项使用默认值"""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'TIEBA_SEARCH', {}))
+    return config
+
+
+def sqlite_supports_fts5(conn):
+    """检测 SQLite 是否编译了 FTS5"""
+    if conn.vendor != 'sqlite':
+        return False
+    with conn.cursor() as cursor:
+        try:
+            cursor.execute('CREATE VIRTUAL TABLE temp.tieba_fts5_probe USING fts5(x)')
+            cursor.execute('DROP TABLE temp.tieba_fts5_probe')
+        except Exception:
+            return False
+    return True
+
+
+def create_fts_table(conn):
+    """创建检索索引表，FTS5 不可用时返回 False"""
+    if not sqlite_supports_fts5(conn):
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+            f"USING fts5(title, content, tags, tokenize='unicode61')"
+        )
+    return True
+
+
+def drop_fts_table(conn):
+    """删除检索索引表"""
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def fts_enabled():
+    """当前是否使用 FTS5 检索（结果按进程缓存）"""
+    global _fts_ready
+    backend = get_config()['BACKEND']
+    if backend == 'basic':
+        return False
+    if _fts_ready is None:
+        _fts_ready = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_ready
+
+
+def segment(text):
+    """把连续汉字切成重叠二元组，其余文本原样保留"""
+    def bigrams(match):
+        run = match.group()
+        if len(run) == 1:
+            return f' {run} '
+        return ' ' + ' '.join(run[i:i + 2] for i in range(len(run) - 1)) + ' '
+    return CJK_RE.sub(bigrams, text or '')
+
+
+def build_match_query(query):
+    """把用户输入转成 FTS5 MATCH 表达式：每个词一个前缀短语，词之间为 AND"""
+    phrases = []
+    for term in query.split():
+        tokens = segment(term).split()
+        if not tokens:
+            continue
+        phrase = ' '.join(tokens).replace('"', '""')
+        phrases.append(f'"{phrase}" *')
+    return ' AND '.join(phrases)
+
+
+def _document(post):
+    tags = post.tags if isinstance(post.tags, list) else []
+    return (
+        post.id,
+        segment(post.title),
+        segment(post.content),
+        segment(' '.join(str(tag) for tag in tags)),
+    )
+
+
+def index_post(post):
+    """写入或更新单个帖子的索引；已删除的帖子和草稿从索引中移除"""
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.id])
+        if post.is_active and not post.is_draft:
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, content, tags) VALUES (%s, %s, %s, %s)',
+                _document(post),
+            )
+
+
+def unindex_post(post_id):
+    """从索引中移除帖子"""
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+
+def reindex_posts(post_ids):
+    """批量同步一组帖子的索引：先全部移除，再写入其中已发布的帖子"""
+    from .models import Post
+
+    post_ids = list(post_ids)
+    if not post_ids or not fts_enabled():
+        return
+    placeholders = ', '.join(['%s'] * len(post_ids))
+    posts = (
+        Post.objects.filter(id__in=post_ids, is_active=True, is_draft=False)
+        .only('id', 'title', 'content', 'tags')
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', post_ids)
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, content, tags) VALUES (%s, %s, %s, %s)',
+            [_document(post) for post in posts],
+        )
+
+
+def rebuild_index(chunk_size=500):
+    """清空并按批重建索引，返回索引的帖子数；FTS5 不可用时返回 None"""
+    from .models import Post
+
+    global _fts_ready
+    _fts_ready = None
+    drop_fts_table(connection)
+    if not create_fts_table(connection):
+        return None
+
+    total = 0
+    posts = (
+        Post.objects.filter(is_active=True, is_draft=False)
+        .only('id', 'title', 'content', 'tags', 'is_active', 'is_draft')
+        .order_by('id')
+    )
+    batch = []
+    with connection.cursor() as cursor:
+        for post in posts.iterator(chunk_size=chunk_size):
+            batch.append(_document(post))
+            if len(batch) >= chunk_size:
+                cursor.executemany(
+                    f'INSERT INTO {FTS_TABLE} (rowid, title, content, tags) VALUES (%s, %s, %s, %s)', batch
+                )
+                total += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, content, tags) VALUES (%s, %s, %s, %s)', batch
+            )
+            total += len(batch)
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return total
+
+
+class FtsSearchPaginator(CursorPaginator):
+    """按 (BM25 得分, id) 做游标分页的检索结果
+
+    得分越小越相关，因此两个键都按升序排列。每页只从索引中取出
+    per_page + 1 个 id，再用 queryset 加载这些帖子。
+    """
+
+    def __init__(self, match, queryset, per_page, count_limit=None):
+        super().__init__(queryset, ('score', 'id'), per_page, count_limit)
+        self.match = match
+
+    def fetch(self, values, reverse, limit):
+        weights = ', '.join(str(w) for w in BM25_WEIGHTS)
+        sql = (
+            f'SELECT id, score FROM ('
+            f'SELECT rowid AS id, bm25({FTS_TABLE}, {weights}) AS score '
+            f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)'
+        )
+        params = [self.match]
+        op, order = ('<', 'DESC') if reverse else ('>', 'ASC')
+        if values is not None:
+            sql += f' WHERE score {op} %s OR (score = %s AND id {op} %s)'
+            params += [values[0], values[0], values[1]]
+        sql += f' ORDER BY score {order}, id {order} LIMIT %s'
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            hits = cursor.fetchall()
+        if reverse:
+            hits.reverse()
+
+        posts = {post.id: post for post in self.queryset.filter(id__in=[post_id for post_id, _ in hits])}
+        rows = []
+        for post_id, score in hits:
+            post = posts.get(post_id)
+            if post is not None:
+                post.score = score
+                rows.append(post)
+        return rows
+
+    def count(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*) FROM (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s LIMIT %s)',
+                [self.match, self.count_limit + 1],
+            )
+            total = cursor.fetchone()[0]
+        if total > self.count_limit:
+            return self.count_limit, False
+        return total, True
+
+
+def has_single_cjk(query):
+    """检索词中是否有单独的汉字（二元组索引匹配不到）"""
+    return any(len(run) == 1 for run in CJK_RE.findall(query))
+
+
+def search_paginator(query, queryset, per_page):
+    """返回检索结果的游标分页器
+
+    queryset 用于加载命中的帖子（调用方决定取哪些列）。FTS5 可用时按相关度
+    排序，否则退回 icontains 并按时间倒序。
+    """
+    count_limit = get_config()['COUNT_LIMIT']
+    if fts_enabled() and not has_single_cjk(query):
+        return FtsSearchPaginator(build_match_query(query) or '""', queryset, per_page, count_limit)
+
+    # 退回模式：整表扫描，每个词都要出现在标题或正文中，按时间倒序
+    condition = Q()
+    for term in query.split():
+        condition &= Q(title__icontains=term) | Q(content__icontains=term)
+    queryset = queryset.filter(condition, is_active=True, is_draft=False)
+    return CursorPaginator(queryset, ('-created_at', '-id'), per_page, count_limit)
+
+
+def snippet_annotation(query, length=200):
+    """以第一个检索词在正文中出现的位置为中心截取摘要"""
+    terms = query.split()
+    if not terms:
+        return Substr('content', 1, length)
+    start = Greatest(StrIndex('content', Value(terms[0])) - length // 4, 1)
+    return Substr('content', start, length)
+
+
+def highlight(text, query):
+    """给文本中出现的检索词加上 <mark> 标记"""
+    text = escape(text or '')
+    terms = sorted({escape(term) for term in query.split() if term}, key=len, reverse=True)
+    if not terms:
+        return mark_safe(text)
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+    return mark_safe(pattern.sub(lambda m: f'<mark>{m.group()}</mark>', text))
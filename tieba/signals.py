@@ -0,0 +1,234 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import bump_version, touch_mark
+from .counters import views_flushed
+from .models import Category, Comment, Favorite, Like, Post, UserProfile
+from . import feed, jobs, live, ranking, search, stats, tags
+
+# 这些字段变化时才需要重建帖子的检索索引
+SEARCH_FIELDS = {'title', 'content', 'tags', 'is_active', 'is_draft'}
+
+# 这些字段变化时需要同步标签索引
+TAG_FIELDS = {'tags', 'is_active', 'is_draft'}
+
+# 这些字段变化时侧栏缓存（分类统计、热门帖子、帖子总数）需要失效
+WIDGET_FIELDS = {'title', 'category', 'is_active', 'is_draft'}
+
+
+@receiver(pre_save, sender=Post)
+def update_post_scores(sender, instance, update_fields=None, **kwargs):
+    """整行保存帖子时顺带刷新热度分和推荐分"""
+    if update_fields is None:
+        ranking.apply_scores(instance)
+
+
+@receiver(post_save, sender=Post)
+def sync_post_search_index(sender, instance, created, update_fields=None, **kwargs):
+    """帖子保存（含软删除）后同步检索索引"""
+    if update_fields is not None and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    # 分词和写入 FTS 表放到后台执行，同一帖子连续编辑只同步一次
+    jobs.enqueue('search.reindex', {'post_ids': [instance.id]}, dedupe_key=f'search:{instance.id}')
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_search_index(sender, instance, **kwargs):
+    """帖子被物理删除后移出检索索引"""
+    search.unindex_post(instance.id)
+
+
+@receiver(post_save, sender=Post)
+def sync_post_tags(sender, instance, created, update_fields=None, **kwargs):
+    """发帖、编辑标签、软删除后同步标签索引和各标签的帖子数"""
+    if update_fields is not None and not TAG_FIELDS.intersection(update_fields):
+        return
+    tags.sync_post(instance)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    """直接发布的新帖写进关注者的动态（草稿在发布时写入，见 drafts.publish）"""
+    if created and instance.is_active and not instance.is_draft:
+        feed.fan_out_later(instance.id)
+
+
+@receiver(pre_delete, sender=Post)
+def remove_post_tags(sender, instance, **kwargs):
+    """帖子被物理删除前扣减标签的帖子数，关联行随后级联删除"""
+    tags.remove_post(instance.id)
+
+
+@receiver(post_save, sender=Post)
+def invalidate_post_widgets(sender, instance, created, update_fields=None, **kwargs):
+    """发帖、编辑、软删除后使侧栏缓存失效"""
+    if update_fields is not None and not WIDGET_FIELDS.intersection(update_fields):
+        return
+    bump_version('posts')
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_post_widgets_on_delete(sender, instance, **kwargs):
+    bump_version('posts')
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_widgets(sender, **kwargs):
+    bump_version('categories')
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_widgets(sender, instance, created, **kwargs):
+    """注册新用户后使用户总数缓存失效"""
+    if created:
+        bump_version('users')
+
+
+@receiver(post_delete, sender=User)
+def invalidate_user_widgets_on_delete(sender, instance, **kwargs):
+    bump_version('users')
+
+
+@receiver(post_save, sender=User)
+def create_user_profile(sender, instance, created, **kwargs):
+    """注册时创建用户资料，个人页不再 get_or_create"""
+    if created:
+        UserProfile.objects.get_or_create(user=instance)
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Comment)
+def remember_active_state(sender, instance, update_fields=None, **kwargs):
+    """记下保存前的 is_active，用于判断这次保存是否为软删除/恢复"""
+    if instance._state.adding or (update_fields is not None and 'is_active' not in update_fields):
+        # 新建或不写 is_active 的保存不可能是软删除/恢复，不必查询
+        instance._was_active = None
+    else:
+        instance._was_active = sender.objects.filter(pk=instance.pk).values_list('is_active', flat=True).first()
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Comment)
+def stamp_deleted_at(sender, instance, **kwargs):
+    """软删除时记下删除时间（归档按它判断保留期），恢复时清空"""
+    if instance.is_active:
+        instance.deleted_at = None
+    elif instance.deleted_at is None:
+        instance.deleted_at = timezone.now()
+
+
+def _active_delta(instance, created):
+    if created:
+        return 1 if instance.is_active else 0
+    was_active = getattr(instance, '_was_active', None)
+    if was_active is None or was_active == instance.is_active:
+        return 0
+    return 1 if instance.is_active else -1
+
+
+@receiver(post_save, sender=Post)
+def update_author_post_stats(sender, instance, created, **kwargs):
+    """发帖、软删除、恢复帖子时更新作者的计数"""
+    delta = _active_delta(instance, created)
+    if delta:
+        stats.adjust(
+            instance.author_id,
+            post_count=delta,
+            likes_received=0 if created else delta * instance.like_count,
+            favorites_received=0 if created else delta * instance.favorite_count,
+        )
+
+
+@receiver(post_save, sender=Comment)
+def update_author_comment_stats(sender, instance, created, **kwargs):
+    """发表、软删除、恢复评论时更新作者的计数"""
+    delta = _active_delta(instance, created)
+    if delta:
+        stats.adjust(
+            instance.author_id,
+            comment_count=delta,
+            likes_received=0 if created else delta * instance.like_count,
+        )
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def update_likes_received(sender, instance, created=False, **kwargs):
+    """点赞/取消点赞时更新被点赞内容作者的获赞数"""
+    if not created and kwargs.get('signal') is post_save:
+        return
+    delta = 1 if created else -1
+    if instance.post_id:
+        stats.adjust_author_of(Post, instance.post_id, likes_received=delta)
+    elif instance.comment_id:
+        stats.adjust_author_of(Comment, instance.comment_id, likes_received=delta)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def update_favorites_received(sender, instance, created=False, **kwargs):
+    """收藏/取消收藏时更新帖子作者的被收藏数"""
+    if not created and kwargs.get('signal') is post_save:
+        return
+    stats.adjust_author_of(Post, instance.post_id, favorites_received=1 if created else -1)
+
+
+@receiver(post_save, sender=Comment)
+def publish_comment_events(sender, instance, created, **kwargs):
+    """新评论、评论删除在事务提交后推送给正在看该帖子的读者"""
+    delta = _active_delta(instance, created)
+    if not delta:
+        return
+    # 提交时楼层信息（path、depth）已由 threads.create_comment 补全
+    if created:
+        transaction.on_commit(lambda: live.publish_comment(instance))
+    elif delta < 0:
+        transaction.on_commit(lambda: live.publish_comment_removed(instance))
+    live.counters_changed(post_id=instance.post_id)
+
+
+@receiver(post_save, sender=Post)
+def publish_post_removed(sender, instance, created, **kwargs):
+    if _active_delta(instance, created) < 0:
+        transaction.on_commit(lambda: live.publish_post_removed(instance.id))
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def publish_interaction_counts(sender, instance, created=False, **kwargs):
+    """点赞、收藏变化后推送最新计数"""
+    if not created and kwargs.get('signal') is post_save:
+        return
+    if getattr(instance, 'comment_id', None):
+        live.counters_changed(comment_id=instance.comment_id)
+    else:
+        live.counters_changed(post_id=instance.post_id)
+
+
+@receiver(views_flushed)
+def publish_view_counts(sender, post_ids, **kwargs):
+    live.publish_view_counts(post_ids)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def touch_comments_mark(sender, instance, **kwargs):
+    """评论增删改提交后更新该帖子评论的高水位标记，API 的 ETag 随之变化"""
+    post_id = instance.post_id
+    transaction.on_commit(lambda: touch_mark(f'comments:{post_id}'))
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def touch_comments_mark_on_like(sender, instance, created=False, **kwargs):
+    if not instance.comment_id or (not created and kwargs.get('signal') is post_save):
+        return
+    post_id = Comment.objects.filter(id=instance.comment_id).values_list('post_id', flat=True).first()
+    if post_id:
+        transaction.on_commit(lambda: touch_mark(f'comments:{post_id}'))
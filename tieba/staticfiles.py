@@ -0,0 +1,208 @@
+"""静态文件
+
+collectstatic 时由 ``CompressedManifestStorage`` 给文件名加上内容哈希
+（style.css -> style.3a5c1b2d.css，清单写入 staticfiles.json），并为文本类
+文件预先生成 .gz 和 .br（需要安装 Brotli）压缩版本。模板里的 ``{% static %}``
+从进程启动时读入的清单取哈希文件名，不访问文件系统。
+
+``StaticFilesMiddleware`` 在进程启动时扫描一次 STATIC_ROOT，之后按
+Accept-Encoding 直接返回预压缩的版本：带哈希的文件内容永远不变，使用
+一年的 ``immutable`` 缓存，浏览器不再重新验证；不带哈希的文件只缓存
+较短时间。较小的文件在启动时读入内存，请求时不做任何文件系统操作。
+
+配置示例（settings.py）::
+
+    TIEBA_STATIC = {
+        'MAX_AGE': 300,                 # 不带哈希的文件的缓存时间（秒）
+        'MEMORY_LIMIT': 512 * 1024,     # 不超过该大小的文件读入内存
+    }
+
+部署前需执行 ``python manage.py collectstatic``。
+"""
+import gzip
+import mimetypes
+import os
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponse
+from django.utils.http import parse_etags
+
+try:
+    import brotli
+except ImportError:
+    # Brotli 是可选依赖，没有安装时只生成 gzip 版本
+    brotli = None
+
+DEFAULTS = {
+    'MAX_AGE': 300,
+    'MEMORY_LIMIT': 512 * 1024,
+}
+
+# 预压缩的文件类型，图片和字体本身已经压缩过
+COMPRESS_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ico')
+
+# 压缩后至少要小这么多才保留压缩版本
+MIN_SAVING = 0.05
+
+# 压缩版本的扩展名，按优先顺序排列
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# 需要声明字符集的非 text/* 类型
+TEXT_TYPES = ('application/javascript', 'application/json', 'image/svg+xml')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def get_config():
+    """读取静态文件配置，未配置的项使用默认值"""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'TIEBA_STATIC', {}))
+    return config
+
+
+def compress(path):
+    """为一个文件生成 .gz/.br 版本，源文件没有变化时跳过"""
+    with open(path, 'rb') as source:
+        data = source.read()
+    mtime = os.path.getmtime(path)
+    compressors = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        compressors.append(('.br', lambda data: brotli.compress(data, quality=11)))
+    for suffix, compressor in compressors:
+        target = path + suffix
+        if os.path.exists(target) and os.path.getmtime(target) >= mtime:
+            continue
+        compressed = compressor(data)
+        if len(compressed) < len(data) * (1 - MIN_SAVING):
+            with open(target, 'wb') as output:
+                output.write(compressed)
+        elif os.path.exists(target):
+            os.unlink(target)
+
+
+class CompressedManifestStorage(ManifestStaticFilesStorage):
+    """带内容哈希的静态文件存储，收集完成后生成预压缩版本"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in names:
+            if name.endswith(COMPRESS_EXTENSIONS) and self.exists(name):
+                compress(self.path(name))
+
+
+class StaticFile:
+    """一个静态文件的各个编码版本：{编码: (内容或路径, 大小, ETag)}"""
+    __slots__ = ('content_type', 'cache_control', 'variants')
+
+    def __init__(self, path, immutable, config):
+        content_type, _ = mimetypes.guess_type(path)
+        if content_type and (content_type.startswith('text/') or content_type in TEXT_TYPES):
+            content_type += '; charset=utf-8'
+        self.content_type = content_type or 'application/octet-stream'
+        self.cache_control = IMMUTABLE if immutable else f"public, max-age={config['MAX_AGE']}"
+        self.variants = {}
+        for encoding, suffix in (*ENCODINGS, ('identity', '')):
+            if not os.path.exists(path + suffix):
+                continue
+            stat = os.stat(path + suffix)
+            body = path + suffix
+            if stat.st_size <= config['MEMORY_LIMIT']:
+                with open(body, 'rb') as source:
+                    body = source.read()
+            etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}-{encoding}"'
+            self.variants[encoding] = (body, stat.st_size, etag)
+
+    def negotiate(self, accept_encoding):
+        """按客户端接受的编码选择版本"""
+        accepted = set()
+        for item in accept_encoding.split(','):
+            coding, _, params = item.strip().partition(';')
+            if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                accepted.add(coding.strip().lower())
+        for encoding, _ in ENCODINGS:
+            if encoding in self.variants and (encoding in accepted or '*' in accepted):
+                return encoding
+        return 'identity'
+
+
+class StaticFilesMiddleware:
+    """直接返回 STATIC_ROOT 中的静态文件，不经过 URL 路由和后续中间件
+
+    放在 SecurityMiddleware 之后、SessionMiddleware 之前。STATIC_ROOT 为空
+    （尚未执行 collectstatic）时不启用。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.files = self.scan()
+        if not self.files:
+            raise MiddlewareNotUsed
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def scan(self):
+        root = settings.STATIC_ROOT
+        if not root or not os.path.isdir(root) or '://' in settings.STATIC_URL:
+            # 静态文件放在 CDN 等其他域名下时不需要本中间件
+            return {}
+        prefix = '/' + settings.STATIC_URL.lstrip('/')
+        # 清单里的哈希文件名，这些文件内容不会变化
+        hashed = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        config = get_config()
+        suffixes = tuple(suffix for _, suffix in ENCODINGS)
+        files = {}
+        for directory, _, names in os.walk(root):
+            for name in names:
+                path = os.path.join(directory, name)
+                if name.endswith(suffixes) and os.path.exists(path.rsplit('.', 1)[0]):
+                    continue
+                relative = os.path.relpath(path, root).replace(os.sep, '/')
+                files[prefix + relative] = StaticFile(path, relative in hashed, config)
+        return files
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.serve(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.serve(request) or await self.get_response(request)
+
+    def serve(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        static_file = self.files.get(request.path)
+        if static_file is None:
+            return None
+
+        encoding = static_file.negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        body, size, etag = static_file.variants[encoding]
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+            response = HttpResponse(status=304)
+        elif request.method == 'HEAD':
+            response = HttpResponse(content_type=static_file.content_type)
+            response.headers['Content-Length'] = size
+        elif isinstance(body, bytes):
+            response = HttpResponse(body, content_type=static_file.content_type)
+        else:
+            response = FileResponse(open(body, 'rb'), content_type=static_file.content_type)
+            response.headers['Content-Length'] = size
+
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = static_file.cache_control
+        if len(static_file.variants) > 1:
+            response.headers['Vary'] = 'Accept-Encoding'
+        if encoding != 'identity' and response.status_code == 200:
+            response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,67 @@
+"""用户统计计数
+
+``UserProfile`` 上的发帖数、评论数、获赞数、被收藏数由信号在内容创建、
+软删除、点赞/收藏时用 ``F()`` 原子增减，个人页只读不算。计数漂移时用
+``reconcile_user_stats`` 命令按批校正。
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Post, UserProfile
+
+STAT_FIELDS = ('post_count', 'comment_count', 'likes_received', 'favorites_received')
+
+
+def adjust(user_id, **deltas):
+    """原子增减某用户的计数，结果不会小于 0"""
+    changes = {
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+        if delta
+    }
+    if changes:
+        UserProfile.objects.filter(user_id=user_id).update(**changes)
+
+
+def adjust_author_of(model, object_id, **deltas):
+    """增减某帖子/评论作者的计数（用子查询定位作者，不必先取出内容）"""
+    changes = {
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+        if delta
+    }
+    if changes:
+        author = model.objects.filter(id=object_id).values('author_id')[:1]
+        UserProfile.objects.filter(user_id=Subquery(author)).update(**changes)
+
+
+def _sum_subquery(model, field, **filters):
+    rows = (
+        model.objects.filter(author=OuterRef('user_id'), is_active=True, **filters)
+        .order_by()
+        .values('author')
+        .annotate(total=Sum(field))
+        .values('total')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def _count_subquery(model):
+    rows = (
+        model.objects.filter(author=OuterRef('user_id'), is_active=True)
+        .order_by()
+        .values('author')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def reconcile(user_ids):
+    """按内容表重算一批用户的计数，返回更新的行数"""
+    return UserProfile.objects.filter(user_id__in=user_ids).update(
+        post_count=_count_subquery(Post),
+        comment_count=_count_subquery(Comment),
+        likes_received=_sum_subquery(Post, 'like_count') + _sum_subquery(Comment, 'like_count'),
+        favorites_received=_sum_subquery(Post, 'favorite_count'),
+    )
@@ -0,0 +1,189 @@
+"""标签索引
+
+``Post.tags`` 是 JSON 数组，无法按标签查询。这里维护一份倒排索引：
+``Tag`` 表存标签名和可见帖子数，``PostTag`` 表存帖子与标签的对应关系，
+并冗余帖子的发布时间和可见性（有效且不是草稿）。标签页、标签联想、
+热门标签都只查这两张表的索引。
+
+帖子保存后由信号调用 ``sync_post()`` 同步（与帖子在同一事务中），
+各标签的帖子数按可见性变化用 ``F()`` 增减；后台批量操作用 ``refresh_posts()``
+按集合修正。已有数据用 ``rebuild_tag_index`` 命令按批回填。
+"""
+from django.db import transaction
+from django.db.models import Count, Exists, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .cache import bump_version, cached
+from .models import Post, PostTag, Tag
+
+# 标签名最大长度
+MAX_LENGTH = 20
+
+# 每个帖子最多保留的标签数，与发帖页的输入限制一致
+MAX_TAGS = 5
+
+
+def normalize(tags):
+    """整理标签列表：去掉首尾空白、统一小写、去重，过长、含 / 或非字符串的丢弃"""
+    if not isinstance(tags, list):
+        return []
+    names = []
+    for tag in tags:
+        if not isinstance(tag, str):
+            continue
+        name = tag.strip().lower()
+        if name and len(name) <= MAX_LENGTH and '/' not in name and name not in names:
+            names.append(name)
+    return names[:MAX_TAGS]
+
+
+def is_visible(post):
+    return post.is_active and not post.is_draft
+
+
+def _tag_ids(names):
+    """按名称取标签 id，不存在的先创建"""
+    if not names:
+        return {}
+    Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+    return dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+
+
+def _adjust(deltas):
+    """按 {标签 id: 增量} 增减帖子数"""
+    for delta in {delta for delta in deltas.values() if delta}:
+        tag_ids = [tag_id for tag_id, value in deltas.items() if value == delta]
+        Tag.objects.filter(id__in=tag_ids).update(post_count=F('post_count') + delta)
+    if any(deltas.values()):
+        bump_version('tags')
+
+
+def sync_post(post):
+    """按帖子当前的标签和状态更新索引"""
+    visible = is_visible(post)
+    with transaction.atomic():
+        existing = {
+            tag_id: (link_id, link_visible)
+            for link_id, tag_id, link_visible in
+            PostTag.objects.filter(post_id=post.id).values_list('id', 'tag_id', 'is_visible')
+        }
+        wanted = set(_tag_ids(normalize(post.tags)).values())
+
+        deltas = {}
+        removed = [link_id for tag_id, (link_id, _) in existing.items() if tag_id not in wanted]
+        if removed:
+            PostTag.objects.filter(id__in=removed).delete()
+        for tag_id, (_, link_visible) in existing.items():
+            if tag_id not in wanted:
+                deltas[tag_id] = -int(link_visible)
+            elif link_visible != visible:
+                deltas[tag_id] = 1 if visible else -1
+        changed = [existing[tag_id][0] for tag_id in wanted & existing.keys() if existing[tag_id][1] != visible]
+        if changed:
+            # 草稿发布时发布时间也会变化
+            PostTag.objects.filter(id__in=changed).update(is_visible=visible, created_at=post.created_at)
+        added = wanted - existing.keys()
+        PostTag.objects.bulk_create([
+            PostTag(post_id=post.id, tag_id=tag_id, created_at=post.created_at, is_visible=visible)
+            for tag_id in added
+        ])
+        for tag_id in added:
+            deltas[tag_id] = int(visible)
+        _adjust(deltas)
+
+
+def remove_post(post_id):
+    """帖子被物理删除前，扣减它所在标签的帖子数（关联行随帖子级联删除）"""
+    tag_ids = list(PostTag.objects.filter(post_id=post_id, is_visible=True).values_list('tag_id', flat=True))
+    _adjust({tag_id: -1 for tag_id in tag_ids})
+
+
+def _visible_count():
+    rows = (
+        PostTag.objects.filter(tag=OuterRef('pk'), is_visible=True)
+        .order_by()
+        .values('tag')
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def recount(tag_ids=None):
+    """按关联表重算标签的帖子数，tag_ids 为空时重算全部，返回更新的行数"""
+    tags = Tag.objects.all() if tag_ids is None else Tag.objects.filter(id__in=tag_ids)
+    updated = tags.update(post_count=_visible_count())
+    bump_version('tags')
+    return updated
+
+
+def refresh_posts(post_ids):
+    """帖子状态被批量 UPDATE 后，按帖子表修正关联行的可见性和标签帖子数"""
+    post_ids = list(post_ids)
+    links = PostTag.objects.filter(post_id__in=post_ids)
+    links.update(is_visible=Exists(
+        Post.objects.filter(id=OuterRef('post_id'), is_active=True, is_draft=False)
+    ))
+    return recount(set(links.values_list('tag_id', flat=True)))
+
+
+def rebuild_index(chunk_size=500):
+    """按 id 区间分批从 Post.tags 重建关联表，最后重算帖子数；返回处理的帖子数"""
+    total = 0
+    last_id = 0
+    while True:
+        posts = list(
+            Post.objects.filter(id__gt=last_id)
+            .only('id', 'tags', 'created_at', 'is_active', 'is_draft')
+            .order_by('id')[:chunk_size]
+        )
+        if not posts:
+            break
+        with transaction.atomic():
+            tag_ids = _tag_ids(sorted({name for post in posts for name in normalize(post.tags)}))
+            PostTag.objects.filter(post_id__in=[post.id for post in posts]).delete()
+            PostTag.objects.bulk_create([
+                PostTag(post_id=post.id, tag_id=tag_ids[name], created_at=post.created_at,
+                        is_visible=is_visible(post))
+                for post in posts
+                for name in normalize(post.tags)
+            ])
+        total += len(posts)
+        last_id = posts[-1].id
+    recount()
+    return total
+
+
+def get_tag(name):
+    """按名称取标签，名称不区分大小写"""
+    names = normalize([name])
+    return Tag.objects.filter(name=names[0]).first() if names else None
+
+
+def tag_posts(tag):
+    """标签页的帖子关联行，按发布时间倒序分页（排序键 created_at, post_id）"""
+    return PostTag.objects.filter(tag=tag, is_visible=True).only('post_id', 'created_at')
+
+
+def suggest(prefix, limit=10):
+    """标签联想：名称以 prefix 开头的标签，帖子多的在前
+
+    用 ``name >= prefix AND name < prefix + U+FFFF`` 的区间条件，走 name 上的
+    唯一索引（SQLite 的 LIKE 带 ESCAPE 时用不上索引）。
+    """
+    names = normalize([prefix])
+    if not names:
+        return []
+    prefix = names[0]
+    return list(
+        Tag.objects.filter(name__gte=prefix, name__lt=prefix + '\uffff', post_count__gt=0)
+        .order_by('-post_count', 'name')
+        .values('name', 'post_count')[:limit]
+    )
+
+
+def popular_tags(limit=20):
+    """侧栏热门标签，走带版本号的缓存"""
+    return cached('popular_tags', ('tags',), lambda: list(
+        Tag.objects.filter(post_count__gt=0).order_by('-post_count', 'name').only('name', 'post_count')[:limit]
+    ))
@@ -0,0 +1,56 @@
+"""后台任务（由 ``run_jobs`` 命令执行，见 jobs.py）"""
+import os
+
+from .jobs import task
+from . import avatars, drafts, feed, ranking, search
+
+
+@task('search.reindex')
+def reindex_posts(post_ids):
+    """同步一组帖子的检索索引"""
+    search.reindex_posts(post_ids)
+
+
+@task('ranking.refresh')
+def refresh_scores(post_ids):
+    """计数变化后重算帖子的热度分和推荐分"""
+    ranking.refresh_scores(post_ids)
+
+
+@task('drafts.flush')
+def flush_draft(post_id, **kwargs):
+    """写回草稿在自动保存间隔内缓冲的改动（缓冲在共享缓存里）"""
+    drafts.flush(post_id)
+
+
+@task('feed.fanout')
+def fan_out(post_id):
+    """把新发布的帖子写进关注者的收件箱"""
+    feed.fan_out(post_id)
+
+
+@task('feed.backfill')
+def backfill_timeline(user_id, source, target_id):
+    """新关注后补入对方最近的帖子"""
+    feed.backfill(user_id, source, target_id)
+
+
+@task('feed.trim')
+def trim_timelines():
+    """清理超长的收件箱"""
+    feed.trim()
+
+
+@task('avatars.process', max_attempts=3)
+def process_avatar(profile_id, path):
+    """处理上传的头像；文件无法识别时不再重试"""
+    if not os.path.exists(path):
+        # 已经处理过（重复执行）或临时文件被清理
+        return
+    try:
+        with open(path, 'rb') as source:
+            avatars.process_avatar(profile_id, source)
+    except avatars.AvatarError:
+        os.unlink(path)
+        return
+    os.unlink(path)
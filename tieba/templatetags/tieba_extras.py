@@ -0,0 +1,59 @@
+from django import template
+from django.utils.html import format_html
+
+from .. import avatars, fragments, tags
+
+register = template.Library()
+
+
+def _srcset(digest, size, ext):
+    """1 倍和 2 倍屏的候选图，两者相同时只给一个"""
+    one, two = avatars.variant_url(digest, size, ext), avatars.variant_url(digest, size * 2, ext)
+    return one if one == two else f'{one} 1x, {two} 2x'
+
+
+@register.simple_tag
+def avatar(profile, size, css_class='rounded-circle', alt='头像'):
+    """按显示尺寸输出头像
+
+    选用不小于显示尺寸的最小缩略图，优先 WebP；尚未处理的旧头像直接使用原图。
+    """
+    size = int(size)
+    if not profile.avatar_hash:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" width="{}" height="{}">',
+            profile.avatar.url, alt, css_class, size, size,
+        )
+    digest = profile.avatar_hash
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}">'
+        '<img src="{}" srcset="{}" alt="{}" class="{}" width="{}" height="{}" decoding="async"></picture>',
+        _srcset(digest, size, 'webp'), avatars.variant_url(digest, size, 'jpg'),
+        _srcset(digest, size, 'jpg'), alt, css_class, size, size,
+    )
+
+
+@register.simple_tag
+def post_fragments(posts, template_name, highlighted=False):
+    """逐个渲染帖子片段并拼接，已缓存的片段直接取用
+
+    检索页的标题和摘要带高亮，高亮结果也计入片段版本。
+    """
+    if highlighted:
+        return fragments.render_posts(
+            posts, template_name, highlighted=True,
+            version=lambda post: (post.highlighted_title, post.highlighted_excerpt),
+        )
+    return fragments.render_posts(posts, template_name)
+
+
+@register.simple_tag
+def post_body(post):
+    """帖子正文（linebreaks 处理后），按编辑时间缓存"""
+    return fragments.post_body(post)
+
+
+@register.filter
+def tag_names(value):
+    """帖子的标签列表整理成标签页使用的名称（旧数据可能有大小写、重复）"""
+    return tags.normalize(value)
@@ -0,0 +1,988 @@
+import asyncio
+import io
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .management.commands import check_query_plans
+from .models import ArchivedComment, ArchivedPost, Category, Comment, Follow, Job, Like, PendingView, Post, PostTag, Tag, TimelineEntry, UserProfile
+from .cache import get_cache
+from .pagination import CursorPaginator, EstimatedCountPaginator, InvalidCursor, encode_cursor
+from .queries import post_cards
+from . import (
+    archive, counters, drafts, feed, fragments, interactions, jobs, live, moderation, queries, search, tags, threads, throttle,
+)
+
+# 测试中缓存一律不命中，按冷启动统计查询数
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+# 测试以 DEBUG=False 运行，清单存储要求先执行 collectstatic，否则模板里的
+# {% static %} 会报 "Missing staticfiles manifest entry"；渲染页面的测试改用普通存储
+TEST_STORAGES = {
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    STORAGES=TEST_STORAGES,
+    # 异步视图的查询放在请求线程中执行，TestCase 的事务里并发连接会锁表
+    TIEBA_CONCURRENT_QUERIES=False,
+    TIEBA_VIEW_COUNTER={'BACKEND': 'memory', 'FLUSH_INTERVAL': 3600, 'FLUSH_THRESHOLD': 10 ** 6},
+    TIEBA_JOBS={'EAGER': False},
+)
+class ListingQueryCountTests(TestCase):
+    """列表页的查询数固定，不随每页帖子数、评论数增长"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f'user{i}', password='password') for i in range(3)]
+        cls.categories = [Category.objects.create(name=f'分类{i}') for i in range(2)]
+        cls.posts = [
+            Post.objects.create(
+                title=f'贴吧测试帖子 {i}', content='测试内容 ' * 50, tags=['测试'],
+                author=cls.users[i % 3], category=cls.categories[i % 2],
+            )
+            for i in range(15)
+        ]
+        for i in range(5):
+            Comment.objects.create(post=cls.posts[0], author=cls.users[i % 3], content=f'评论 {i}')
+        Follow.objects.create(follower=cls.users[0], author=cls.users[1])
+        # 检索索引由后台任务同步，这里直接写入；检索后端的探测结果按进程缓存，先探测一次
+        search.reindex_posts([post.id for post in cls.posts])
+        search.fts_enabled()
+
+    def setUp(self):
+        # 浏览数记在每个测试自己的缓冲里，测试结束后丢弃，不在进程退出时写回
+        counters._buffer = None
+        self.addCleanup(setattr, counters, '_buffer', None)
+
+    def assertQueries(self, num, url, user=None):
+        if user is not None:
+            self.client.force_login(user)
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_index(self):
+        response = self.assertQueries(6, reverse('tieba:index'))
+        self.assertEqual(len(response.context['posts'].object_list), 12)
+
+    def test_index_hot(self):
+        self.assertQueries(6, reverse('tieba:index') + '?sort=hot')
+
+    def test_category_posts(self):
+        self.assertQueries(3, reverse('tieba:category_posts', args=[self.categories[0].id]))
+
+    def test_tag_posts(self):
+        self.assertQueries(4, reverse('tieba:tag_posts', args=['测试']))
+
+    def test_search(self):
+        response = self.assertQueries(8, reverse('tieba:search') + '?q=贴吧')
+        self.assertEqual(len(response.context['posts'].object_list), 12)
+
+    def test_post_detail(self):
+        response = self.assertQueries(3, reverse('tieba:post_detail', args=[self.posts[0].id]))
+        self.assertEqual(len(response.context['comments'].object_list), 5)
+
+    def test_user_profile(self):
+        self.assertQueries(3, reverse('tieba:user_profile', args=[self.users[0].username]))
+
+    def test_profile(self):
+        self.assertQueries(5, reverse('tieba:profile'), user=self.users[0])
+
+    def test_following_feed(self):
+        self.assertQueries(6, reverse('tieba:feed'), user=self.users[0])
+
+
+@override_settings(CACHES=TEST_CACHES, TIEBA_JOBS={'EAGER': False})
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('author')
+        category = Category.objects.create(name='综合')
+        cls.post = Post.objects.create(title='百度贴吧', content='第一帖', author=user, category=category)
+        Post.objects.create(title='草稿贴吧', content='未发布', author=user, category=category, is_draft=True)
+        search.reindex_posts(list(Post.objects.values_list('id', flat=True)))
+
+    def search(self, query):
+        return list(search.search_paginator(query, Post.objects.all(), 10).page().object_list)
+
+    def test_bigram(self):
+        self.assertEqual(self.search('贴吧'), [self.post])
+
+    def test_single_character(self):
+        # 单字不在二元组开头时也能找到
+        self.assertEqual(self.search('吧'), [self.post])
+        self.assertEqual(self.search('贴 帖'), [self.post])
+
+
+class CursorTests(TestCase):
+
+    def test_forged_cursor(self):
+        # 游标取值类型不对时退回第一页，而不是 500
+        paginator = CursorPaginator(Post.objects.all(), ('-created_at', '-id'), 10)
+        for values in ([{}, 1], [None, 1], ['2026-01-01T00:00:00', {}]):
+            with self.subTest(values=values):
+                self.assertIsNone(paginator.page(encode_cursor(values, 'next')).previous_cursor)
+        score_paginator = CursorPaginator(Post.objects.all(), ('score', 'id'), 10)
+        with self.assertRaises(InvalidCursor):
+            score_paginator._parse_values([{}, 1])
+
+
+@override_settings(TIEBA_JOBS={'EAGER': False})
+class QueryPlanTests(TestCase):
+    """主要页面的查询都走索引（同 check_query_plans 命令）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [User.objects.create_user(f'user{i}') for i in range(2)]
+        category = Category.objects.create(name='综合')
+        posts = [
+            Post.objects.create(title=f'贴吧 {i}', content='内容', tags=['测试'], author=users[i % 2], category=category)
+            for i in range(5)
+        ]
+        Comment.objects.create(post=posts[-1], author=users[0], content='评论')
+        Follow.objects.create(follower=posts[-1].author, author=users[0])
+        search.reindex_posts([post.id for post in posts])
+
+    def test_no_full_scans(self):
+        command = check_query_plans.Command(stdout=io.StringIO(), stderr=io.StringIO())
+        failures = command.check_pages(check_query_plans.ALLOWED_SCANS)
+        self.assertEqual([(name, scans) for name, _, _, scans in failures], [])
+        # 页面出错时只检查了出错前的查询，同样算失败
+        self.assertEqual(command.stderr.getvalue(), '')
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tieba-tests'}},
+    TIEBA_JOBS={'EAGER': False},
+)
+class FragmentTests(TestCase):
+
+    def setUp(self):
+        fragments.get_cache().clear()
+        user = User.objects.create_user('author')
+        category = Category.objects.create(name='综合')
+        self.post = Post.objects.create(title='帖子', content='内容', author=user, category=category)
+
+    def render(self):
+        post = post_cards(Post.objects.filter(id=self.post.id)).get()
+        return fragments.render_posts([post], 'tieba/post_card.html')
+
+    def test_view_count_outside_fragment(self):
+        self.render()
+        Post.objects.filter(id=self.post.id).update(view_count=42)
+        html = self.render()
+        # 浏览数变化不使片段失效，显示的仍是最新值
+        self.assertEqual(fragments.stats()['hits'], 1)
+        self.assertIn('</i> 42', html)
+        self.assertNotIn(fragments.VIEWS_SLOT, html)
+
+
+@override_settings(TIEBA_JOBS={'EAGER': True})
+class EagerJobTests(TestCase):
+
+    def test_delayed_job_is_queued(self):
+        # EAGER 模式下有计划时间的任务仍入库，不在提交时立即执行
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            job = jobs.enqueue('feed.trim', dedupe_key='feed:trim', delay=60)
+        self.assertEqual(callbacks, [])
+        self.assertEqual(Job.objects.get(dedupe_key='feed:trim'), job)
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.assertIsNone(jobs.enqueue('feed.trim'))
+        self.assertEqual(len(callbacks), 1)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                        'LOCATION': os.path.join(tempfile.gettempdir(), 'tieba-tests-drafts')}},
+    TIEBA_JOBS={'EAGER': False},
+    TIEBA_DRAFTS={'INTERVAL': 60},
+)
+class DraftAutosaveTests(TestCase):
+    """共享缓存：间隔内的改动只写缓存，写回交给 run_jobs"""
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user('author')
+        Category.objects.create(name='综合')
+        self.draft = drafts.create(self.user, {'title': '草稿', 'content': ''})
+
+    def test_saves_within_interval_coalesce(self):
+        with CaptureQueriesContext(connection) as ctx:
+            for i in range(5):
+                self.assertEqual(drafts.save(self.user, self.draft.id, {'content': f'第 {i} 版'}), (False, True))
+        # 五次保存只有第一次安排写回任务时写一次数据库
+        writes = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith('INSERT INTO "tieba_job"'))
+
+        job = Job.objects.get(dedupe_key=f'draft:{self.draft.id}')
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIsNone(jobs.execute(job.name, job.kwargs))
+        self.assertEqual(Post.objects.get(id=self.draft.id).content, '第 4 版')
+        self.assertEqual(drafts.save(self.user, self.draft.id, {}), (False, False))
+
+    def test_flush_writes_buffered_changes(self):
+        drafts.save(self.user, self.draft.id, {'title': '新标题'})
+        self.assertEqual(drafts.save(self.user, self.draft.id, {'content': '正文'}, flush=True), (True, False))
+        post = Post.objects.get(id=self.draft.id)
+        self.assertEqual((post.title, post.content), ('新标题', '正文'))
+        # 之后到期的写回任务发现缓冲为空，不再写入
+        self.assertFalse(drafts.flush(self.draft.id))
+
+    def test_publish_includes_buffered_changes(self):
+        drafts.save(self.user, self.draft.id, {'content': '最终内容'})
+        post = drafts.publish(self.user, self.draft.id)
+        self.assertEqual((post.content, post.is_draft), ('最终内容', False))
+        self.assertFalse(drafts.flush(self.draft.id))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tieba-tests'}},
+    TIEBA_JOBS={'EAGER': False},
+    TIEBA_DRAFTS={'INTERVAL': 60},
+)
+class LocalDraftAutosaveTests(TestCase):
+    """进程内缓存：run_jobs 读不到缓冲，由本进程的定时器写回"""
+
+    def test_timer_flushes_buffer(self):
+        get_cache().clear()
+        user = User.objects.create_user('author')
+        Category.objects.create(name='综合')
+        draft = drafts.create(user, {'title': '草稿', 'content': ''})
+        with mock.patch('tieba.drafts.threading.Timer') as timer:
+            for i in range(3):
+                drafts.save(user, draft.id, {'content': f'第 {i} 版'})
+        self.assertEqual(timer.call_count, 1)
+        self.assertFalse(Job.objects.filter(name='drafts.flush').exists())
+
+        delay, callback = timer.call_args.args[:2]
+        self.assertEqual(delay, 60)
+        callback(*timer.call_args.kwargs['args'])
+        self.assertEqual(Post.objects.get(id=draft.id).content, '第 2 版')
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tieba-tests'}},
+    TIEBA_THROTTLE={'RATES': {'like': {'user': '100/m', 'ip': '1/m'}}},
+    TIEBA_JOBS={'EAGER': False},
+)
+class ThrottleTests(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        user = User.objects.create_user('author')
+        category = Category.objects.create(name='综合')
+        self.post = Post.objects.create(title='帖子', content='内容', author=user, category=category)
+        self.client.force_login(user)
+
+    def test_rejected_by_ip_without_queries(self):
+        url = reverse('tieba:like_post', args=[self.post.id])
+        self.assertNotEqual(self.client.post(url).status_code, 429)
+        # IP 桶已空：不读会话，不查数据库
+        with self.assertNumQueries(0):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(throttle.stats()['like'], {'user': 0, 'ip': 1})
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tieba-tests'}},
+    TIEBA_THROTTLE={'RATES': {'like': {'user': '5/m'}}},
+    TIEBA_JOBS={'EAGER': False},
+)
+class BatchThrottleTests(TestCase):
+    """批量接口按操作数扣令牌"""
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user('reader')
+        author = User.objects.create_user('author')
+        category = Category.objects.create(name='综合')
+        self.posts = [Post.objects.create(title=f'帖子 {i}', content='内容', author=author, category=category)
+                      for i in range(8)]
+        self.client.force_login(self.user)
+
+    def batch(self, posts):
+        operations = [{'type': 'post', 'id': post.id, 'action': 'like'} for post in posts]
+        return self.client.post(reverse('tieba:batch_interactions'), {'operations': operations},
+                                content_type='application/json')
+
+    def test_charged_per_operation(self):
+        self.assertEqual(self.batch(self.posts[:3]).status_code, 200)
+        # 桶里只剩 2 个令牌，3 项操作的批量被拒绝，什么也不写
+        response = self.batch(self.posts[3:6])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(Like.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(self.batch(self.posts[3:5]).status_code, 200)
+        self.assertEqual(self.client.post(reverse('tieba:like_post', args=[self.posts[5].id])).status_code, 429)
+        self.assertEqual(throttle.stats()['like'], {'user': 2, 'ip': 0})
+
+    def test_batch_larger_than_capacity(self):
+        # 桶满时放行，令牌欠下 3 个，之后要等 4 个令牌的时间（每 12 秒补一个）
+        self.assertEqual(self.batch(self.posts).status_code, 200)
+        self.assertEqual(Like.objects.filter(user=self.user).count(), 8)
+        response = self.batch(self.posts[:1])
+        self.assertEqual(response.status_code, 429)
+        self.assertAlmostEqual(int(response['Retry-After']), 48, delta=1)
+
+
+@override_settings(TIEBA_JOBS={'EAGER': False})
+class ViewBufferTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('author')
+        category = Category.objects.create(name='综合')
+        self.posts = [Post.objects.create(title=f'帖子 {i}', content='内容', author=user, category=category) for i in range(2)]
+
+    def test_database_buffer_flushes_with_f(self):
+        # 两个进程各自的缓冲共用同一张增量表
+        first = counters.DatabaseViewBuffer(flush_interval=3600, flush_threshold=10 ** 6)
+        second = counters.DatabaseViewBuffer(flush_interval=3600, flush_threshold=10 ** 6)
+        for _ in range(3):
+            first.record(self.posts[0].id)
+        second.record(self.posts[0].id)
+        second.record(self.posts[1].id)
+        self.assertEqual(first.pending(self.posts[0].id), 4)
+
+        # 写回期间别处直接改过 view_count，增量加在最新值上
+        Post.objects.filter(id=self.posts[0].id).update(view_count=100)
+        self.assertEqual(first.flush(), 2)
+        self.assertEqual(
+            dict(Post.objects.filter(id__in=[post.id for post in self.posts]).values_list('id', 'view_count')),
+            {self.posts[0].id: 104, self.posts[1].id: 1},
+        )
+        self.assertFalse(PendingView.objects.exists())
+        self.assertEqual(second.flush(), 0)
+
+    def test_no_increment_lost_around_drain(self):
+        buffer = counters.DatabaseViewBuffer(flush_interval=3600, flush_threshold=10 ** 6)
+        buffer.add(self.posts[0].id)
+        drained = buffer.drain()
+        # 取出之后的新增浏览留在表里，下一次写回
+        buffer.add(self.posts[0].id, 2)
+        self.assertEqual(drained, {self.posts[0].id: 1})
+        self.assertEqual(buffer.drain(), {self.posts[0].id: 2})
+
+    def test_cache_backend_requires_atomic_cache(self):
+        file_cache = {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': '/tmp/tieba-tests-counters',
+        }
+        with override_settings(CACHES={'default': TEST_CACHES['default'], 'counters': file_cache}):
+            with self.assertRaises(ImproperlyConfigured):
+                counters.CacheViewBuffer(flush_interval=10, flush_threshold=200)
+
+
+@override_settings(CACHES=TEST_CACHES, TIEBA_JOBS={'EAGER': False})
+class InteractionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader')
+        author = User.objects.create_user('author')
+        category = Category.objects.create(name='综合')
+        cls.post = Post.objects.create(title='帖子', content='内容', author=author, category=category)
+        cls.draft = Post.objects.create(title='草稿', content='内容', author=author, category=category, is_draft=True)
+        cls.comment = Comment.objects.create(post=cls.post, author=author, content='评论')
+
+    def counts(self):
+        post = Post.objects.get(id=self.post.id)
+        return post.like_count, post.favorite_count, Comment.objects.get(id=self.comment.id).like_count
+
+    def test_toggle(self):
+        self.assertEqual(interactions.toggle(self.user, 'post', self.post.id), (True, 1))
+        self.assertEqual(interactions.toggle(self.user, 'favorite', self.post.id), (True, 1))
+        self.assertEqual(interactions.toggle(self.user, 'post', self.post.id), (False, 0))
+        self.assertEqual(self.counts(), (0, 1, 0))
+        self.assertEqual(Like.objects.count(), 0)
+
+    def test_like_unlike_are_idempotent(self):
+        results = interactions.apply_batch(self.user, [
+            {'type': 'post', 'id': self.post.id, 'action': 'like'},
+            {'type': 'post', 'id': self.post.id, 'action': 'like'},
+            {'type': 'comment', 'id': self.comment.id, 'action': 'unlike'},
+            {'type': 'comment', 'id': self.comment.id, 'action': 'like'},
+            {'type': 'favorite', 'id': self.post.id, 'action': 'toggle'},
+            {'type': 'favorite', 'id': self.post.id, 'action': 'toggle'},
+        ])
+        self.assertEqual([result['active'] for result in results], [True, True, False, True, True, False])
+        # 结果里的计数都是整批执行后的最终值
+        self.assertEqual([result['count'] for result in results], [1, 1, 1, 1, 0, 0])
+        self.assertEqual(self.counts(), (1, 0, 1))
+
+        interactions.apply_batch(self.user, [{'type': 'post', 'id': self.post.id, 'action': 'unlike'}] * 2)
+        self.assertEqual(self.counts(), (0, 0, 1))
+
+    def test_invalid_entries(self):
+        results = interactions.apply_batch(self.user, [
+            'post',
+            {'type': 'share', 'id': self.post.id},
+            {'type': 'post', 'id': 'abc'},
+            {'type': 'post'},
+            {'type': 'post', 'id': self.post.id, 'action': 'delete'},
+            {'type': 'post', 'id': 10 ** 6},
+            {'type': 'post', 'id': self.draft.id},
+            {'type': 'comment', 'id': self.post.id + 10 ** 6},
+            {'type': 'post', 'id': str(self.post.id)},
+        ])
+        self.assertEqual(results[:-1], [{'error': 'invalid'}] * 8)
+        self.assertEqual(results[-1], {'type': 'post', 'id': self.post.id, 'active': True, 'count': 1})
+        self.assertEqual(self.counts(), (1, 0, 0))
+        self.assertEqual(Post.objects.get(id=self.draft.id).like_count, 0)
+
+
+@override_settings(CACHES=TEST_CACHES, TIEBA_JOBS={'EAGER': False})
+class ThreadTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('author')
+        category = Category.objects.create(name='综合')
+        self.post = Post.objects.create(title='帖子', content='内容', author=self.user, category=category)
+        self.root = threads.create_comment(self.post, self.user, '楼层')
+
+    def reply(self, parent, content='回复'):
+        return threads.create_comment(self.post, self.user, content, parent=parent)
+
+    def test_siblings_across_digit_boundary(self):
+        # 垫到两条兄弟回复的 id 跨过位数（如 9、10），未补零时字符串顺序会颠倒
+        def next_id():
+            return Comment.objects.order_by('-id').values_list('id', flat=True).first() + 1
+        while len(str(next_id())) == len(str(next_id() + 1)):
+            threads.create_comment(self.post, self.user, '占位')
+        first = self.reply(self.root)
+        second = self.reply(self.root)
+        self.assertLess(len(str(first.id)), len(str(second.id)))
+        nested = self.reply(first)
+
+        replies = list(threads.load_replies(self.root).object_list)
+        # 补零后 .../0000000009 排在 .../0000000010 前，子回复紧跟父回复
+        self.assertEqual(replies, [first, nested, second])
+        self.assertEqual(Comment.objects.get(id=self.root.id).reply_count, 3)
+
+    def test_max_depth(self):
+        parent = self.root
+        chain = []
+        for _ in range(threads.MAX_DEPTH + 2):
+            parent = self.reply(parent)
+            chain.append(parent)
+        self.assertEqual([reply.depth for reply in chain[:threads.MAX_DEPTH]], list(range(1, threads.MAX_DEPTH + 1)))
+        # 超过最大层级的回复挂到父评论的同一层，路径长度不再增加
+        deepest = chain[threads.MAX_DEPTH - 1]
+        for reply in chain[threads.MAX_DEPTH:]:
+            self.assertEqual(reply.depth, threads.MAX_DEPTH)
+            self.assertEqual(reply.path.rsplit('/', 1)[0], deepest.path.rsplit('/', 1)[0])
+        self.assertEqual(list(threads.load_replies(self.root, limit=100).object_list), chain)
+
+    def test_thread_page_preview(self):
+        replies = [self.reply(self.root, f'回复 {i}') for i in range(5)]
+        page = threads.load_thread_page(self.post, preview=2)
+        root = page.object_list[0]
+        self.assertEqual(root.preview_replies, replies[:2])
+        self.assertEqual(root.more_replies_count, 3)
+        rest = threads.load_replies(root, cursor=root.more_replies_cursor)
+        self.assertEqual(list(rest.object_list), replies[2:])
+
+
+@override_settings(CACHES=TEST_CACHES, TIEBA_JOBS={'EAGER': False})
+class UserStatsTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.reader = User.objects.create_user('reader')
+        category = Category.objects.create(name='综合')
+        self.post = Post.objects.create(title='帖子', content='内容', author=self.author, category=category)
+        self.comment = Comment.objects.create(post=self.post, author=self.author, content='评论')
+        interactions.toggle(self.reader, 'post', self.post.id)
+        interactions.toggle(self.reader, 'favorite', self.post.id)
+        interactions.toggle(self.reader, 'comment', self.comment.id)
+
+    def stats(self):
+        profile = UserProfile.objects.get(user=self.author)
+        return profile.post_count, profile.comment_count, profile.likes_received, profile.favorites_received
+
+    def test_soft_delete_and_restore(self):
+        self.assertEqual(self.stats(), (1, 1, 2, 1))
+        post = Post.objects.get(id=self.post.id)
+        post.is_active = False
+        post.save(update_fields=['is_active'])
+        self.assertEqual(self.stats(), (0, 1, 1, 0))
+
+        comment = Comment.objects.get(id=self.comment.id)
+        comment.is_active = False
+        comment.save()
+        self.assertEqual(self.stats(), (0, 0, 0, 0))
+
+        post.is_active = True
+        post.save(update_fields=['is_active'])
+        comment.is_active = True
+        comment.save()
+        self.assertEqual(self.stats(), (1, 1, 2, 1))
+
+    def test_partial_save_skips_state_lookup(self):
+        post = Post.objects.get(id=self.post.id)
+        post.title = '新标题'
+        with CaptureQueriesContext(connection) as ctx:
+            post.save(update_fields=['title'])
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT "tieba_post"."is_active"')])
+        self.assertEqual(self.stats(), (1, 1, 2, 1))
+
+    def test_reconcile_corrects_drift(self):
+        UserProfile.objects.filter(user=self.author).update(
+            post_count=7, comment_count=0, likes_received=100, favorites_received=3,
+        )
+        call_command('reconcile_user_stats', stdout=io.StringIO())
+        self.assertEqual(self.stats(), (1, 1, 2, 1))
+
+
+@override_settings(CACHES=TEST_CACHES, TIEBA_JOBS={'EAGER': False})
+class TagTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('author')
+        self.category = Category.objects.create(name='综合')
+
+    def create(self, tags, **fields):
+        return Post.objects.create(title='帖子', content='内容', author=self.user, category=self.category,
+                                   tags=tags, **fields)
+
+    def counts(self):
+        return dict(Tag.objects.values_list('name', 'post_count'))
+
+    def test_counts_follow_post_lifecycle(self):
+        post = self.create(['Python', ' django ', 'python'])
+        draft = self.create(['python'], is_draft=True)
+        self.assertEqual(self.counts(), {'python': 1, 'django': 1})
+
+        drafts.publish(self.user, draft.id)
+        self.assertEqual(self.counts(), {'python': 2, 'django': 1})
+
+        post.tags = ['django', 'sqlite']
+        post.save()
+        self.assertEqual(self.counts(), {'python': 1, 'django': 1, 'sqlite': 1})
+
+        post.is_active = False
+        post.save(update_fields=['is_active'])
+        self.assertEqual(self.counts(), {'python': 1, 'django': 0, 'sqlite': 0})
+        post.is_active = True
+        post.save(update_fields=['is_active'])
+        self.assertEqual(self.counts(), {'python': 1, 'django': 1, 'sqlite': 1})
+
+        Post.objects.get(id=draft.id).delete()
+        self.assertEqual(self.counts(), {'python': 0, 'django': 1, 'sqlite': 1})
+        self.assertEqual(tags.suggest('py'), [])
+        self.assertEqual(tags.suggest('DJ'), [{'name': 'django', 'post_count': 1}])
+
+    def test_bulk_update_and_rebuild(self):
+        posts = [self.create(['python']) for _ in range(3)]
+        Post.objects.filter(id__in=[posts[0].id, posts[1].id]).update(is_active=False)
+        tags.refresh_posts([posts[0].id, posts[1].id])
+        self.assertEqual(self.counts(), {'python': 1})
+
+        # 重建索引得到同样的结果
+        Tag.objects.update(post_count=42)
+        PostTag.objects.all().delete()
+        self.assertEqual(tags.rebuild_index(chunk_size=2), 3)
+        self.assertEqual(self.counts(), {'python': 1})
+        self.assertEqual(list(tags.tag_posts(tags.get_tag('Python')).values_list('post_id', flat=True)), [posts[2].id])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tieba-tests'}},
+    TIEBA_JOBS={'EAGER': False},
+)
+class ApiETagTests(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user('author')
+        category = Category.objects.create(name='综合')
+        self.post = Post.objects.create(title='帖子', content='内容', author=self.user, category=category)
+        threads.create_comment(self.post, self.user, '第一条')
+
+    def assertRevalidates(self, url):
+        """返回当前 ETag，并确认带着它再请求得到 304"""
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        return etag
+
+    def test_comments_etag_changes_with_new_comment(self):
+        url = reverse('tieba:api_post_comments', args=[self.post.id])
+        etag = self.assertRevalidates(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            threads.create_comment(self.post, self.user, '第二条')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertNotEqual(self.assertRevalidates(url), etag)
+
+    def test_post_etag_changes_with_counts(self):
+        for url in (reverse('tieba:api_post', args=[self.post.id]), reverse('tieba:api_posts')):
+            with self.subTest(url=url):
+                etag = self.assertRevalidates(url)
+                # 点赞不改 updated_at，只体现在 ETag 里
+                interactions.toggle(self.user, 'post', self.post.id)
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tieba-tests'}},
+    TIEBA_JOBS={'EAGER': False},
+)
+class ModerationTests(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.author = User.objects.create_user('author')
+        reader = User.objects.create_user('reader')
+        self.source = Category.objects.create(name='原分类')
+        self.target = Category.objects.create(name='新分类')
+        self.posts = [
+            Post.objects.create(title=f'帖子 {i}', content='内容', author=self.author, category=self.source, tags=['审核'])
+            for i in range(3)
+        ]
+        self.root = threads.create_comment(self.posts[0], reader, '楼层')
+        self.reply = threads.create_comment(self.posts[0], self.author, '回复', parent=self.root)
+        interactions.toggle(reader, 'post', self.posts[0].id)
+
+    def sidebar_counts(self):
+        return {category.name: category.post_count for category in queries.sidebar_widgets()['categories']}
+
+    def profile(self):
+        profile = UserProfile.objects.get(user=self.author)
+        return profile.post_count, profile.comment_count, profile.likes_received
+
+    def test_bulk_soft_delete_and_restore_posts(self):
+        self.assertEqual(self.sidebar_counts(), {'原分类': 3, '新分类': 0})
+        self.assertEqual(self.profile(), (3, 1, 1))
+        removed = Post.objects.filter(id__in=[self.posts[0].id, self.posts[1].id])
+        self.assertEqual(moderation.set_posts_active(removed, False), 2)
+        self.assertEqual(self.profile(), (1, 1, 0))
+        self.assertEqual(self.sidebar_counts(), {'原分类': 1, '新分类': 0})
+        self.assertEqual(Tag.objects.get(name='审核').post_count, 1)
+
+        self.assertEqual(moderation.set_posts_active(Post.objects.all(), True), 2)
+        self.assertEqual(self.profile(), (3, 1, 1))
+        self.assertEqual(Tag.objects.get(name='审核').post_count, 3)
+
+    def test_bulk_soft_delete_comments(self):
+        moderation.set_comments_active(Comment.objects.filter(id=self.reply.id), False)
+        self.assertEqual(Post.objects.get(id=self.posts[0].id).comment_count, 1)
+        self.assertEqual(Comment.objects.get(id=self.root.id).reply_count, 0)
+        self.assertEqual(self.profile(), (3, 0, 1))
+
+    def test_move_posts(self):
+        self.sidebar_counts()
+        self.assertEqual(moderation.move_posts(Post.objects.filter(id=self.posts[0].id), self.target), 1)
+        # 侧栏缓存随之失效，作者计数不受影响
+        self.assertEqual(self.sidebar_counts(), {'原分类': 2, '新分类': 1})
+        self.assertEqual(self.profile(), (3, 1, 1))
+
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tieba-tests'}},
+    TIEBA_JOBS={'EAGER': False},
+)
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.author = User.objects.create_user('author')
+        self.reader = User.objects.create_user('reader')
+        category = Category.objects.create(name='综合')
+        self.post = Post.objects.create(title='百度贴吧', content='归档的帖子', author=self.author,
+                                        category=category, tags=['归档'])
+        Post.objects.create(title='其他帖子', content='内容', author=self.author, category=category, tags=['归档'])
+        search.reindex_posts(list(Post.objects.values_list('id', flat=True)))
+        self.root = threads.create_comment(self.post, self.reader, '楼层')
+        self.reply = threads.create_comment(self.post, self.author, '回复', parent=self.root)
+        # 帖子的评论数由发评论的视图维护
+        Post.objects.filter(id=self.post.id).update(comment_count=2)
+        interactions.toggle(self.reader, 'post', self.post.id)
+        interactions.toggle(self.reader, 'favorite', self.post.id)
+        interactions.toggle(self.author, 'comment', self.root.id)
+
+    def state(self):
+        """各处冗余的计数和检索结果"""
+        profiles = {
+            profile.user.username: (profile.post_count, profile.comment_count,
+                                    profile.likes_received, profile.favorites_received)
+            for profile in UserProfile.objects.select_related('user')
+        }
+        posts = {post.title: (post.comment_count, post.like_count, post.favorite_count) for post in Post.objects.all()}
+        found = list(search.search_paginator('贴吧', Post.objects.all(), 10).page().object_list)
+        return profiles, posts, dict(Tag.objects.values_list('name', 'post_count')), [post.id for post in found]
+
+    def age(self, queryset):
+        queryset.update(deleted_at=archive.cutoff() - timedelta(days=1))
+
+    def test_post_round_trip(self):
+        before = self.state()
+        self.assertEqual(before[3], [self.post.id])
+        moderation.set_posts_active(Post.objects.filter(id=self.post.id), False)
+        deleted = self.state()
+        self.assertEqual(deleted[0]['author'], (1, 1, 0, 0))
+
+        self.age(Post.objects.filter(id=self.post.id))
+        self.assertEqual(archive.archive_posts(archive.cutoff(), 10), 1)
+        self.assertFalse(Comment.objects.exists() or Like.objects.exists())
+        # 原行删除时信号扣减过的计数由 reconcile 重算，与归档前一致
+        self.assertEqual(self.state(), ({**deleted[0], 'author': (1, 0, 0, 0), 'reader': (0, 0, 0, 0)},
+                                        {'其他帖子': (0, 0, 0)}, deleted[2], []))
+
+        self.assertEqual(archive.restore_posts([self.post.id]), 1)
+        self.assertEqual(self.state(), before)
+        self.assertFalse(ArchivedPost.objects.exists() or ArchivedComment.objects.exists())
+        self.assertEqual(archive.archive_posts(archive.cutoff(), 10), 0)
+
+    def test_restore_post_inactive(self):
+        moderation.set_posts_active(Post.objects.filter(id=self.post.id), False)
+        deleted = self.state()
+        self.age(Post.objects.filter(id=self.post.id))
+        archive.archive_posts(archive.cutoff(), 10)
+        self.assertEqual(archive.restore_posts([self.post.id], activate=False), 1)
+        self.assertEqual(self.state(), deleted)
+        # 删除时间从恢复时算起，不会立即再被归档
+        self.assertEqual(archive.archive_posts(archive.cutoff(), 10), 0)
+
+    def test_comment_round_trip(self):
+        before = self.state()
+        moderation.set_comments_active(Comment.objects.filter(id=self.reply.id), False)
+        deleted = self.state()
+        self.age(Comment.objects.filter(id=self.reply.id))
+        # 有子评论的楼层不单独归档
+        moderation.set_comments_active(Comment.objects.filter(id=self.root.id), False)
+        self.age(Comment.objects.filter(id=self.root.id))
+        self.assertEqual(archive.archive_comments(archive.cutoff(), 10), 1)
+        self.assertEqual(archive.archive_comments(archive.cutoff(), 10), 1)
+        self.assertEqual(self.state()[0]['reader'][1:], (0, 0, 0))
+
+        # 恢复回复时父楼层一并写回，仍为删除状态
+        self.assertEqual(archive.restore_comments([self.reply.id]), 1)
+        self.assertFalse(Comment.objects.get(id=self.root.id).is_active)
+        moderation.set_comments_active(Comment.objects.filter(id=self.root.id), True)
+        self.assertEqual(self.state(), before)
+        self.assertEqual(Like.objects.filter(comment_id=self.root.id).count(), 1)
+        self.assertEqual(Comment.objects.get(id=self.root.id).reply_count, 1)
+        self.assertEqual(deleted[1]['百度贴吧'][0], 1)
+
+class EstimatedCountPaginatorTests(TestCase):
+
+    def test_empty_estimated_page_falls_back_to_last_page(self):
+        user = User.objects.create_user('author')
+        category = Category.objects.create(name='综合')
+        posts = [Post.objects.create(title=f'帖子 {i}', content='内容', author=user, category=category) for i in range(6)]
+        # 删除前面的帖子留下主键空洞，最大主键估算的总数偏大
+        Post.objects.filter(id__in=[post.id for post in posts[:4]]).delete()
+        paginator = EstimatedCountPaginator(Post.objects.order_by('id'), 2)
+        paginator.count_limit = 1
+        self.assertGreater(paginator.count, 2)
+
+        page = paginator.page(3)
+        self.assertEqual((page.number, list(page.object_list)), (1, posts[4:]))
+        self.assertEqual((paginator.count, paginator.num_pages), (2, 1))
+
+
+@override_settings(TIEBA_JOBS={'EAGER': False})
+class EnqueueDedupeTests(TestCase):
+
+    def writes(self, **kwargs):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertIsNone(jobs.enqueue('feed.trim', dedupe_key='feed:trim', **kwargs))
+        return [q['sql'] for q in ctx.captured_queries if not q['sql'].startswith('SELECT')]
+
+    def test_repeated_enqueue_does_not_write(self):
+        job = jobs.enqueue('feed.trim', dedupe_key='feed:trim', delay=60)
+        # 重复入队不改变计划时间和优先级时只有一次查询
+        self.assertEqual(self.writes(delay=120), [])
+        self.assertEqual(self.writes(delay=60, priority=-1), [])
+
+        self.assertEqual(len(self.writes(priority=5)), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.priority, 5)
+        self.assertLessEqual(job.run_at, timezone.now())
+        self.assertEqual(Job.objects.count(), 1)
+
+
+class MemoryHubTests(SimpleTestCase):
+
+    def setUp(self):
+        self.hub = live.MemoryHub(history=3, max_streams=1, max_channels=10)
+
+    def test_replay_since_last_event(self):
+        for i in range(3):
+            self.hub.publish(1, 'comment', {'n': i})
+        self.hub.publish(2, 'comment', {'n': 'other'})
+        events = self.hub.since(1, 1)
+        self.assertEqual([(event['id'], event['data']) for event in events], [(2, {'n': 1}), (3, {'n': 2})])
+        self.assertEqual(self.hub.since(1, 4), [])
+        self.assertEqual(self.hub.latest_id(), 4)
+
+    def test_reset_when_events_missed(self):
+        for i in range(5):
+            self.hub.publish(1, 'comment', {'n': i})
+        # 只保留最近 3 条（id 3-5），从 1 之后补发已经不完整
+        self.assertEqual(self.hub.since(1, 1), [{'id': 5, 'event': 'reset', 'data': {}}])
+        self.assertEqual([event['id'] for event in self.hub.since(1, 2)], [3, 4, 5])
+        # 服务重启后浏览器带着更大的序号回来
+        self.assertEqual(self.hub.since(1, 99)[0]['event'], 'reset')
+
+    def test_wait_is_woken_by_publish_from_another_thread(self):
+        async def listen():
+            timer = threading.Timer(0.05, self.hub.publish, args=(1, 'counts', {'like_count': 1}))
+            timer.start()
+            try:
+                return await self.hub.wait(1, 0, timeout=5)
+            finally:
+                timer.join()
+
+        events = asyncio.run(listen())
+        self.assertEqual([event['event'] for event in events], ['counts'])
+        self.assertEqual(asyncio.run(self.hub.wait(1, 1, timeout=0.01)), [])
+
+    def test_stream_limit(self):
+        self.assertTrue(self.hub.open_stream())
+        self.assertFalse(self.hub.open_stream())
+        self.hub.close_stream()
+        self.assertTrue(self.hub.open_stream())
+
+
+@override_settings(CACHES=TEST_CACHES, TIEBA_JOBS={'EAGER': False}, TIEBA_LIVE={'BACKEND': 'memory'})
+class LiveCountersTests(TestCase):
+
+    def setUp(self):
+        live._hub = None
+        self.addCleanup(setattr, live, '_hub', None)
+
+    def test_counts_published_once_per_commit(self):
+        author = User.objects.create_user('author')
+        readers = [User.objects.create_user(f'reader{i}') for i in range(3)]
+        category = Category.objects.create(name='综合')
+        post = Post.objects.create(title='帖子', content='内容', author=author, category=category)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for reader in readers:
+                    interactions.toggle(reader, 'post', post.id)
+        events = live.get_hub().since(post.id, 0)
+        # 同一事务里的三次点赞合并为一条事件，推送的是提交后的计数
+        self.assertEqual([(event['event'], event['data']['like_count']) for event in events], [('counts', 3)])
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    TIEBA_JOBS={'EAGER': False},
+    TIEBA_FEED={'FANOUT_LIMIT': 3, 'FANOUT_BATCH': 1, 'MAX_ENTRIES': 3, 'BACKFILL': 50},
+)
+class FeedTests(TestCase):
+
+    def setUp(self):
+        self.reader = User.objects.create_user('reader')
+        self.author = User.objects.create_user('author')
+        self.popular = User.objects.create_user('popular')
+        self.stranger = User.objects.create_user('stranger')
+        self.followed = Category.objects.create(name='关注的分类')
+        self.other = Category.objects.create(name='其他分类')
+        self.base = timezone.now() - timedelta(hours=1)
+
+    def post(self, author, category, minutes):
+        post = Post.objects.create(title='帖子', content='内容', author=author, category=category)
+        Post.objects.filter(id=post.id).update(created_at=self.base + timedelta(minutes=minutes))
+        feed.fan_out(post.id)
+        return post
+
+    def inbox(self, user):
+        return list(TimelineEntry.objects.filter(user=user).order_by(*feed.ENTRY_ORDERING).values_list('post_id', flat=True))
+
+    def pages(self, user, per_page):
+        ids, cursor = [], None
+        while True:
+            page = feed.load_page(user, cursor, per_page)
+            ids += [post.id for post in page]
+            if not page.next_cursor:
+                return ids
+            cursor = page.next_cursor
+
+    def test_fan_out_writes_follower_inboxes(self):
+        self.assertEqual(feed.toggle(self.reader, 'user', self.author.id), (True, 1))
+        feed.toggle(self.stranger, 'user', self.author.id)
+        feed.toggle(self.author, 'category', self.followed.id)
+        post = self.post(self.author, self.followed, 1)
+        # FANOUT_BATCH=1：两个粉丝各一批；作者关注了所在分类也不写给自己
+        self.assertEqual(self.inbox(self.reader), [post.id])
+        self.assertEqual(self.inbox(self.stranger), [post.id])
+        self.assertEqual(self.inbox(self.author), [])
+        self.assertEqual(self.pages(self.reader, 20), [post.id])
+
+    def test_pulled_source_merges_without_duplicates(self):
+        feed.toggle(self.reader, 'user', self.author.id)
+        feed.toggle(self.reader, 'user', self.popular.id)
+        feed.toggle(self.stranger, 'user', self.popular.id)
+        feed.toggle(self.author, 'user', self.popular.id)
+        feed.toggle(self.reader, 'category', self.followed.id)
+        self.assertEqual(feed.pulled_sources(self.reader), ([self.popular.id], []))
+
+        first = self.post(self.author, self.other, 1)
+        pulled = self.post(self.popular, self.other, 2)
+        # 同时经分类推入收件箱、经作者读时合并，只出现一次
+        both = self.post(self.popular, self.followed, 3)
+        tied = self.post(self.author, self.other, 3)
+        self.post(self.stranger, self.other, 4)
+        self.assertEqual(self.inbox(self.reader), [tied.id, both.id, first.id])
+
+        # 发布时间相同的按 id 倒序，逐页翻完既不重复也不遗漏
+        expected = [tied.id, both.id, pulled.id, first.id]
+        for per_page in (1, 2, 3, 20):
+            self.assertEqual(self.pages(self.reader, per_page), expected)
+
+    def test_unfollow_keeps_posts_from_other_sources(self):
+        feed.toggle(self.reader, 'user', self.author.id)
+        feed.toggle(self.reader, 'category', self.followed.id)
+        only_author = self.post(self.author, self.other, 1)
+        shared = self.post(self.author, self.followed, 2)
+        only_category = self.post(self.stranger, self.followed, 3)
+        self.assertEqual(self.inbox(self.reader), [only_category.id, shared.id, only_author.id])
+
+        self.assertEqual(feed.toggle(self.reader, 'user', self.author.id), (False, 0))
+        self.assertEqual(self.inbox(self.reader), [only_category.id, shared.id])
+
+        # 重新关注后由补入任务取回
+        feed.toggle(self.reader, 'user', self.author.id)
+        feed.backfill(self.reader.id, 'user', self.author.id)
+        self.assertEqual(self.inbox(self.reader), [only_category.id, shared.id, only_author.id])
+
+    def test_trim_user_respects_boundary(self):
+        posts = [Post.objects.create(title='帖子', content='内容', author=self.author, category=self.other)
+                 for _ in range(5)]
+        times = [1, 2, 2, 2, 3]
+        for post, minutes in zip(posts, times):
+            TimelineEntry.objects.create(user=self.reader, post=post, created_at=self.base + timedelta(minutes=minutes))
+        TimelineEntry.objects.create(user=self.stranger, post=posts[0], created_at=self.base)
+
+        # 边界落在三条同一时间的条目中间，按帖子 id 截断，恰好保留 MAX_ENTRIES 条
+        self.assertEqual(feed.trim_user(self.reader.id), 2)
+        self.assertEqual(self.inbox(self.reader), [posts[4].id, posts[3].id, posts[2].id])
+        self.assertEqual(feed.trim_user(self.reader.id), 0)
+        self.assertEqual(self.inbox(self.stranger), [posts[0].id])
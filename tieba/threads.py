@@ -0,0 +1,101 @@
+"""楼层式评论树
+
+每条评论记录所属楼层 ``root``（顶层评论为空）、层级 ``depth`` 和物化路径
+``path``（从楼层到自身的 id 逐级补零后用 "/" 连接），同一楼层内按 path
+排序即是先序遍历的显示顺序。
+
+一页评论只需两条走索引的查询：
+
+1. 顶层评论按 (created_at, id) 游标分页；
+2. 这些楼层的前 K 条回复，用窗口函数 ROW_NUMBER() 按楼层分组截取。
+
+楼层剩余的回复通过 ``load_replies`` 按 path 游标继续加载。
+"""
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import Comment
+from .pagination import CursorPaginator, encode_cursor
+
+PATH_WIDTH = 10
+MAX_DEPTH = 20
+
+# 每页顶层评论数、每个楼层预先展示的回复数、每次加载更多的回复数
+COMMENTS_PER_PAGE = 20
+REPLIES_PREVIEW = 3
+REPLIES_PER_LOAD = 20
+
+
+def _segment(comment_id):
+    return str(comment_id).zfill(PATH_WIDTH)
+
+
+def create_comment(post, author, content, parent=None):
+    """发表评论或回复，并维护楼层信息"""
+    with transaction.atomic():
+        if parent is None:
+            comment = Comment.objects.create(post=post, author=author, content=content)
+            comment.path = _segment(comment.id)
+        else:
+            root_id = parent.root_id or parent.id
+            comment = Comment.objects.create(
+                post=post, author=author, content=content, parent=parent, root_id=root_id,
+            )
+            prefix, depth = parent.path, parent.depth
+            if depth >= MAX_DEPTH:
+                # 超过最大层级时挂到父评论的同一层
+                prefix, depth = prefix.rsplit('/', 1)[0], depth - 1
+            comment.depth = depth + 1
+            comment.path = f'{prefix}/{_segment(comment.id)}'
+            Comment.objects.filter(id=root_id).update(reply_count=F('reply_count') + 1)
+        Comment.objects.filter(id=comment.id).update(path=comment.path, depth=comment.depth)
+    return comment
+
+
+def comment_removed(comment):
+    """评论被软删除后更新楼层的回复数"""
+    if comment.root_id:
+        Comment.objects.filter(id=comment.root_id, reply_count__gt=0).update(reply_count=F('reply_count') - 1)
+
+
+def _replies(queryset):
+    return queryset.filter(is_active=True).select_related('author')
+
+
+def load_thread_page(post, cursor=None, per_page=COMMENTS_PER_PAGE, preview=REPLIES_PREVIEW):
+    """加载一页楼层及每个楼层的前几条回复
+
+    返回游标分页的一页，每个顶层评论带有 ``preview_replies`` 列表和
+    ``more_replies_cursor``（还有更多回复时用于继续加载）。
+    """
+    roots = Comment.objects.filter(post=post, depth=0, is_active=True).select_related('author')
+    page = CursorPaginator(roots, ('created_at', 'id'), per_page).page(cursor)
+
+    root_ids = [root.id for root in page]
+    replies = {}
+    if root_ids:
+        ranked = (
+            _replies(Comment.objects.filter(root_id__in=root_ids))
+            .annotate(row=Window(RowNumber(), partition_by=[F('root_id')], order_by=F('path').asc()))
+            .filter(row__lte=preview)
+            .order_by('root_id', 'path')
+        )
+        for reply in ranked:
+            replies.setdefault(reply.root_id, []).append(reply)
+
+    for root in page:
+        root.preview_replies = replies.get(root.id, [])
+        root.more_replies_count = max(root.reply_count - len(root.preview_replies), 0)
+        root.more_replies_cursor = None
+        if root.more_replies_count:
+            # 没有预览回复时从头加载（空游标）
+            last = root.preview_replies[-1].path if root.preview_replies else None
+            root.more_replies_cursor = encode_cursor([last], 'next') if last else ''
+    return page
+
+
+def load_replies(root, cursor=None, limit=REPLIES_PER_LOAD):
+    """按 path 顺序继续加载某楼层的回复"""
+    queryset = _replies(Comment.objects.filter(root=root))
+    return CursorPaginator(queryset, ('path',), limit).page(cursor)
@@ -0,0 +1,196 @@
+"""写操作限流
+
+点赞、收藏、评论、发帖都要写数据库，SQLite 同一时刻只有一个写事务，
+一个脚本连续提交就能让全站的写请求排队。这里用令牌桶限制每个用户和每个
+IP 的请求速率：桶容量为速率中的次数（允许短时突发），令牌按速率匀速补充，
+没有令牌的请求直接返回 429 和 ``Retry-After``。
+
+``@throttle(scope)`` 装饰视图，放在 ``login_required`` 外层：先按 IP 检查
+（不查数据库），被拒绝的请求直接返回，不读会话；放行后登录用户再按会话里的
+用户 id 检查（不查用户表）。全部放行才一次 ``set_many`` 扣减，被拒绝的请求
+不写令牌桶。一次请求包含多项操作时（如批量点赞），视图解析出操作数后用
+``consume(request, scope, cost=n)`` 按操作数扣减；超过桶容量的请求在桶满时
+放行，令牌扣成负数，之后的请求等到补回为止。
+
+桶状态放在 Django 缓存中，多进程部署需使用共享缓存（文件缓存）；读改写不是
+原子的，并发时可能多放行几次，限流只需大致准确。各范围被拒绝的次数累计在
+缓存里，用 ``throttle_stats`` 命令查看（同样需要共享缓存，命令进程读不到
+web 进程的 locmem）。
+
+配置示例（settings.py）::
+
+    TIEBA_THROTTLE = {
+        'ENABLED': True,
+        'IP_HEADER': None,    # 反向代理传递客户端 IP 的头，如 'HTTP_X_FORWARDED_FOR'
+        'RATES': {            # 范围 -> {'user': 每用户速率, 'ip': 每 IP 速率}，格式为 次数/s|m|h|d
+            'like': {'user': '60/m', 'ip': '300/m'},
+            'comment': {'user': '10/m', 'ip': '60/m'},
+            'post': {'user': '5/m', 'ip': '30/m'},
+        },
+    }
+"""
+import functools
+import math
+import time
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.http import HttpResponse, JsonResponse
+
+from .cache import KEY_PREFIX, get_cache
+
+DEFAULTS = {
+    'ENABLED': True,
+    'IP_HEADER': None,
+    'RATES': {
+        'like': {'user': '60/m', 'ip': '300/m'},
+        'comment': {'user': '10/m', 'ip': '60/m'},
+        'post': {'user': '5/m', 'ip': '30/m'},
+    },
+}
+
+# 限流对象
+KINDS = ('user', 'ip')
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+MESSAGE = '操作太频繁，请稍后再试'
+
+
+def get_config():
+    """读取限流配置，未配置的项使用默认值；RATES 按范围合并"""
+    config = dict(DEFAULTS)
+    custom = getattr(settings, 'TIEBA_THROTTLE', {})
+    config.update(custom)
+    config['RATES'] = {**DEFAULTS['RATES'], **custom.get('RATES', {})}
+    return config
+
+
+@functools.lru_cache(maxsize=None)
+def parse_rate(rate):
+    """'60/m' -> (桶容量 60, 每秒补充 1 个令牌)；rate 为空时不限流，返回 None"""
+    if not rate:
+        return None
+    count, period = rate.split('/')
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period.strip()[0].lower()]
+
+
+def client_ip(request, header=None):
+    if header and request.META.get(header):
+        # X-Forwarded-For 可能是逗号分隔的代理链，第一个是客户端
+        return request.META[header].split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _bucket_key(scope, kind, ident):
+    return f'{KEY_PREFIX}:throttle:{scope}:{kind}:{ident}'
+
+
+def _stat_key(scope, kind):
+    return f'{KEY_PREFIX}:throttle:rejected:{scope}:{kind}'
+
+
+def _refill(state, capacity, rate, now):
+    """按经过的时间补充令牌，返回当前令牌数"""
+    if state is None:
+        return capacity
+    tokens, updated = state
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+def _session_user_id(request):
+    """只读会话里的用户 id，不加载用户对象"""
+    return request.session.get(SESSION_KEY) if hasattr(request, 'session') else None
+
+
+def check(scope, request, cost=1):
+    """检查并扣减 cost 个令牌，放行返回 0，否则返回需要等待的秒数"""
+    config = get_config()
+    rates = config['RATES'].get(scope, {})
+    cache = get_cache()
+    now = time.time()
+    buckets = {}
+    tokens = {}
+    # 先查 IP 桶：被拒绝的请求不读会话，不会为此查询 django_session 表
+    for kind in ('ip', 'user'):
+        parsed = parse_rate(rates.get(kind))
+        if not parsed:
+            continue
+        ident = client_ip(request, config['IP_HEADER']) if kind == 'ip' else _session_user_id(request)
+        if not ident:
+            continue
+        key = _bucket_key(scope, kind, ident)
+        capacity, rate = buckets[key] = parsed
+        tokens[key] = _refill(cache.get(key), capacity, rate, now)
+        # 超过桶容量的花费只要求桶是满的，否则永远不会放行
+        need = min(cost, capacity)
+        if tokens[key] < need:
+            _record(cache, scope, kind)
+            return (need - tokens[key]) / rate
+    if not buckets:
+        return 0
+
+    cache.set_many(
+        {key: (tokens[key] - cost, now) for key in buckets},
+        # 桶空闲到补满后就不必保留
+        timeout=math.ceil(max(
+            (capacity - tokens[key] + cost) / rate for key, (capacity, rate) in buckets.items()
+        )),
+    )
+    return 0
+
+
+def _record(cache, scope, kind):
+    key = _stat_key(scope, kind)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def throttled_response(request, wait):
+    """429 响应，AJAX 请求返回 JSON"""
+    retry_after = max(1, math.ceil(wait))
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        response = JsonResponse({'error': MESSAGE, 'retry_after': retry_after}, status=429)
+    else:
+        response = HttpResponse(f'{MESSAGE}（{retry_after} 秒后）', status=429,
+                                content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def consume(request, scope, cost=1):
+    """按范围扣减 cost 个令牌，被限流时返回 429 响应，否则返回 None"""
+    if cost <= 0 or not get_config()['ENABLED']:
+        return None
+    wait = check(scope, request, cost)
+    return throttled_response(request, wait) if wait else None
+
+
+def throttle(scope, methods=None):
+    """按范围限流的视图装饰器，methods 为空时限制所有请求方法；每个请求扣一个令牌"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if methods is None or request.method in methods:
+                response = consume(request, scope)
+                if response is not None:
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def stats():
+    """各范围被拒绝的次数，{范围: {'user': n, 'ip': n}}"""
+    scopes = sorted(get_config()['RATES'])
+    keys = {(scope, kind): _stat_key(scope, kind) for scope in scopes for kind in KINDS}
+    values = get_cache().get_many(list(keys.values()))
+    return {scope: {kind: values.get(keys[scope, kind], 0) for kind in KINDS} for scope in scopes}
+
+
+def reset_stats():
+    get_cache().delete_many([_stat_key(scope, kind) for scope in get_config()['RATES'] for kind in KINDS])
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'tieba'
 
@@ -9,27 +9,41 @@ urlpatterns = [
     
     # 分类相关
     path('category/<int:category_id>/', views.category_posts, name='category_posts'),
+    path('category/<int:category_id>/follow/', views.follow_category, name='follow_category'),
+    
+    # 关注动态
+    path('feed/', views.following_feed, name='feed'),
+    
+    # 标签相关
+    path('tag/<str:name>/', views.tag_posts, name='tag_posts'),
+    path('tags/suggest/', views.tag_suggest, name='tag_suggest'),
     
     # 帖子相关
     path('post/<int:post_id>/', views.post_detail, name='post_detail'),
     path('post/create/', views.create_post, name='create_post'),
+    path('post/draft/autosave/', views.autosave_draft, name='autosave_draft'),
+    path('post/<int:post_id>/publish/', views.publish_draft, name='publish_draft'),
     path('post/<int:post_id>/edit/', views.edit_post, name='edit_post'),
     path('post/<int:post_id>/delete/', views.delete_post, name='delete_post'),
+    path('post/<int:post_id>/events/', views.post_events, name='post_events'),
     
     # 评论相关
     path('post/<int:post_id>/comment/', views.create_comment, name='create_comment'),
     path('comment/<int:comment_id>/delete/', views.delete_comment, name='delete_comment'),
+    path('comment/<int:comment_id>/replies/', views.comment_replies, name='comment_replies'),
     
     # 点赞相关
     path('post/<int:post_id>/like/', views.like_post, name='like_post'),
     path('comment/<int:comment_id>/like/', views.like_comment, name='like_comment'),
+    path('interactions/batch/', views.batch_interactions, name='batch_interactions'),
     
     # 收藏相关
     path('post/<int:post_id>/favorite/', views.favorite_post, name='favorite_post'),
     
     # 用户相关
-    path('profile/<str:username>/', views.user_profile, name='user_profile'),
     path('profile/edit/', views.edit_profile, name='edit_profile'),
+    path('profile/<str:username>/', views.user_profile, name='user_profile'),
+    path('profile/<str:username>/follow/', views.follow_user, name='follow_user'),
     path('profile/', views.profile, name='profile'),
     
     # 搜索相关
@@ -37,4 +51,12 @@ urlpatterns = [
     
     # 用户注册
     path('register/', views.register, name='register'),
+    
+    # 只读 JSON API
+    path('api/posts/', api.post_list, name='api_posts'),
+    path('api/posts/<int:post_id>/', api.post_detail, name='api_post'),
+    path('api/posts/<int:post_id>/comments/', api.post_comments, name='api_post_comments'),
+    path('api/comments/<int:comment_id>/replies/', api.comment_replies, name='api_comment_replies'),
+    path('api/categories/', api.category_list, name='api_categories'),
+    path('api/users/<str:username>/', api.user_detail, name='api_user'),
 ]
\ No newline at end of file
@@ -1,100 +1,287 @@
+import asyncio
 import json
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections, transaction
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import UserCreationForm
 from django.http import JsonResponse
-from django.db.models import Count, Q, Sum
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from .models import Category, Post, Comment, UserProfile, Like, Favorite
-
-
-def index(request):
+from django.views.decorators.http import require_POST
+from django.db.models import Count, F, Q
+from .models import Category, CategoryFollow, Follow, Post, Comment, UserProfile, Like, Favorite
+from .counters import record_view, pending_views
+from .queries import (
+    post_cards, user_comments as get_user_comments, favorite_cards, sidebar_widgets,
+)
+from .search import search_paginator, snippet_annotation, highlight
+from .pagination import CursorPaginator
+from .ranking import refresh_scores_later
+from .throttle import consume, throttle
+from . import avatars, drafts, feed, interactions, live, tags, threads
+
+# 批量点赞接口单次最多处理的操作数
+BATCH_LIMIT = 100
+
+
+def _closing(func):
+    """在线程池线程中执行查询后关闭该线程的数据库连接，避免连接随线程常驻"""
+    def wrapper():
+        try:
+            return func()
+        finally:
+            connections.close_all()
+    return wrapper
+
+
+async def gather_queries(*funcs):
+    """并发执行互不依赖的同步查询函数
+
+    每个函数放到独立线程、使用独立的数据库连接执行（thread_sensitive=False），
+    所以多组查询真正并行，而不是在同一个线程里排队。设置
+    ``TIEBA_CONCURRENT_QUERIES = False`` 时改为在请求线程中依次执行，
+    便于按连接统计查询（check_query_plans、benchmark_views）。
+    """
+    if not getattr(settings, 'TIEBA_CONCURRENT_QUERIES', True):
+        return await sync_to_async(lambda: [func() for func in funcs])()
+    return await asyncio.gather(*(
+        sync_to_async(_closing(func), thread_sensitive=False)() for func in funcs
+    ))
+
+
+async def render_async(request, template_name, context):
+    """在同步线程中渲染模板（上下文处理器会访问 request.user 等惰性对象）"""
+    return await sync_to_async(render)(request, template_name, context)
+
+
+async def index(request):
     """首页 - 显示所有帖子和分类"""
-    # 获取所有分类，并统计每个分类的帖子数量
-    categories = Category.objects.annotate(post_count=Count('post', filter=Q(post__is_active=True)))
-    
     # 获取查询参数
     sort = request.GET.get('sort', 'latest')
     category_id = request.GET.get('category')
     
     # 基础查询
-    posts = Post.objects.filter(is_active=True)
+    posts = post_cards(Post.objects.filter(is_active=True, is_draft=False))
     
     # 按分类筛选
     if category_id:
         posts = posts.filter(category_id=category_id)
     
-    # 排序逻辑
+    # 排序逻辑（最后一个排序键必须唯一，游标分页才能不重不漏）
     if sort == 'hot':
-        posts = posts.order_by('-view_count', '-like_count', '-created_at')
+        # 热度分：互动量对数 + 发帖时间，见 ranking.hot_score
+        ordering = ('-hot_score', '-id')
     elif sort == 'recommend':
-        # 推荐算法：高浏览数 + 高点赞数 + 近期发布
-        posts = posts.order_by('-view_count', '-like_count', '-created_at')
+        # 推荐分：更看重互动质量，见 ranking.recommend_score
+        ordering = ('-recommend_score', '-id')
     else:  # latest
-        posts = posts.order_by('-created_at')
-    
-    # 分页处理
-    paginator = Paginator(posts, 12)  # 每页显示12个帖子
-    page = request.GET.get('page', 1)
-    
-    try:
-        posts_paginated = paginator.page(page)
-    except PageNotAnInteger:
-        posts_paginated = paginator.page(1)
-    except EmptyPage:
-        posts_paginated = paginator.page(paginator.num_pages)
-    
-    # 获取热门帖子（按浏览数排序，取前5个）
-    hot_posts = Post.objects.filter(is_active=True).order_by('-view_count')[:5]
+        ordering = ('-created_at', '-id')
     
-    # 网站统计数据
-    total_posts = Post.objects.filter(is_active=True).count()
-    total_users = User.objects.count()
+    # 游标分页，每页显示12个帖子；与侧栏（分类统计、热门帖子、网站统计，走缓存）并发查询
+    paginator = CursorPaginator(posts, ordering, 12)
+    posts_paginated, widgets = await gather_queries(
+        lambda: paginator.page(request.GET.get('cursor')),
+        sidebar_widgets,
+    )
     
     context = {
-        'categories': categories,
         'posts': posts_paginated,
-        'hot_posts': hot_posts,
-        'total_posts': total_posts,
-        'total_users': total_users,
+        **widgets,
     }
-    return render(request, 'tieba/index.html', context)
+    return await render_async(request, 'tieba/index.html', context)
 
 
 def category_posts(request, category_id):
     """显示特定分类下的帖子"""
     category = get_object_or_404(Category, id=category_id)
-    posts = Post.objects.filter(category=category, is_active=True).order_by('-created_at')
+    posts = post_cards(Post.objects.filter(category=category, is_active=True, is_draft=False))
+    paginator = CursorPaginator(posts, ('-created_at', '-id'), 12)
+    posts_paginated = paginator.page(request.GET.get('cursor'))
     categories = Category.objects.all()
     
     context = {
         'category': category,
-        'posts': posts,
+        'posts': posts_paginated,
         'categories': categories,
+        'is_following': (
+            request.user.is_authenticated
+            and CategoryFollow.objects.filter(user=request.user, category=category).exists()
+        ),
     }
     return render(request, 'tieba/category_posts.html', context)
 
 
-def post_detail(request, post_id):
+@login_required
+def following_feed(request):
+    """关注动态：关注的用户和分类的新帖，按发布时间倒序"""
+    context = {
+        'posts': feed.load_page(request.user, request.GET.get('cursor'), 12),
+        'popular_tags': tags.popular_tags(),
+    }
+    return render(request, 'tieba/feed.html', context)
+
+
+def _toggle_follow(request, source, target_id, next_url):
+    """关注/取消关注，AJAX 请求返回 JSON，否则回到来源页面"""
+    is_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
+    try:
+        following, follower_count = feed.toggle(request.user, source, target_id)
+    except feed.FeedError as exc:
+        if is_ajax:
+            return JsonResponse({'error': str(exc)}, status=400)
+        messages.error(request, str(exc))
+        return redirect(next_url)
+    if is_ajax:
+        return JsonResponse({'following': following, 'follower_count': follower_count})
+    return redirect(next_url)
+
+
+@login_required
+@require_POST
+def follow_user(request, username):
+    """关注用户"""
+    author = get_object_or_404(User.objects.only('id'), username=username)
+    return _toggle_follow(request, 'user', author.id, reverse('tieba:user_profile', args=[username]))
+
+
+@login_required
+@require_POST
+def follow_category(request, category_id):
+    """关注分类"""
+    return _toggle_follow(request, 'category', category_id, reverse('tieba:category_posts', args=[category_id]))
+
+
+def tag_posts(request, name):
+    """标签页：带该标签的帖子，按发布时间倒序"""
+    tag = tags.get_tag(name)
+    if tag is None:
+        raise Http404('标签不存在')
+    
+    # 先在关联表的部分索引上取出一页帖子 id，再按 id 取卡片
+    paginator = CursorPaginator(tags.tag_posts(tag), ('-created_at', '-post_id'), 12)
+    page = paginator.page(request.GET.get('cursor'))
+    cards = post_cards(Post.objects.filter(is_active=True, is_draft=False)).in_bulk([link.post_id for link in page])
+    page.object_list = [cards[link.post_id] for link in page if link.post_id in cards]
+    
+    context = {
+        'tag': tag,
+        'posts': page,
+        'popular_tags': tags.popular_tags(),
+    }
+    return render(request, 'tieba/tag_posts.html', context)
+
+
+def tag_suggest(request):
+    """标签联想（AJAX）"""
+    return JsonResponse({'tags': tags.suggest(request.GET.get('q', ''))})
+
+
+async def post_detail(request, post_id):
     """帖子详情页"""
-    post = get_object_or_404(Post, id=post_id, is_active=True)
+    # 先取实时事件的订阅起点，之后发布的事件页面都能收到（与已渲染的评论按 id 去重）
+    live_cursor = await sync_to_async(live.latest_event_id)()
     
-    # 增加浏览数
-    post.view_count += 1
-    post.save()
+    # 帖子和第一页楼层互不依赖，并发查询
+    post, comments = await gather_queries(
+        lambda: Post.objects.select_related('author', 'category').filter(id=post_id, is_active=True).first(),
+        lambda: threads.load_thread_page(post_id, request.GET.get('cursor')),
+    )
+    if post is None:
+        raise Http404('帖子不存在')
     
-    # 获取帖子的评论
-    comments = Comment.objects.filter(post=post, is_active=True).order_by('created_at')
+    if post.is_draft:
+        # 草稿只有作者本人可以预览，不计浏览数
+        if await sync_to_async(lambda: request.user.id)() != post.author_id:
+            raise Http404('帖子不存在')
+    else:
+        # 增加浏览数：先记入缓冲，定期批量写回，页面显示已持久化数 + 缓冲数
+        post.view_count += await sync_to_async(_record_view)(post.id)
     
     context = {
         'post': post,
         'comments': comments,
+        'live_cursor': live_cursor,
     }
-    return render(request, 'tieba/post_detail.html', context)
+    return await render_async(request, 'tieba/post_detail.html', context)
+
+
+async def post_events(request, post_id):
+    """帖子实时更新（Server-Sent Events）
+    
+    ASGI 下保持长连接，有新事件立即推送；WSGI 部署或长连接数已满时发送
+    积压的事件后结束响应，浏览器按 retry 间隔重连，即退化为轮询。
+    带 ``format=json`` 时返回 JSON，供不支持 EventSource 的浏览器轮询。
+    """
+    if not await Post.objects.filter(id=post_id, is_active=True, is_draft=False).aexists():
+        raise Http404('帖子不存在')
+    
+    hub = live.get_hub()
+    config = live.get_config()
+    last_id = request.headers.get('Last-Event-ID') or request.GET.get('after', '')
+    last_id = int(last_id) if last_id.isdigit() else await sync_to_async(hub.latest_id)()
+    
+    if request.GET.get('format') == 'json':
+        events = await hub.wait(post_id, last_id, 0)
+        return JsonResponse({
+            'events': events,
+            'last_id': events[-1]['id'] if events else last_id,
+            'retry': config['POLL_INTERVAL'],
+        })
+    
+    if not (isinstance(request, ASGIRequest) and hub.open_stream()):
+        events = await hub.wait(post_id, last_id, 0)
+        body = f"retry: {config['POLL_INTERVAL'] * 1000}\n\n" + ''.join(map(live.encode_event, events))
+        response = HttpResponse(body, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        return response
+    
+    async def stream():
+        # Django 4.2 在客户端断开时不会取消响应，靠 STREAM_TIMEOUT 回收连接
+        try:
+            yield 'retry: 3000\n\n'
+            cursor = last_id
+            deadline = time.monotonic() + config['STREAM_TIMEOUT']
+            while (remaining := deadline - time.monotonic()) > 0:
+                events = await hub.wait(post_id, cursor, min(config['KEEPALIVE'], remaining))
+                if not events:
+                    yield ': keepalive\n\n'
+                    continue
+                for event in events:
+                    yield live.encode_event(event)
+                cursor = events[-1]['id']
+        finally:
+            hub.close_stream()
+    
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # 告诉 Nginx 等反向代理不要缓冲事件流
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _record_view(post_id):
+    """记录一次浏览（可能触发写回），返回尚未写回的浏览数"""
+    buffered = pending_views(post_id) + 1
+    record_view(post_id)
+    return buffered
+
+
+def _parse_tags(tags_json):
+    """解析发帖表单中的标签 JSON，整理成统一的小写标签列表"""
+    try:
+        return tags.normalize(json.loads(tags_json or '[]'))
+    except (json.JSONDecodeError, TypeError):
+        return []
 
 
+@throttle('post', methods=('POST',))
 @login_required
 def create_post(request):
     """创建新帖子"""
@@ -102,27 +289,31 @@ def create_post(request):
         title = request.POST.get('title')
         content = request.POST.get('content')
         category_id = request.POST.get('category')
-        tags_json = request.POST.get('tags', '[]')
         is_draft = request.POST.get('is_draft') == 'true'
+        draft_id = request.POST.get('draft_id')
+        
+        if title and content and category_id and draft_id:
+            # 自动保存已经建好了草稿，在草稿上保存或发布，不再新建帖子
+            try:
+                drafts.save(request.user, int(draft_id), drafts.clean(request.POST), flush=True)
+                post = None if is_draft else drafts.publish(request.user, int(draft_id))
+            except (ValueError, drafts.DraftError) as exc:
+                messages.error(request, str(exc) if isinstance(exc, drafts.DraftError) else '草稿不存在')
+                return redirect('tieba:create_post')
+            if post is None:
+                return redirect('tieba:user_profile', username=request.user.username)
+            return redirect('tieba:post_detail', post_id=post.id)
         
         if title and content and category_id:
             category = get_object_or_404(Category, id=category_id)
             
-            # 解析标签JSON
-            try:
-                tags = json.loads(tags_json)
-                if not isinstance(tags, list):
-                    tags = []
-            except (json.JSONDecodeError, TypeError):
-                tags = []
-            
-            # 创建帖子
+            # 创建帖子（保存后由信号写入标签索引）
             post = Post.objects.create(
                 title=title,
                 content=content,
                 author=request.user,
                 category=category,
-                tags=tags,
+                tags=_parse_tags(request.POST.get('tags')),
                 is_draft=is_draft
             )
             
@@ -138,9 +329,52 @@ def create_post(request):
     return render(request, 'tieba/create_post.html', context)
 
 
+@login_required
+@require_POST
+def autosave_draft(request):
+    """草稿自动保存（AJAX），只提交改动过的字段
+
+    没有 draft_id 时新建草稿；带 flush 时立即写入数据库（离开页面时），
+    否则按间隔合并写入，见 drafts.py。
+    """
+    try:
+        changes = drafts.clean(request.POST)
+        draft_id = request.POST.get('draft_id')
+        if not draft_id:
+            post = drafts.create(request.user, changes)
+            return JsonResponse({'draft_id': post.id, 'saved': True, 'pending': False})
+        if not draft_id.isdigit():
+            raise drafts.DraftError('草稿不存在')
+        saved, pending = drafts.save(request.user, int(draft_id), changes, flush=bool(request.POST.get('flush')))
+    except drafts.DraftError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({'draft_id': int(draft_id), 'saved': saved, 'pending': pending})
+
+
+@login_required
+@require_POST
+def publish_draft(request, post_id):
+    """发布草稿"""
+    is_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
+    try:
+        post = drafts.publish(request.user, post_id)
+    except drafts.DraftError as exc:
+        if is_ajax:
+            return JsonResponse({'error': str(exc)}, status=400)
+        messages.error(request, str(exc))
+        return redirect('tieba:post_detail', post_id=post_id)
+    if post is None:
+        raise Http404('草稿不存在')
+    if is_ajax:
+        return JsonResponse({'post_id': post.id, 'url': reverse('tieba:post_detail', args=[post.id])})
+    return redirect('tieba:post_detail', post_id=post.id)
+
+
 @login_required
 def edit_post(request, post_id):
     """编辑帖子"""
+    # 先写回自动保存缓冲中的改动，表单显示最新内容
+    drafts.flush(post_id)
     post = get_object_or_404(Post, id=post_id, author=request.user)
     
     if request.method == 'POST':
@@ -153,6 +387,8 @@ def edit_post(request, post_id):
             post.title = title
             post.content = content
             post.category = category
+            if 'tags' in request.POST:
+                post.tags = _parse_tags(request.POST['tags'])
             post.save()
             return redirect('tieba:post_detail', post_id=post.id)
     
@@ -175,129 +411,182 @@ def delete_post(request, post_id):
     return render(request, 'tieba/delete_post.html', context)
 
 
+@throttle('comment', methods=('POST',))
 @login_required
 def create_comment(request, post_id):
     """创建评论"""
-    post = get_object_or_404(Post, id=post_id, is_active=True)
+    post = get_object_or_404(Post, id=post_id, is_active=True, is_draft=False)
     
     if request.method == 'POST':
         content = request.POST.get('content')
         parent_id = request.POST.get('parent_id')
         
+        is_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
         if content:
-            comment = Comment.objects.create(
-                post=post,
-                author=request.user,
-                content=content
-            )
-            
             # 处理回复评论
+            parent_comment = None
             if parent_id:
-                parent_comment = get_object_or_404(Comment, id=parent_id)
-                comment.parent = parent_comment
-                comment.save()
+                parent_comment = get_object_or_404(Comment, id=parent_id, post=post, is_active=True)
             
+            # 评论和评论数在同一事务内写入，提交后推送的计数才是最新的
+            with transaction.atomic():
+                comment = threads.create_comment(post, request.user, content, parent=parent_comment)
+                Post.objects.filter(id=post.id).update(comment_count=F('comment_count') + 1)
+            refresh_scores_later([post.id])
+            
+            if is_ajax:
+                # 页面直接插入新评论，不再整页刷新
+                return JsonResponse({
+                    'comment': live.comment_payload(comment),
+                    'comment_count': post.comment_count + 1,
+                })
             return redirect('tieba:post_detail', post_id=post.id)
+        
+        if is_ajax:
+            return JsonResponse({'error': '评论内容不能为空'}, status=400)
     
     return redirect('tieba:post_detail', post_id=post.id)
 
 
+def comment_replies(request, comment_id):
+    """加载某楼层的更多回复（AJAX）"""
+    root = get_object_or_404(Comment.objects.only('id'), id=comment_id, depth=0, is_active=True)
+    page = threads.load_replies(root, request.GET.get('cursor'))
+    
+    return JsonResponse({
+        'replies': [live.comment_payload(reply) for reply in page],
+        'next_cursor': page.next_cursor,
+    })
+
+
 @login_required
 def delete_comment(request, comment_id):
     """删除评论"""
     comment = get_object_or_404(Comment, id=comment_id, author=request.user)
     post_id = comment.post.id
     
-    if request.method == 'POST':
-        comment.is_active = False
-        comment.save()
+    if request.method == 'POST' and comment.is_active:
+        with transaction.atomic():
+            comment.is_active = False
+            comment.save()
+            threads.comment_removed(comment)
+            Post.objects.filter(id=post_id, comment_count__gt=0).update(comment_count=F('comment_count') - 1)
+        refresh_scores_later([post_id])
     
     return redirect('tieba:post_detail', post_id=post_id)
 
 
+@throttle('like')
 @login_required
 def like_post(request, post_id):
     """点赞帖子"""
-    post = get_object_or_404(Post, id=post_id, is_active=True)
-    
-    # 检查是否已经点赞
-    like, created = Like.objects.get_or_create(
-        user=request.user,
-        post=post
-    )
-    
-    if not created:
-        # 如果已经点赞，则取消点赞
-        like.delete()
-        post.like_count -= 1
-        liked = False
-    else:
-        # 新点赞
-        post.like_count += 1
-        liked = True
+    get_object_or_404(Post.objects.only('id'), id=post_id, is_active=True, is_draft=False)
     
-    post.save()
+    # 已点赞则取消，否则点赞；计数在同一事务内原子更新
+    liked, like_count = interactions.toggle(request.user, 'post', post_id)
     
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
         return JsonResponse({
             'liked': liked,
-            'like_count': post.like_count
+            'like_count': like_count
         })
     
-    return redirect('tieba:post_detail', post_id=post.id)
+    return redirect('tieba:post_detail', post_id=post_id)
 
 
+@throttle('like')
 @login_required
 def like_comment(request, comment_id):
     """点赞评论"""
-    comment = get_object_or_404(Comment, id=comment_id, is_active=True)
-    
-    # 检查是否已经点赞
-    like, created = Like.objects.get_or_create(
-        user=request.user,
-        comment=comment
-    )
-    
-    if not created:
-        # 如果已经点赞，则取消点赞
-        like.delete()
-        comment.like_count -= 1
-        liked = False
-    else:
-        # 新点赞
-        comment.like_count += 1
-        liked = True
+    comment = get_object_or_404(Comment.objects.only('id', 'post_id'), id=comment_id, is_active=True)
     
-    comment.save()
+    # 已点赞则取消，否则点赞；计数在同一事务内原子更新
+    liked, like_count = interactions.toggle(request.user, 'comment', comment_id)
     
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
         return JsonResponse({
             'liked': liked,
-            'like_count': comment.like_count
+            'like_count': like_count
         })
     
-    return redirect('tieba:post_detail', post_id=comment.post.id)
+    return redirect('tieba:post_detail', post_id=comment.post_id)
 
 
-def user_profile(request, username):
+@login_required
+@require_POST
+def batch_interactions(request):
+    """批量点赞/取消点赞/收藏，一次请求提交多项操作
+    
+    请求体为 JSON：{"operations": [{"type": "post", "id": 1, "action": "like"}, ...]}，
+    type 可选 post/comment/favorite，action 可选 like/unlike/toggle。
+    与单项点赞共用 like 限流，按操作数扣令牌。
+    """
+    try:
+        payload = json.loads(request.body)
+        operations = payload['operations']
+        if not isinstance(operations, list):
+            raise TypeError
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return JsonResponse({'error': '请求格式错误'}, status=400)
+    
+    if len(operations) > BATCH_LIMIT:
+        return JsonResponse({'error': f'单次最多提交 {BATCH_LIMIT} 项操作'}, status=400)
+    
+    # 解析出操作数后一次扣减，被拒绝的批量不扣令牌
+    response = consume(request, 'like', cost=max(1, len(operations)))
+    if response is not None:
+        return response
+    
+    results = interactions.apply_batch(request.user, operations)
+    return JsonResponse({'results': results})
+
+
+async def user_profile(request, username):
     """用户资料页"""
-    user = get_object_or_404(User, username=username)
-    user_profile, created = UserProfile.objects.get_or_create(user=user)
+    user = await User.objects.select_related('userprofile').filter(username=username).afirst()
+    if user is None:
+        raise Http404('用户不存在')
+    try:
+        user_profile = user.userprofile
+    except UserProfile.DoesNotExist:
+        user_profile = await UserProfile.objects.acreate(user=user)
+    
+    # 用户的帖子和评论互不依赖，并发查询
+    user_posts, user_comments = await gather_queries(
+        lambda: list(post_cards(Post.objects.filter(author=user, is_active=True, is_draft=False)).order_by('-created_at')),
+        lambda: list(get_user_comments(user)),
+    )
     
-    # 获取用户的帖子和评论
-    user_posts = Post.objects.filter(author=user, is_active=True).order_by('-created_at')
-    user_comments = Comment.objects.filter(author=user, is_active=True).order_by('-created_at')
+    viewer_id = await sync_to_async(lambda: request.user.id)()
+    is_following = bool(viewer_id) and await Follow.objects.filter(follower_id=viewer_id, author=user).aexists()
     
     context = {
         'profile_user': user,
         'user_profile': user_profile,
         'user_posts': user_posts,
         'user_comments': user_comments,
+        'is_following': is_following,
     }
-    return render(request, 'tieba/user_profile.html', context)
+    return await render_async(request, 'tieba/user_profile.html', context)
+
+
+def _upload_avatar(request, user_profile):
+    """校验上传的头像并交给后台生成缩略图"""
+    # 超过大小上限的文件在上传时已被丢弃，只留下错误信息
+    error = getattr(request, 'avatar_error', None)
+    if error is None and 'avatar' in request.FILES:
+        try:
+            avatars.submit(user_profile, request.FILES['avatar'])
+        except avatars.AvatarError as exc:
+            error = str(exc)
+        else:
+            messages.info(request, '头像正在处理，稍后刷新页面即可看到新头像')
+    if error:
+        messages.error(request, error)
 
 
 @login_required
+@avatars.avatar_upload
 def edit_profile(request):
     """编辑用户资料"""
     user_profile, created = UserProfile.objects.get_or_create(user=request.user)
@@ -309,11 +598,9 @@ def edit_profile(request):
         user_profile.bio = bio
         user_profile.location = location
         
-        # 处理头像上传
-        if 'avatar' in request.FILES:
-            user_profile.avatar = request.FILES['avatar']
-        
-        user_profile.save()
+        # 只保存表单字段，不覆盖后台任务写入的头像
+        user_profile.save(update_fields=['bio', 'location'])
+        _upload_avatar(request, user_profile)
         return redirect('tieba:user_profile', username=request.user.username)
     
     context = {'user_profile': user_profile}
@@ -321,6 +608,7 @@ def edit_profile(request):
 
 
 @login_required
+@avatars.avatar_upload
 def profile(request):
     """个人中心页面"""
     user_profile, created = UserProfile.objects.get_or_create(user=request.user)
@@ -333,33 +621,24 @@ def profile(request):
         user_profile.bio = bio
         user_profile.location = location
         
-        # 处理头像上传
-        if 'avatar' in request.FILES:
-            user_profile.avatar = request.FILES['avatar']
-        
-        user_profile.save()
+        # 只保存表单字段，不覆盖后台任务写入的头像
+        user_profile.save(update_fields=['bio', 'location'])
+        _upload_avatar(request, user_profile)
         
         # 重定向到个人中心页面，避免重复提交
         return redirect('tieba:profile')
     
     # 获取用户的帖子
-    user_posts = Post.objects.filter(author=request.user, is_active=True).order_by('-created_at')
+    user_posts = post_cards(Post.objects.filter(author=request.user, is_active=True)).order_by('-created_at')
     
     # 获取用户的评论
-    user_comments = Comment.objects.filter(author=request.user, is_active=True).order_by('-created_at')
+    user_comments = get_user_comments(request.user)
     
     # 获取用户的收藏
-    favorite_posts = Favorite.objects.filter(user=request.user).select_related('post').order_by('-created_at')
+    favorite_posts = favorite_cards(request.user)
     
-    # 计算用户的总获赞数（帖子点赞数 + 评论点赞数）
-    user_post_likes = Post.objects.filter(author=request.user, is_active=True).aggregate(total=Sum('like_count'))['total'] or 0
-    user_comment_likes = Comment.objects.filter(author=request.user, is_active=True).aggregate(total=Sum('like_count'))['total'] or 0
-    total_likes = user_post_likes + user_comment_likes
-    
-    # 更新用户资料中的帖子数和评论数
-    user_profile.post_count = user_posts.count()
-    user_profile.comment_count = user_comments.count()
-    user_profile.save()
+    # 发帖数、评论数、获赞数由信号增量维护，这里直接读取
+    total_likes = user_profile.likes_received
     
     context = {
         'user_profile': user_profile,
@@ -372,77 +651,55 @@ def profile(request):
     return render(request, 'tieba/profile.html', context)
 
 
-def search_posts(request):
+async def search_posts(request):
     """搜索帖子"""
     query = request.GET.get('q', '').strip()
     
-    if query:
-        # 搜索标题和内容中包含关键词的帖子
-        posts = Post.objects.filter(
-            Q(title__icontains=query) | Q(content__icontains=query),
-            is_active=True
-        ).order_by('-created_at')
-    else:
-        posts = Post.objects.filter(is_active=True).order_by('-created_at')
-    
-    # 获取所有分类
-    categories = Category.objects.annotate(post_count=Count('post', filter=Q(post__is_active=True)))
+    def search_page():
+        if query:
+            # 全文索引按相关度分页，只为当前页的帖子查询详情
+            posts = post_cards(Post.objects.filter(is_active=True, is_draft=False), excerpt=snippet_annotation(query))
+            paginator = search_paginator(query, posts, 12)
+        else:
+            posts = post_cards(Post.objects.filter(is_active=True, is_draft=False))
+            paginator = CursorPaginator(posts, ('-created_at', '-id'), 12)
+        return paginator.page(request.GET.get('cursor'))
     
-    # 获取热门帖子（按浏览数排序，取前5个）
-    hot_posts = Post.objects.filter(is_active=True).order_by('-view_count')[:5]
+    # 搜索结果与侧栏（分类统计、热门帖子，走缓存）并发查询
+    posts_paginated, widgets = await gather_queries(search_page, sidebar_widgets)
     
-    # 分页处理
-    paginator = Paginator(posts, 12)
-    page = request.GET.get('page', 1)
-    
-    try:
-        posts_paginated = paginator.page(page)
-    except PageNotAnInteger:
-        posts_paginated = paginator.page(1)
-    except EmptyPage:
-        posts_paginated = paginator.page(paginator.num_pages)
+    # 高亮标题和摘要中的关键词
+    for post in posts_paginated.object_list:
+        post.highlighted_title = highlight(post.title, query)
+        post.highlighted_excerpt = highlight(post.excerpt, query)
     
     context = {
         'posts': posts_paginated,
-        'categories': categories,
-        'hot_posts': hot_posts,
+        **widgets,
         'query': query,
-        'total_results': posts.count() if query else 0,
+        'total_results': posts_paginated.total if query else 0,
+        'total_exact': posts_paginated.total_exact,
     }
     
-    return render(request, 'tieba/search_results.html', context)
+    return await render_async(request, 'tieba/search_results.html', context)
 
 
+@throttle('like')
 @login_required
 def favorite_post(request, post_id):
     """收藏帖子"""
-    post = get_object_or_404(Post, id=post_id, is_active=True)
+    get_object_or_404(Post.objects.only('id'), id=post_id, is_active=True, is_draft=False)
     
-    # 检查是否已经收藏
-    favorite, created = Favorite.objects.get_or_create(
-        user=request.user,
-        post=post
-    )
-    
-    if not created:
-        # 如果已经收藏，则取消收藏
-        favorite.delete()
-        post.favorite_count -= 1
-        favorited = False
-    else:
-        # 新收藏
-        post.favorite_count += 1
-        favorited = True
-    
-    post.save()
+    # 已收藏则取消，否则收藏；计数在同一事务内原子更新
+    favorited, favorite_count = interactions.toggle(request.user, 'favorite', post_id)
     
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
         return JsonResponse({
             'favorited': favorited,
-            'favorite_count': post.favorite_count
+            'favorite_count': favorite_count
         })
     
-    return redirect('tieba:post_detail', post_id=post.id)
+    return redirect('tieba:post_detail', post_id=post_id)
 
 
 def register(request):
@@ -453,8 +710,6 @@ def register(request):
             user = form.save()
             # 自动登录用户
             login(request, user)
-            # 创建用户资料
-            UserProfile.objects.create(user=user)
             return redirect('tieba:index')
     else:
         form = UserCreationForm()
@@ -0,0 +1,14 @@
+"""run_jobs 命令的子进程入口
+
+子进程以 spawn 方式启动，导入本模块时 Django 尚未加载，因此这里不能在
+模块级导入模型或 jobs.py。
+"""
+import signal
+
+import django
+
+
+def init_process():
+    # Ctrl+C 只由主进程处理，子进程把手上的任务执行完
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    django.setup()
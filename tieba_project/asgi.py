@@ -0,0 +1,29 @@
+"""
+ASGI config for tieba_project project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+首页、帖子详情、搜索、用户资料页是异步视图，在 ASGI 服务器下不会占用
+工作线程等待数据库；其余同步视图由 Django 自动放到线程中执行。
+
+默认配置下只能运行一个工作进程::
+
+    uvicorn tieba_project.asgi:application
+
+实时推送的频道（tieba/live.py 的 memory 后端）、默认的 locmem 缓存（缓存版本号、
+限流令牌桶、草稿缓冲）和浏览数缓冲都在进程内，多个进程之间互不可见：
+读者收不到别的进程发布的事件，缓存失效也传不到别的进程。需要多个工作进程时，
+先设置 ``TIEBA_CACHE_BACKEND=file`` 改用共享的文件缓存（浏览数缓冲随之改用
+database 后端），并把 ``TIEBA_LIVE['BACKEND']`` 设为 ``'cache'``，再加 ``--workers N``。
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tieba_project.settings')
+
+application = get_asgi_application()
@@ -41,6 +41,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # 带哈希、预压缩的静态文件，见 tieba/staticfiles.py
+    'tieba.staticfiles.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -55,6 +57,8 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
+        # 未指定 loaders 时 Django 4.1+ 默认用 cached.Loader 包装，模板只解析一次
+        # （DEBUG 下模板文件修改后由自动重载清空），不要在这里改成不带缓存的加载器
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -68,17 +72,27 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'tieba_project.wsgi.application'
+ASGI_APPLICATION = 'tieba_project.asgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# 使用调优过的 SQLite 后端（WAL、BEGIN IMMEDIATE、锁冲突重试），见 tieba/db_backend/base.py
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'tieba.db_backend',
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
 
+TIEBA_SQLITE = {
+    'JOURNAL_MODE': 'WAL',
+    'SYNCHRONOUS': 'NORMAL',
+    'CACHE_SIZE': -64000,
+    'MMAP_SIZE': 256 * 1024 * 1024,
+    'BUSY_TIMEOUT': 5000,
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -119,10 +133,112 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# collectstatic 时给文件名加内容哈希并生成 .gz/.br，见 tieba/staticfiles.py
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'tieba.staticfiles.CompressedManifestStorage'},
+}
+
+# 帖子卡片、正文的片段缓存，见 tieba/fragments.py
+TIEBA_FRAGMENTS = {
+    'ENABLED': True,
+    'ALIAS': 'fragments',
+    'TIMEOUT': 24 * 3600,
+    'VERSION': 1,
+}
+
+TIEBA_STATIC = {
+    'MAX_AGE': 300,
+    'MEMORY_LIMIT': 512 * 1024,
+}
+
+# 后台任务队列，见 tieba/jobs.py。开发环境在请求结束时直接执行任务；
+# 生产环境需另外运行 python manage.py run_jobs
+# EAGER 只在显式设置 TIEBA_JOBS_EAGER=1 时开启（无 worker 的本地调试用），
+# 不随 DEBUG 打开：开发环境同样需要 run_jobs 才能体现延迟任务的合并效果
+TIEBA_JOBS = {
+    'EAGER': os.environ.get('TIEBA_JOBS_EAGER') == '1',
+    'BATCH_SIZE': 20,
+    'LEASE': 600,
+}
+
+# 草稿自动保存：每篇草稿最多每 INTERVAL 秒写一次数据库，见 tieba/drafts.py
+TIEBA_DRAFTS = {
+    'INTERVAL': 10,
+    'BUFFER_TIMEOUT': 24 * 3600,
+}
+
+# 关注动态：粉丝数达到 FANOUT_LIMIT 的作者/分类不写扩散，读时合并，见 tieba/feed.py
+TIEBA_FEED = {
+    'FANOUT_LIMIT': 1000,
+    'MAX_ENTRIES': 500,
+}
+
+# 写操作限流（令牌桶，每用户和每 IP），超出时返回 429，见 tieba/throttle.py
+TIEBA_THROTTLE = {
+    'RATES': {
+        'like': {'user': '60/m', 'ip': '300/m'},
+        'comment': {'user': '10/m', 'ip': '60/m'},
+        'post': {'user': '5/m', 'ip': '30/m'},
+    },
+}
+
+# 软删除内容归档：删除超过 RETENTION_DAYS 天的帖子、评论由 archive_deleted 命令
+# 移入归档表，见 tieba/archive.py
+TIEBA_ARCHIVE = {
+    'RETENTION_DAYS': 30,
+    'BATCH_SIZE': 200,
+}
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Cache
+# 通过环境变量 TIEBA_CACHE_BACKEND 选择缓存后端：
+#   locmem - 进程内缓存（默认，单进程部署）
+#   file   - 文件缓存，同一台机器上的多个工作进程共享
+TIEBA_CACHE_BACKEND = os.environ.get('TIEBA_CACHE_BACKEND', 'locmem')
+
+if TIEBA_CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(BASE_DIR, 'cache'),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+        # 帖子片段数量多、保留时间长，单独存放，不挤占通用缓存，见 tieba/fragments.py
+        'fragments': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(BASE_DIR, 'cache', 'fragments'),
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        },
+    }
+    # 多个工作进程共享浏览数缓冲（记在数据库的小表里，增量原子累加），
+    # flush_view_counts 命令可以写回，见 tieba/counters.py
+    TIEBA_VIEW_COUNTER = {
+        'BACKEND': 'database',
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'tieba',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+        'fragments': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'tieba-fragments',
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        },
+    }
+
+# 侧栏等统计数据的缓存时间，见 tieba/cache.py
+TIEBA_CACHE = {
+    'TIMEOUT': 300,
+    'STALE_GRACE': 60,
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 